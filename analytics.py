@@ -0,0 +1,204 @@
+"""
+Time-series rollups of tutor usage for trend reports.
+
+Every interaction increments counters in hourly, daily and weekly buckets
+for four dimensions: the whole school ("all"), the user, the class and the
+detected subject, split by query type (text/voice), along with the model
+tokens those questions used. Rollups live in their own SQLite file, so a
+year of weekly numbers for one class is a handful of indexed rows rather
+than a scan of the interaction log.
+
+    rollups.series("week", "class", "10", start="2025-W23")
+    rollups.breakdown("day", "subject", start="2025-10-01", end="2025-10-31")
+    rollups.tokens("day", "class", start="2025-10-01", end="2025-10-31")
+"""
+import sqlite3
+import datetime
+import threading
+from collections import defaultdict
+
+ANALYTICS_DB = "analytics.db"
+GRANULARITIES = ("hour", "day", "week")
+DIMENSIONS = ("all", "user", "class", "subject")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    dim         TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    bucket      TEXT NOT NULL,
+    type        TEXT NOT NULL,
+    count       INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, dim, key, bucket, type)
+) WITHOUT ROWID;
+"""
+TOKEN_COLUMNS = ("prompt_tokens", "completion_tokens")
+
+
+def bucket_for(granularity, when):
+    if granularity == "hour":
+        return when.strftime("%Y-%m-%dT%H")
+    if granularity == "day":
+        return when.strftime("%Y-%m-%d")
+    year, week, _ = when.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def bucket_range(granularity, start, end):
+    """Every bucket label from start to end inclusive (datetimes), for zero-filling charts."""
+    step = {"hour": datetime.timedelta(hours=1), "day": datetime.timedelta(days=1),
+            "week": datetime.timedelta(weeks=1)}[granularity]
+    out, cur = [], start
+    while cur <= end:
+        label = bucket_for(granularity, cur)
+        if not out or out[-1] != label:
+            out.append(label)
+        cur += step
+    last = bucket_for(granularity, end)
+    if out and out[-1] != last:
+        out.append(last)
+    return out
+
+
+def _parse_timestamp(entry):
+    try:
+        return datetime.datetime.fromisoformat(entry.get("timestamp", ""))
+    except ValueError:
+        return datetime.datetime.fromisoformat(entry.get("date", "1970-01-01"))
+
+
+class UsageRollups:
+    def __init__(self, path=ANALYTICS_DB):
+        self.path = str(path)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            # Files from before token accounting: questions logged then count 0 tokens
+            have = {row[1] for row in conn.execute("PRAGMA table_info(rollups)")}
+            for column in TOKEN_COLUMNS:
+                if column not in have:
+                    conn.execute(f"ALTER TABLE rollups ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def is_empty(self):
+        return self._conn().execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is None
+
+    # ── Writing ──────────────────────────────────────────────
+    @staticmethod
+    def _rows(entry, count=1):
+        when = _parse_timestamp(entry)
+        keys = {
+            "all": "*",
+            "user": entry.get("user", ""),
+            "class": str(entry.get("class", "") or ""),
+            "subject": entry.get("detected_subject") or "General",
+        }
+        qtype = entry.get("type", "") or "text"
+        prompt = int(entry.get("prompt_tokens") or 0)
+        completion = int(entry.get("completion_tokens") or 0)
+        for g in GRANULARITIES:
+            bucket = bucket_for(g, when)
+            for dim, key in keys.items():
+                yield (g, dim, key, bucket, qtype, count, prompt, completion)
+
+    def _upsert(self, conn, rows):
+        conn.executemany(
+            "INSERT INTO rollups (granularity, dim, key, bucket, type, count, prompt_tokens, completion_tokens) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (granularity, dim, key, bucket, type) DO UPDATE SET count = count + excluded.count, "
+            "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+            "completion_tokens = completion_tokens + excluded.completion_tokens",
+            rows)
+
+    def record(self, entry):
+        with self._conn() as conn:
+            self._upsert(conn, list(self._rows(entry)))
+
+    def rebuild(self, entries, users=None):
+        """Recompute every rollup from an iterable of log entries (one transaction)."""
+        users = users or {}
+        totals = defaultdict(lambda: [0, 0, 0])
+        for entry in entries:
+            if not entry.get("class") and entry.get("user") in users:
+                entry = dict(entry, **{"class": users[entry["user"]].get("class", "")})
+            for row in self._rows(entry):
+                total = totals[row[:5]]
+                total[0] += 1
+                total[1] += row[6]
+                total[2] += row[7]
+        with self._conn() as conn:
+            conn.execute("DELETE FROM rollups")
+            self._upsert(conn, (key + tuple(n) for key, n in totals.items()))
+
+    # ── Queries ──────────────────────────────────────────────
+    def series(self, granularity="day", dim="all", key="*", start=None, end=None, qtype=None):
+        """[(bucket, count)] in bucket order; start/end are bucket labels (inclusive)."""
+        sql = ["SELECT bucket, SUM(count) FROM rollups WHERE granularity = ? AND dim = ? AND key = ?"]
+        args = [granularity, dim, key]
+        if start:
+            sql.append("AND bucket >= ?")
+            args.append(start)
+        if end:
+            sql.append("AND bucket <= ?")
+            args.append(end)
+        if qtype:
+            sql.append("AND type = ?")
+            args.append(qtype)
+        sql.append("GROUP BY bucket ORDER BY bucket")
+        return self._conn().execute(" ".join(sql), args).fetchall()
+
+    def breakdown(self, granularity="day", dim="class", start=None, end=None, limit=20):
+        """{key: count} totals for one dimension over a bucket range, largest first."""
+        sql = ["SELECT key, SUM(count) AS n FROM rollups WHERE granularity = ? AND dim = ?"]
+        args = [granularity, dim]
+        if start:
+            sql.append("AND bucket >= ?")
+            args.append(start)
+        if end:
+            sql.append("AND bucket <= ?")
+            args.append(end)
+        sql.append("GROUP BY key ORDER BY n DESC LIMIT ?")
+        args.append(limit)
+        return dict(self._conn().execute(" ".join(sql), args).fetchall())
+
+    def by_type(self, granularity="day", dim="all", key="*", start=None, end=None):
+        """{bucket: {type: count}} for stacked text/voice charts."""
+        sql = ["SELECT bucket, type, SUM(count) FROM rollups WHERE granularity = ? AND dim = ? AND key = ?"]
+        args = [granularity, dim, key]
+        if start:
+            sql.append("AND bucket >= ?")
+            args.append(start)
+        if end:
+            sql.append("AND bucket <= ?")
+            args.append(end)
+        sql.append("GROUP BY bucket, type ORDER BY bucket")
+        out = {}
+        for bucket, qtype, n in self._conn().execute(" ".join(sql), args):
+            out.setdefault(bucket, {})[qtype] = n
+        return out
+
+    def tokens(self, granularity="day", dim="class", start=None, end=None, limit=20):
+        """{key: (questions, prompt_tokens, completion_tokens)} over a bucket range, most tokens first."""
+        sql = ["SELECT key, SUM(count), SUM(prompt_tokens), SUM(completion_tokens) FROM rollups "
+               "WHERE granularity = ? AND dim = ?"]
+        args = [granularity, dim]
+        if start:
+            sql.append("AND bucket >= ?")
+            args.append(start)
+        if end:
+            sql.append("AND bucket <= ?")
+            args.append(end)
+        sql.append("GROUP BY key ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC LIMIT ?")
+        args.append(limit)
+        return {key: (n, prompt, completion)
+                for key, n, prompt, completion in self._conn().execute(" ".join(sql), args)}
@@ -0,0 +1,176 @@
+"""
+Process-wide cache of tutor answers for repeated student questions.
+
+Entries are keyed by (school, class, prompt version, normalized question).
+A lookup tries the exact key first, then falls back to character-trigram
+similarity against other questions cached for the same school and class, so "What is
+photosynthesis?" and "what is photosynthesis" share one answer. Numbers and
+the operators + - * / = ^ % are kept in the key, and a similar question only
+matches when they are exactly the same: "12 + 5" never gets the answer to
+"12 - 5", nor "radius 8 cm" the one for "radius 7 cm". Entries
+expire after `ttl` seconds; the least recently used are evicted once
+`max_entries` is reached, across all schools sharing the process.
+
+With `shared` (a SharedState, see shared_state.py) exact matches are also
+stored on the shared server, so an answer produced on one app replica is
+served by the others; similar-question matching stays local.
+"""
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+# Questions that lean on earlier turns cannot be answered from the cache
+FOLLOW_UP_WORDS = {"it", "its", "this", "that", "these", "those", "he", "she", "him", "her",
+                   "they", "them", "their", "there", "here", "again", "more", "above", "previous",
+                   "same", "continue", "next", "yes", "no", "ok", "okay", "also", "too", "another",
+                   "other", "else", "last", "earlier", "before", "one", "ones"}
+FOLLOW_UP_OPENERS = {"and", "but", "so", "then", "also", "why", "how", "what"}
+# Longer questions carry enough of their own context to share an answer
+SHORT_QUESTION_WORDS = 8
+FILLER_WORDS = {"please", "pls", "plz", "kindly", "can", "could", "you", "me", "tell",
+                "the", "a", "an", "sir", "madam", "maam"}
+
+
+TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|[^\W\d_]+|[-+*/=^%]")
+NUMBER_RE = re.compile(r"[\d\-+*/=^%]")
+
+
+def normalize_question(text):
+    words = [w for w in TOKEN_RE.findall((text or "").lower()) if w not in FILLER_WORDS]
+    return " ".join(words)
+
+
+def numbers_and_operators(normalized):
+    """The tokens of a normalized question that must match exactly, in order."""
+    return tuple(w for w in normalized.split() if NUMBER_RE.match(w))
+
+
+def is_cacheable(text):
+    words = re.sub(r"[^\w\s]", " ", (text or "").lower()).split()
+    if len(words) < 3:
+        return False
+    if words[0] in FOLLOW_UP_WORDS or FOLLOW_UP_WORDS & set(words[:2]):
+        return False
+    # "what about this?", "and why is that?", "how does it work?"
+    if words[0] in FOLLOW_UP_OPENERS and words[1] in ("about", "is", "does", "do", "was", "are") \
+            and FOLLOW_UP_WORDS & set(words[2:]):
+        return False
+    return not (len(words) <= SHORT_QUESTION_WORDS and FOLLOW_UP_WORDS & set(words))
+
+
+def mentions_name(answer, name):
+    """True if `answer` contains any part of the student's name (so it can't be shared)."""
+    parts = [p for p in re.split(r"\W+", name or "") if len(p) >= 3]
+    return any(re.search(rf"\b{re.escape(p)}\b", answer or "", re.I) for p in parts)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class AnswerCache:
+    def __init__(self, max_entries=2000, ttl=86400, similarity=0.82, shared=None):
+        self.max_entries = max_entries
+        self.shared = shared.scoped("answers") if shared is not None else None
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()       # key -> (answer, grams, stored_at, numbers and operators)
+        self._by_scope = defaultdict(set)   # (school, class, version) -> keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(tenant, student_class, version, question):
+        return (tenant, str(student_class), version, normalize_question(question))
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._by_scope[key[:3]].discard(key)
+
+    def get(self, student_class, question, version="", tenant=""):
+        """Cached answer or None. Counts a hit or miss either way."""
+        key = self._key(tenant, student_class, version, question)
+        now = time.time()
+        with self._lock:
+            found = self._lookup(key, now)
+            if found is not None:
+                self._entries.move_to_end(found)
+                self.hits += 1
+                return self._entries[found][0]
+        answer = self.shared.get_json(self._shared_key(key)) if self.shared is not None else None
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, answer)
+            return answer
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now - entry[2] <= self.ttl:
+                return key
+            self._drop(key)
+        if not self.similarity:
+            return None
+        grams, exact = trigrams(key[3]), numbers_and_operators(key[3])
+        best, best_score = None, self.similarity
+        for other in list(self._by_scope.get(key[:3], ())):
+            answer, other_grams, stored_at, other_exact = self._entries[other]
+            if now - stored_at > self.ttl:
+                self._drop(other)
+                continue
+            if other_exact != exact:
+                continue            # only the wording may differ, never the maths
+            score = jaccard(grams, other_grams)
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+    @staticmethod
+    def _shared_key(key):
+        # v2: answers stored before student names were kept out are not reused
+        # v3: keys keep numbers and operators
+        return "v3:" + hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def _store(self, key, answer):
+        self._entries[key] = (answer, trigrams(key[3]), time.time(), numbers_and_operators(key[3]))
+        self._entries.move_to_end(key)
+        self._by_scope[key[:3]].add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def put(self, student_class, question, answer, version="", tenant=""):
+        key = self._key(tenant, student_class, version, question)
+        with self._lock:
+            self._store(key, answer)
+        if self.shared is not None:
+            self.shared.set_json(self._shared_key(key), answer, ttl=self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
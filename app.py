@@ -1,12 +1,30 @@
 import streamlit as st
-from groq import Groq
+import streamlit.components.v1 as components
 import os
 import json
-import hashlib
 import datetime
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 import base64
+import html
+from analytics import bucket_range
+from context import ContextBuilder, RollingSummary, format_transcript
+from prompts import build_system_prompt, detect_subject, prompt_version, SUBJECT_KEYWORDS
+from answer_cache import AnswerCache, is_cacheable, mentions_name
+from llm_queue import LLMQueue, QueueFull, UserBusy, is_rate_limited
+from providers import Completion, get_provider
+from passwords import LoginBusy, LoginThrottle, PasswordHasher
+from roster import import_students, iter_export_csv
+from stt import SAMPLE_RATE, STTBusy, TranscriptionService, get_stt_engine
+from assets import STATIC_DIR, build as build_assets, stylesheet_tag
+from metrics import (CACHE_ENTRIES, CACHE_LOOKUPS, LLM_QUEUE, LLM_TOKENS, LLM_TOKENS_PER_SECOND, LOGINS,
+                     QUESTION_SECONDS, REGISTRY, RENDER_SECONDS, STAGE_SECONDS, observe_model_call,
+                     serve as serve_metrics)
+from ratelimit import LocalBuckets, SharedBuckets, from_env as limits_from_env
+from shared_state import SharedInflight, SharedLoginThrottle, get_shared_state
+from tenants import TenantRegistry, tenant_from_request
+from tts import AudioCache, SpeechSynthesizer, clean_speech, get_tts_engine, take_sentences
 
 # ═══════════════════════════════════════════════════════════════
 # 1. ENVIRONMENT SETUP
@@ -24,921 +42,436 @@ st.set_page_config(
 )
 
 # ═══════════════════════════════════════════════════════════════
-# 3. CUSTOM CSS - PROFESSIONAL DARK EDU THEME
+# 3. CUSTOM CSS - PROFESSIONAL DARK EDU THEME (assets/theme.css)
 # ═══════════════════════════════════════════════════════════════
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;500;600;700;800&family=JetBrains+Mono:wght@400;500&display=swap');
-
-/* ── Root Variables ── */
-:root {
-    --primary:    #4F8EF7;
-    --primary-dk: #2563EB;
-    --accent:     #22D3A5;
-    --accent2:    #F59E0B;
-    --danger:     #EF4444;
-    --bg:         #0D1117;
-    --bg2:        #161B22;
-    --bg3:        #21262D;
-    --border:     #30363D;
-    --text:       #E6EDF3;
-    --text-muted: #7D8590;
-    --radius:     12px;
-    --shadow:     0 8px 32px rgba(0,0,0,0.4);
-}
-
-/* ── Base ── */
-*, *::before, *::after { box-sizing: border-box; margin: 0; padding: 0; }
-
-html, body, [data-testid="stAppViewContainer"] {
-    background: var(--bg) !important;
-    font-family: 'Outfit', sans-serif !important;
-    color: var(--text) !important;
-}
-
-[data-testid="stSidebar"] {
-    background: var(--bg2) !important;
-    border-right: 1px solid var(--border) !important;
-}
-
-[data-testid="stHeader"] { background: transparent !important; }
-.block-container { padding: 1.5rem 2rem !important; max-width: 1100px !important; }
-
-/* ── Hero Banner ── */
-.hero-banner {
-    background: linear-gradient(135deg, #1a2744 0%, #0D1117 50%, #0f2a1f 100%);
-    border: 1px solid var(--border);
-    border-radius: var(--radius);
-    padding: 2rem 2.5rem;
-    margin-bottom: 1.5rem;
-    position: relative;
-    overflow: hidden;
-}
-.hero-banner::before {
-    content: '';
-    position: absolute;
-    top: -50%;
-    left: -20%;
-    width: 60%;
-    height: 200%;
-    background: radial-gradient(ellipse, rgba(79,142,247,0.08) 0%, transparent 70%);
-    pointer-events: none;
-}
-.hero-title {
-    font-size: 2rem;
-    font-weight: 800;
-    background: linear-gradient(90deg, #4F8EF7, #22D3A5);
-    -webkit-background-clip: text;
-    -webkit-text-fill-color: transparent;
-    background-clip: text;
-    margin-bottom: 0.3rem;
-}
-.hero-sub {
-    color: var(--text-muted);
-    font-size: 0.95rem;
-    font-weight: 400;
-}
-
-/* ── Cards ── */
-.card {
-    background: var(--bg2);
-    border: 1px solid var(--border);
-    border-radius: var(--radius);
-    padding: 1.25rem 1.5rem;
-    margin-bottom: 1rem;
-    transition: border-color 0.2s;
-}
-.card:hover { border-color: var(--primary); }
-
-.stat-card {
-    background: var(--bg2);
-    border: 1px solid var(--border);
-    border-radius: var(--radius);
-    padding: 1.2rem 1rem;
-    text-align: center;
-    transition: all 0.2s;
-}
-.stat-card:hover {
-    border-color: var(--accent);
-    transform: translateY(-2px);
-    box-shadow: var(--shadow);
-}
-.stat-number { font-size: 2rem; font-weight: 800; color: var(--accent); }
-.stat-label  { font-size: 0.8rem; color: var(--text-muted); margin-top: 0.2rem; }
-
-/* ── Voice Widget ── */
-.voice-widget {
-    background: linear-gradient(135deg, #1a2744 0%, #161B22 100%);
-    border: 1px solid var(--primary);
-    border-radius: 16px;
-    padding: 1.5rem;
-    text-align: center;
-    margin-bottom: 1rem;
-}
-.voice-btn {
-    display: inline-flex;
-    align-items: center;
-    gap: 0.5rem;
-    background: linear-gradient(135deg, var(--primary), var(--primary-dk));
-    color: white;
-    border: none;
-    border-radius: 50px;
-    padding: 0.75rem 2rem;
-    font-size: 1rem;
-    font-weight: 600;
-    cursor: pointer;
-    transition: all 0.2s;
-    box-shadow: 0 4px 15px rgba(79,142,247,0.3);
-}
-.voice-btn:hover {
-    transform: translateY(-2px);
-    box-shadow: 0 6px 20px rgba(79,142,247,0.5);
-}
-.recording-pulse {
-    display: inline-block;
-    width: 12px; height: 12px;
-    background: var(--danger);
-    border-radius: 50%;
-    animation: pulse 1s infinite;
-}
-@keyframes pulse {
-    0%, 100% { opacity: 1; transform: scale(1); }
-    50%       { opacity: 0.5; transform: scale(1.3); }
-}
-
-/* ── Voice Gender Selector ── */
-.gender-selector {
-    display: flex;
-    gap: 1rem;
-    justify-content: center;
-    margin: 1rem 0;
-}
-.gender-btn {
-    flex: 1;
-    padding: 0.8rem;
-    border-radius: 10px;
-    border: 2px solid var(--border);
-    background: var(--bg3);
-    color: var(--text);
-    font-size: 0.95rem;
-    font-weight: 600;
-    cursor: pointer;
-    transition: all 0.2s;
-    text-align: center;
-}
-.gender-btn.active {
-    border-color: var(--accent);
-    background: rgba(34,211,165,0.1);
-    color: var(--accent);
-}
-.gender-btn:hover {
-    border-color: var(--primary);
-    background: rgba(79,142,247,0.1);
-}
-
-/* ── Chat Bubbles ── */
-.chat-user {
-    background: linear-gradient(135deg, var(--primary-dk), var(--primary));
-    color: white;
-    border-radius: 16px 16px 4px 16px;
-    padding: 0.8rem 1.2rem;
-    margin: 0.4rem 0 0.4rem 3rem;
-    max-width: 80%;
-    float: right;
-    clear: both;
-    font-size: 0.95rem;
-    box-shadow: 0 2px 12px rgba(79,142,247,0.2);
-}
-.chat-ai {
-    background: var(--bg3);
-    border: 1px solid var(--border);
-    color: var(--text);
-    border-radius: 16px 16px 16px 4px;
-    padding: 0.8rem 1.2rem;
-    margin: 0.4rem 3rem 0.4rem 0;
-    max-width: 80%;
-    float: left;
-    clear: both;
-    font-size: 0.95rem;
-}
-.chat-clear { clear: both; }
-.chat-meta { font-size: 0.72rem; color: var(--text-muted); margin-top: 0.3rem; }
-
-/* ── Usage Bar ── */
-.usage-bar-track {
-    background: var(--bg3);
-    border-radius: 50px;
-    height: 8px;
-    overflow: hidden;
-    margin: 0.4rem 0;
-}
-.usage-bar-fill {
-    height: 100%;
-    border-radius: 50px;
-    background: linear-gradient(90deg, var(--accent), var(--primary));
-    transition: width 0.5s ease;
-}
-
-/* ── Badges ── */
-.badge {
-    display: inline-block;
-    padding: 0.2rem 0.65rem;
-    border-radius: 50px;
-    font-size: 0.72rem;
-    font-weight: 600;
-    text-transform: uppercase;
-    letter-spacing: 0.05em;
-}
-.badge-green  { background: rgba(34,211,165,0.15); color: var(--accent); border: 1px solid rgba(34,211,165,0.3); }
-.badge-blue   { background: rgba(79,142,247,0.15); color: var(--primary); border: 1px solid rgba(79,142,247,0.3); }
-.badge-yellow { background: rgba(245,158,11,0.15); color: var(--accent2); border: 1px solid rgba(245,158,11,0.3); }
-.badge-red    { background: rgba(239,68,68,0.15); color: var(--danger); border: 1px solid rgba(239,68,68,0.3); }
-
-/* ── Login Page ── */
-.login-container {
-    max-width: 420px;
-    margin: 3rem auto;
-    background: var(--bg2);
-    border: 1px solid var(--border);
-    border-radius: 20px;
-    padding: 2.5rem;
-    box-shadow: var(--shadow);
-}
-.login-logo {
-    text-align: center;
-    font-size: 3rem;
-    margin-bottom: 0.5rem;
-}
-.login-title {
-    text-align: center;
-    font-size: 1.5rem;
-    font-weight: 700;
-    margin-bottom: 0.3rem;
-}
-.login-sub {
-    text-align: center;
-    color: var(--text-muted);
-    font-size: 0.9rem;
-    margin-bottom: 1.5rem;
-}
+@st.cache_resource
+def get_assets():
+    # Hashed, long-cached CSS / fonts / background built into static/ once
+    # per process (see assets.py); reruns only send the <link> tag
+    return build_assets()
 
-/* ── Language Selector ── */
-.lang-grid {
-    display: flex;
-    gap: 0.6rem;
-    flex-wrap: wrap;
-    margin: 0.5rem 0;
-}
-.lang-chip {
-    padding: 0.4rem 0.9rem;
-    border-radius: 50px;
-    border: 1.5px solid var(--border);
-    background: var(--bg3);
-    color: var(--text-muted);
-    font-size: 0.82rem;
-    font-weight: 500;
-    cursor: pointer;
-    transition: all 0.15s;
-}
-.lang-chip.active {
-    border-color: var(--accent);
-    background: rgba(34,211,165,0.1);
-    color: var(--accent);
-}
-
-/* ── Dashboard Table ── */
-.dash-table {
-    width: 100%;
-    border-collapse: collapse;
-    font-size: 0.88rem;
-}
-.dash-table th {
-    background: var(--bg3);
-    padding: 0.75rem 1rem;
-    text-align: left;
-    font-weight: 600;
-    color: var(--text-muted);
-    text-transform: uppercase;
-    font-size: 0.72rem;
-    letter-spacing: 0.05em;
-    border-bottom: 1px solid var(--border);
-}
-.dash-table td {
-    padding: 0.75rem 1rem;
-    border-bottom: 1px solid rgba(48,54,61,0.5);
-    color: var(--text);
-}
-.dash-table tr:hover td { background: rgba(79,142,247,0.05); }
-
-/* ── Streamlit overrides ── */
-.stTextInput > div > div > input,
-.stSelectbox > div > div > select,
-.stTextArea > div > div > textarea {
-    background: var(--bg3) !important;
-    border: 1px solid var(--border) !important;
-    color: var(--text) !important;
-    border-radius: 8px !important;
-    font-family: 'Outfit', sans-serif !important;
-}
-.stButton > button {
-    background: linear-gradient(135deg, var(--primary), var(--primary-dk)) !important;
-    color: white !important;
-    border: none !important;
-    border-radius: 8px !important;
-    font-family: 'Outfit', sans-serif !important;
-    font-weight: 600 !important;
-    transition: all 0.2s !important;
-}
-.stButton > button:hover {
-    transform: translateY(-1px) !important;
-    box-shadow: 0 4px 12px rgba(79,142,247,0.4) !important;
-}
-.stTabs [data-baseweb="tab"] {
-    background: var(--bg2) !important;
-    color: var(--text-muted) !important;
-    border-radius: 8px 8px 0 0 !important;
-    font-family: 'Outfit', sans-serif !important;
-}
-.stTabs [data-baseweb="tab"][aria-selected="true"] {
-    background: var(--bg3) !important;
-    color: var(--primary) !important;
-}
-.stAlert { border-radius: var(--radius) !important; }
-div[data-testid="stMarkdownContainer"] p { color: var(--text) !important; }
-label, .stSelectbox label, .stTextInput label { color: var(--text-muted) !important; font-weight: 500 !important; }
-
-/* ── Scrollbar ── */
-::-webkit-scrollbar { width: 6px; }
-::-webkit-scrollbar-track { background: var(--bg); }
-::-webkit-scrollbar-thumb { background: var(--border); border-radius: 3px; }
-::-webkit-scrollbar-thumb:hover { background: var(--primary); }
-
-/* ── Divider ── */
-hr { border-color: var(--border) !important; }
-
-/* ── Audio hidden ── */
-audio { display: none; }
-
-/* ── Responsive ── */
-@media (max-width: 640px) {
-    .hero-title { font-size: 1.4rem; }
-    .block-container { padding: 1rem !important; }
-    .chat-user, .chat-ai { max-width: 92%; }
-}
-</style>
-""", unsafe_allow_html=True)
+theme_assets = get_assets()
+# Component route over static/ so the stylesheet is served as text/css
+_assets_component = components.declare_component("theme_assets", path=str(STATIC_DIR))
+st.markdown(stylesheet_tag(theme_assets, _assets_component.name), unsafe_allow_html=True)
 
 # ═══════════════════════════════════════════════════════════════
-# 4. DATA STORAGE (File-based for Streamlit Cloud)
+# 4. DATA STORAGE (SQLite by default, JSON file optional)
 # ═══════════════════════════════════════════════════════════════
-DATA_FILE = "school_data.json"
-
-def load_data():
-    if Path(DATA_FILE).exists():
-        try:
-            with open(DATA_FILE, "r") as f:
-                return json.load(f)
-        except:
-            pass
-    return get_default_data()
-
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def get_default_data():
-    return {
-        "users": {
-            "admin": {
-                "password": hashlib.sha256("admin123".encode()).hexdigest(),
-                "role": "teacher",
-                "name": "Administrator",
-                "class": "N/A",
-                "usage_today": 0,
-                "total_usage": 0,
-                "last_active": "",
-                "created": str(datetime.date.today())
-            },
-            "student1": {
-                "password": hashlib.sha256("student123".encode()).hexdigest(),
-                "role": "student",
-                "name": "Demo Student",
-                "class": "10",
-                "usage_today": 0,
-                "total_usage": 0,
-                "last_active": "",
-                "created": str(datetime.date.today())
-            }
-        },
-        "settings": {
-            "school_name": "School Name",
-            "daily_limit": 30,
-            "total_limit": 500
-        },
-        "logs": []
-    }
+@st.cache_resource
+def get_tenants():
+    # One store per school, shared by every session of that school (see
+    # store.py); a single school unless TENANTS_DIR is set (see tenants.py)
+    return TenantRegistry(os.getenv("TENANTS_DIR"))
+
+tenants = get_tenants()
+
+def resolve_tenant():
+    """School id for this request: "" for a single school, None if unknown."""
+    if not tenants.multi:
+        return ""
+    headers = getattr(getattr(st, "context", None), "headers", None) or {}
+    tenant = tenant_from_request(headers.get("Host", ""), st.query_params,
+                                 os.getenv("TENANT_BASE_DOMAIN"))
+    return tenant if tenant and tenants.exists(tenant) else None
+
+TENANT = resolve_tenant()
+if TENANT is None:
+    st.error("🏫 School not found. Please open the tutor link your school gave you.")
+    st.stop()
+store = tenants.store(TENANT)
+with STAGE_SECONDS.time(stage="sync"):
+    store.sync()   # writes from other replicas (SHARED_STATE_URL); no-op otherwise
+
+def user_key(username):
+    # Usernames are only unique within a school; shared pools and throttles
+    # key on the school as well
+    return f"{TENANT}/{username}" if TENANT else username
+
+def client_address():
+    # The browser's address, so the login lock hits the device that keeps
+    # guessing rather than every device on the account. X-Forwarded-For is
+    # set by the client too: only behind a proxy (TRUST_PROXY=1) is the
+    # address it appended, the last one, to be believed
+    context = getattr(st, "context", None)
+    headers = getattr(context, "headers", None) or {}
+    if os.getenv("TRUST_PROXY", "0") != "0":
+        forwarded = headers.get("X-Forwarded-For", "").split(",")[-1].strip()
+        if forwarded:
+            return forwarded
+    return getattr(context, "ip_address", None) or ""
+
+@st.cache_resource
+def get_password_hasher():
+    # Salted KDF work runs on a small shared pool, not the script thread
+    return PasswordHasher(workers=int(os.getenv("PASSWORD_WORKERS", min(4, os.cpu_count() or 1))),
+                          max_pending=int(os.getenv("PASSWORD_MAX_PENDING", 64)))
+
+@st.cache_resource
+def get_login_throttle():
+    limits = dict(max_failures=int(os.getenv("LOGIN_MAX_FAILURES", 5)),
+                  lockout=float(os.getenv("LOGIN_LOCKOUT_SECONDS", 300)),
+                  spacing=float(os.getenv("LOGIN_SPACING_SECONDS", 10)))
+    shared = get_shared_state()
+    # Counted on the shared server when replicas run behind a load balancer
+    return SharedLoginThrottle(shared, **limits) if shared else LoginThrottle(**limits)
+
+password_hasher = get_password_hasher()
+login_throttle = get_login_throttle()
+
+PASSWORDS_BUSY = "⏳ The server is busy checking passwords. Please try again in a moment."
 
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def authenticate(username, password, data):
-    if username in data["users"]:
-        if data["users"][username]["password"] == hash_password(password):
-            return True
-    return False
-
-def log_interaction(data, username, query_type, subject=""):
-    entry = {
-        "user": username,
-        "type": query_type,
-        "subject": subject,
-        "timestamp": str(datetime.datetime.now()),
-        "date": str(datetime.date.today())
-    }
-    data["logs"].append(entry)
-    # Update user stats
-    if username in data["users"]:
-        data["users"][username]["total_usage"] += 1
-        data["users"][username]["last_active"] = str(datetime.datetime.now())
-        today = str(datetime.date.today())
-        last = data["users"][username].get("last_active_date", "")
-        if last != today:
-            data["users"][username]["usage_today"] = 0
-            data["users"][username]["last_active_date"] = today
-        data["users"][username]["usage_today"] += 1
-    save_data(data)
-    return data
-
-def check_usage_limit(data, username):
-    if username not in data["users"]:
+    # Runs on the shared pool too, so it can raise LoginBusy
+    return password_hasher.hash(password)
+
+@STAGE_SECONDS.timed(stage="authenticate")
+def authenticate(username, password, store):
+    """Returns (ok, error message). Legacy hashes are upgraded on success."""
+    client = client_address()
+    wait = login_throttle.retry_in(user_key(username), client)
+    if wait:
+        LOGINS.inc(result="locked")
+        if wait < 60:
+            return False, f"🔒 Too many attempts. Try again in {int(wait) + 1} s."
+        return False, f"🔒 Too many attempts. Try again in {int(wait // 60) + 1} min."
+    user = store.get_user(username)
+    try:
+        ok, new_hash = password_hasher.check(password, user["password"] if user else None)
+    except LoginBusy:
+        LOGINS.inc(result="busy")
+        return False, "⏳ Lots of students are signing in right now. Please try again in a moment."
+    if not ok:
+        LOGINS.inc(result="failed")
+        login_throttle.failed(user_key(username), client)
+        return False, "❌ Invalid username or password."
+    LOGINS.inc(result="ok")
+    login_throttle.succeeded(user_key(username), client)
+    if new_hash:
+        store.update_user(username, password=new_hash)
+    return True, None
+
+@STAGE_SECONDS.timed(stage="log_interaction")
+def log_interaction(store, username, query_type, subject="", detected_subject=None, usage=None):
+    # One log row + one user row, counters and dashboard aggregates updated
+    # under the user's lock; `usage` adds the call's tokens and latency
+    return store.record_interaction(username, query_type, subject, detected_subject, usage)
+
+def check_usage_limit(store, username):
+    # For the page: whether to offer the question box at all. The limit is
+    # enforced by admit_question(), which takes the question atomically
+    user = store.get_user(username)
+    if user is None:
         return False
-    user = data["users"][username]
     if user["role"] == "teacher":
         return True  # No limit for teachers
-    today = str(datetime.date.today())
-    if user.get("last_active_date", "") != today:
-        return True
-    daily_limit = data["settings"]["daily_limit"]
-    return user["usage_today"] < daily_limit
+    remaining = question_limits.remaining_today(TENANT, username, store.get_setting("daily_limit"),
+                                                store.usage_today(username))
+    return remaining is None or remaining > 0
+
+def admit_question(store, username, student_class, api_tokens=0):
+    # Daily quota, per-student and per-class rates and the API token budget,
+    # all taken in one step before the question is answered (ratelimit.py)
+    user = store.get_user(username) or {}
+    return question_limits.admit(TENANT, username, student_class, store.get_setting("daily_limit"),
+                                 used_today=store.usage_today(username), api_tokens=api_tokens,
+                                 teacher=user.get("role") == "teacher",
+                                 daily_tokens=store.get_setting("daily_token_limit", 0),
+                                 tokens_today=store.tokens_today(username))
+
+LIMIT_MESSAGES = {
+    "daily": "⏸️ You've used all your questions for today. Come back tomorrow!",
+    "tokens": "⏸️ You've used today's answer budget. Try a shorter question, or come back tomorrow!",
+    "student": "⏳ You're asking very quickly! Please wait {wait} and ask again.",
+    "class": "⏳ Your class is asking a lot of questions right now. Please try again in {wait}.",
+    "api": "🚦 The tutor is answering a lot of questions right now. Please try again in {wait}.",
+}
+
+def limit_message(admission):
+    wait = f"{int(admission.retry_after) + 1} seconds" if admission.retry_after else "a minute"
+    return LIMIT_MESSAGES[admission.blocked].format(wait=wait)
 
 # ═══════════════════════════════════════════════════════════════
-# 5. VOICE COMPONENT - st.components.v1.html() for mic permissions
+# 5. VOICE COMPONENT - bidirectional custom component (voice_component/)
 # ═══════════════════════════════════════════════════════════════
-import streamlit.components.v1 as components
+# Static HTML/JS/CSS served by Streamlit and cached by the browser. The iframe
+# is mounted once per session; reruns only send new args, so the mic and any
+# speech in progress are not reset.
+VOICE_DIR = Path(__file__).parent / "voice_component"
+_voice_component = components.declare_component("voice_widget", path=str(VOICE_DIR))
+
+VOICE_LANGS = {"English": "en-IN", "Telugu": "te-IN", "Hindi": "hi-IN", "Urdu": "ur-PK"}
+
+@st.cache_resource
+def get_stt_service():
+    # Optional server-side transcription (STT_ENGINE=faster-whisper|vosk) for
+    # browsers without SpeechRecognition; see stt.py
+    engine = get_stt_engine()
+    if engine is None:
+        return None
+    return TranscriptionService(engine, workers=int(os.getenv("STT_WORKERS", "2")),
+                                batch_size=int(os.getenv("STT_BATCH_SIZE", "4")))
+
+stt_service = get_stt_service()
+
+# Partials at most every STT_PARTIAL_INTERVAL seconds, one at a time; a final
+# transcription still running after STT_FINAL_TIMEOUT seconds is given up
+STT_PARTIAL_INTERVAL = float(os.getenv("STT_PARTIAL_INTERVAL", "3"))
+STT_FINAL_TIMEOUT = float(os.getenv("STT_FINAL_TIMEOUT", "20"))
+
+def handle_voice_audio(value, username, lang_code):
+    """
+    Collect audio chunks uploaded by the voice component and queue them on
+    the STT pool: the audio so far for a partial result, everything once the
+    student stops. Never waits for the pool; the component polls while the
+    final transcription runs. Returns the `stt` arg sent back to the component.
+    """
+    state = st.session_state.setdefault("stt_state", {"utterance": None})
+    if stt_service and value and value.get("kind") == "audio":
+        if value.get("utterance") != state["utterance"]:
+            for job in (state.get("partial_job"), state.get("final_job")):
+                if job is not None:
+                    stt_service.cancel(job)
+            state.clear()
+            state.update(utterance=value.get("utterance"), seq=-1, transcribed=-1, pcm=bytearray(),
+                         result={}, partial_job=None, final_job=None, next_partial=0.0)
+        for seq, chunk in value.get("chunks", []):
+            if seq > state["seq"]:      # chunks are re-sent until acknowledged
+                state["pcm"] += base64.b64decode(chunk)
+                state["seq"] = seq
+        lang = VOICE_LANGS.get(lang_code, "en-IN")
+        key = f"{user_key(username)}:{state['utterance']}"
+        now = time.monotonic()
+        try:
+            if value.get("final") and not state["result"].get("final"):
+                job = state["final_job"]
+                if job is None:
+                    job = state["final_job"] = stt_service.submit(key, state["pcm"], lang)
+                    state["final_deadline"] = now + STT_FINAL_TIMEOUT
+                    state["pcm"] = bytearray()
+                if job.done.is_set():
+                    state["result"] = {"text": stt_service.wait(job, 0) or "", "final": True}
+                elif now > state["final_deadline"]:
+                    stt_service.cancel(job)
+                    state["result"] = {"error": "Transcription took too long, please try again or type your question.",
+                                       "final": True}
+                else:
+                    state["result"] = {"text": state["result"].get("text", ""), "final": False, "pending": True}
+            elif not value.get("final"):
+                job = state["partial_job"]
+                if job is not None and job.done.is_set():
+                    state["partial_job"] = None
+                    text = stt_service.wait(job, 0)
+                    if text is not None:
+                        state["result"] = {"text": text, "final": False}
+                if (state["partial_job"] is None and state["seq"] > state["transcribed"]
+                        and len(state["pcm"]) >= SAMPLE_RATE and now >= state["next_partial"]):
+                    state["transcribed"] = state["seq"]
+                    state["next_partial"] = now + STT_PARTIAL_INTERVAL
+                    state["partial_job"] = stt_service.submit(key, state["pcm"], lang, partial=True)
+        except STTBusy:
+            state["result"] = {"error": "Voice server is busy, please try again or type your question.",
+                               "final": True}
+        except Exception as e:
+            state["result"] = {"error": f"Could not transcribe: {e}", "final": True}
+    if not state.get("utterance"):
+        return None
+    return dict(state["result"], utterance=state["utterance"], ack=state["seq"])
+
+# Clips live outside the source tree and are served through a component
+# route of their own, as the theme stylesheet is (see assets.py)
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR") or Path.home() / ".cache" / "ai9campus" / "tts")
+# After the answer finishes, clips not ready within this long are read by the device voice
+TTS_FINAL_WAIT = float(os.getenv("TTS_FINAL_WAIT", "8"))
+
+@st.cache_resource
+def get_speech_synthesizer():
+    # Optional server-side TTS (TTS_ENGINE=espeak|piper); see tts.py
+    engine = get_tts_engine()
+    if engine is None:
+        return None
+    cache = AudioCache(TTS_CACHE_DIR, max_bytes=int(os.getenv("TTS_CACHE_MB", "500")) * 1024 * 1024)
+    return SpeechSynthesizer(engine, cache, workers=int(os.getenv("TTS_WORKERS", "2")),
+                             audio_format=os.getenv("TTS_AUDIO_FORMAT", "mp3"))
+
+speech_synth = get_speech_synthesizer()
+if speech_synth:
+    # From component/voice_widget/ to component/<clips>/
+    CLIP_URL = f"../{components.declare_component('tts_clips', path=str(TTS_CACHE_DIR)).name}/"
+
+def speech_items(speak_id, text, final=False):
+    """
+    Server-side TTS for answer `speak_id`: start synthesizing sentences not
+    seen yet and return [{"text", "src"}] for the leading ones whose clip is
+    ready. Never waits; the component asks again while clips are missing.
+    Once the answer is final, clips still not ready after TTS_FINAL_WAIT
+    seconds get no src and are read by the device voice instead.
+    """
+    state = st.session_state.get("tts_answer")
+    if not state or state["id"] != speak_id:
+        state = st.session_state.tts_answer = {"id": speak_id, "consumed": 0, "clips": []}
+    sentences, used = take_sentences(clean_speech(text)[state["consumed"]:], final)
+    state["consumed"] += used
+    lang = VOICE_LANGS.get(st.session_state.voice_lang, "en-IN")
+    state["clips"] += [(s, speech_synth.submit(s, lang, st.session_state.voice_gender)) for s in sentences]
+    if final:
+        state.setdefault("final_at", time.monotonic())
+    give_up = final and time.monotonic() - state["final_at"] > TTS_FINAL_WAIT
+
+    items = []
+    for sentence, clip in state["clips"]:
+        if clip.done():
+            try:
+                src = CLIP_URL + clip.result()
+            except Exception:
+                src = None
+        elif give_up:
+            src = None
+        else:
+            break
+        items.append({"text": sentence, "src": src})
+    return items
 
-def get_voice_html(lang_code, gender, auto_speak_text="", countdown_seconds=9):
+def voice_widget(lang_code, gender, speak_text="", speak_id=0, countdown_seconds=9, auto_speak=True,
+                 stt=None, speak_items=None, speak_pending=False):
     """
-    - Uses st.components.v1.html() → real iframe with microphone permission
-    - 9-second countdown before auto-sending after speech detected
-    - TTS speaks AI response via speechSynthesis inside same iframe
+    - Microphone → SpeechRecognition (or server-side STT, see stt.py) →
+      countdown → transcript returned to Python
+    - TTS reads answers sentence by sentence (pause / skip / stop), starting
+      while the answer is still streaming (see tts_stream_html); with
+      server-side TTS the sentences arrive as `speak_items` with audio clips,
+      and the component asks for a rerun while `speak_pending` clips are missing
     - Works on Chrome desktop, Edge desktop, Android Chrome
+    Returns {"text", "id"} of the last sent transcript, or None.
     """
-    lang_map = {"English":"en-IN","Telugu":"te-IN","Hindi":"hi-IN","Urdu":"ur-PK"}
-    lang  = lang_map.get(lang_code, "en-IN")
-    pitch = "1.3" if gender == "Female" else "0.8"
-
-    # Clean text for TTS — remove all chars that break JS string literals
-    safe_speak = (auto_speak_text
-                  .replace("\\", " ").replace("`", " ")
-                  .replace("'",  " ").replace('"',  " ")
-                  .replace("\n", " ").replace("\r", " ")
-                  .replace("#",  " ").replace("*",  " ")
-                  .replace("_",  " ").replace(">",  " ")
-                  [:500])
-
-    return f"""<!DOCTYPE html>
-<html><head>
-<meta name="viewport" content="width=device-width,initial-scale=1.0">
-<style>
-*{{box-sizing:border-box;margin:0;padding:0;font-family:'Segoe UI',sans-serif;}}
-body{{background:#0D1117;color:#E6EDF3;padding:10px;}}
-.card{{background:linear-gradient(135deg,#1a2744,#161B22);
-  border:1.5px solid #4F8EF7;border-radius:14px;padding:14px;text-align:center;}}
-
-/* ── Mic button ── */
-.mbtn{{display:inline-flex;align-items:center;justify-content:center;gap:8px;
-  width:100%;max-width:300px;padding:13px 20px;
-  background:linear-gradient(135deg,#4F8EF7,#2563EB);
-  color:white;border:none;border-radius:50px;font-size:1rem;font-weight:700;
-  cursor:pointer;box-shadow:0 4px 15px rgba(79,142,247,0.35);
-  -webkit-tap-highlight-color:transparent;touch-action:manipulation;transition:all 0.2s;}}
-.mbtn:active{{transform:scale(0.97);}}
-.mbtn.rec{{background:linear-gradient(135deg,#EF4444,#DC2626);
-  box-shadow:0 4px 15px rgba(239,68,68,0.45);animation:pb 1.2s infinite;}}
-@keyframes pb{{0%,100%{{box-shadow:0 4px 15px rgba(239,68,68,0.45);}}
-  50%{{box-shadow:0 4px 28px rgba(239,68,68,0.8);}}}}
-
-/* ── Countdown ring ── */
-.countdown-wrap{{display:none;margin:10px auto 0;width:64px;height:64px;position:relative;}}
-.countdown-wrap.show{{display:block;}}
-.countdown-svg{{transform:rotate(-90deg);}}
-.countdown-track{{fill:none;stroke:#21262D;stroke-width:5;}}
-.countdown-fill{{fill:none;stroke:#22D3A5;stroke-width:5;
-  stroke-dasharray:163;stroke-dashoffset:0;
-  transition:stroke-dashoffset 1s linear;stroke-linecap:round;}}
-.countdown-num{{position:absolute;top:50%;left:50%;transform:translate(-50%,-50%);
-  font-size:1.3rem;font-weight:800;color:#22D3A5;}}
-
-/* ── Status / transcript / send ── */
-.dp{{display:inline-block;width:10px;height:10px;background:white;
-  border-radius:50%;animation:d 1s infinite;}}
-@keyframes d{{0%,100%{{opacity:1;transform:scale(1);}}50%{{opacity:0.3;transform:scale(0.5);}}}}
-.st{{margin-top:9px;font-size:0.83rem;color:#7D8590;min-height:18px;}}
-.st.ok{{color:#22D3A5;font-weight:600;}}
-.st.err{{color:#EF4444;}}
-.st.act{{color:#4F8EF7;}}
-.st.spk{{color:#F59E0B;font-weight:600;}}
-.tbox{{margin-top:9px;background:#21262D;border:1px solid #30363D;
-  border-radius:8px;padding:8px 12px;font-size:0.9rem;min-height:34px;
-  text-align:left;word-break:break-word;display:none;color:#E6EDF3;}}
-.sbtn{{display:none;margin-top:8px;width:100%;padding:10px;
-  background:linear-gradient(135deg,#22D3A5,#059669);color:white;
-  border:none;border-radius:8px;font-size:0.95rem;font-weight:700;
-  cursor:pointer;transition:all 0.2s;}}
-.sbtn:active{{transform:scale(0.98);}}
-.cancelbtn{{display:none;margin-top:6px;width:100%;padding:7px;
-  background:transparent;color:#7D8590;border:1px solid #30363D;
-  border-radius:8px;font-size:0.82rem;cursor:pointer;}}
-.hint{{margin-top:7px;font-size:0.7rem;color:#404850;}}
-
-/* ── Speaking animation ── */
-.speak-bars{{display:none;justify-content:center;align-items:flex-end;
-  gap:3px;height:28px;margin-top:8px;}}
-.speak-bars.show{{display:flex;}}
-.bar{{width:5px;background:#F59E0B;border-radius:3px;animation:bounce 0.8s infinite;}}
-.bar:nth-child(1){{animation-delay:0s;height:8px;}}
-.bar:nth-child(2){{animation-delay:0.1s;height:18px;}}
-.bar:nth-child(3){{animation-delay:0.2s;height:12px;}}
-.bar:nth-child(4){{animation-delay:0.3s;height:22px;}}
-.bar:nth-child(5){{animation-delay:0.4s;height:10px;}}
-@keyframes bounce{{0%,100%{{transform:scaleY(0.5);}}50%{{transform:scaleY(1.2);}}}}
-</style></head>
-<body><div class="card">
-
-<!-- Mic button -->
-<button class="mbtn" id="mb" onclick="tog()">🎙️ Tap to Speak</button>
-
-<!-- Countdown ring (shows after speech detected) -->
-<div class="countdown-wrap" id="cdWrap">
-  <svg class="countdown-svg" width="64" height="64" viewBox="0 0 56 56">
-    <circle class="countdown-track" cx="28" cy="28" r="26"/>
-    <circle class="countdown-fill" id="cdFill" cx="28" cy="28" r="26"/>
-  </svg>
-  <div class="countdown-num" id="cdNum">{countdown_seconds}</div>
-</div>
-
-<!-- Status message -->
-<div class="st" id="sm">Press button · speak your question clearly</div>
-
-<!-- Transcript box -->
-<div class="tbox" id="tb"></div>
-
-<!-- Send + Cancel buttons -->
-<button class="sbtn" id="sb" onclick="sendNow()">✅ Send This Question</button>
-<button class="cancelbtn" id="cb" onclick="cancelCountdown()">✖ Cancel &amp; Re-speak</button>
-
-<!-- Speaking animation bars -->
-<div class="speak-bars" id="spkBars">
-  <div class="bar"></div><div class="bar"></div><div class="bar"></div>
-  <div class="bar"></div><div class="bar"></div>
-</div>
-
-<div class="hint" id="hm">Chrome · Edge · Android Chrome</div>
-</div>
-
-<script>
-// ── Variables ────────────────────────────────────────────────
-var R=null, IL=false, FT='', cdTimer=null, cdSec={countdown_seconds};
-var mb   = document.getElementById('mb');
-var sm   = document.getElementById('sm');
-var tb   = document.getElementById('tb');
-var sb   = document.getElementById('sb');
-var cb   = document.getElementById('cb');
-var hm   = document.getElementById('hm');
-var cdW  = document.getElementById('cdWrap');
-var cdN  = document.getElementById('cdNum');
-var cdF  = document.getElementById('cdFill');
-var spkB = document.getElementById('spkBars');
-var CIRCUMFERENCE = 163; // 2 * pi * 26
-
-var SR = window.SpeechRecognition || window.webkitSpeechRecognition;
-if (!SR) {{
-  sm.className='st err';
-  sm.innerText='⚠️ Please use Google Chrome or Samsung Internet browser';
-  mb.disabled=true; mb.style.opacity='0.5';
-}} else {{
-  hm.innerText='✅ Ready · {lang} · {gender} voice';
-}}
-
-// ── Mic toggle ───────────────────────────────────────────────
-function tog() {{ if (IL) {{ stopMic(); }} else {{ startMic(); }} }}
-
-function startMic() {{
-  if (!SR) return;
-  cancelCountdown();
-  FT=''; tb.style.display='none'; tb.innerText='';
-  sb.style.display='none'; cb.style.display='none';
-
-  R = new SR();
-  R.lang='{lang}'; R.continuous=false;
-  R.interimResults=true; R.maxAlternatives=3;
-
-  R.onstart = function() {{
-    IL=true;
-    mb.className='mbtn rec';
-    mb.innerHTML='<span class="dp"></span> Listening... (tap to stop)';
-    sm.className='st act'; sm.innerText='🎙️ Speak your question now...';
-    hm.innerText='Speak clearly · tap button to stop early';
-  }};
-
-  R.onresult = function(e) {{
-    var it=''; FT='';
-    for (var i=e.resultIndex; i<e.results.length; i++) {{
-      var t=e.results[i][0].transcript;
-      if (e.results[i].isFinal) {{ FT+=t; }} else {{ it+=t; }}
-    }}
-    var d = FT || it;
-    if (d) {{ tb.style.display='block'; tb.innerText=d; }}
-    if (FT) {{
-      sm.className='st ok';
-      sm.innerText='✅ Got it! Sending in {countdown_seconds} seconds...';
-    }} else {{
-      sm.className='st act';
-      sm.innerText='🎙️ Hearing: ' + it;
-    }}
-  }};
-
-  R.onerror = function(e) {{
-    IL=false; resetBtn();
-    var msgs = {{
-      'no-speech'    : '🔇 No speech heard. Please try again.',
-      'audio-capture': '🎤 Microphone not found. Check device settings.',
-      'not-allowed'  : '🚫 Mic blocked! Click 🔒 in browser bar → Allow microphone.',
-      'network'      : '🌐 Network error. Check your internet connection.',
-      'aborted'      : '⏹ Stopped.'
-    }};
-    sm.className='st err';
-    sm.innerText = msgs[e.error] || ('Error: ' + e.error);
-    hm.innerText = 'Tip: Use Chrome on Android for best results';
-  }};
-
-  R.onend = function() {{
-    IL=false; resetBtn();
-    if (FT && FT.trim().length > 0) {{
-      startCountdown(); // ← 9-second countdown before sending
-    }} else if (!tb.innerText) {{
-      sm.className='st';
-      sm.innerText='Nothing heard. Please try again.';
-    }}
-  }};
-
-  try {{ R.start(); }}
-  catch(ex) {{
-    sm.className='st err';
-    sm.innerText='Mic error: ' + ex.message;
-    IL=false; resetBtn();
-  }}
-}}
-
-function stopMic() {{
-  if (R) {{ try {{ R.stop(); }} catch(e) {{}} }}
-  IL=false; resetBtn();
-}}
-
-function resetBtn() {{
-  mb.className='mbtn'; mb.innerHTML='🎙️ Tap to Speak';
-}}
-
-// ── 9-Second Countdown ───────────────────────────────────────
-function startCountdown() {{
-  var remaining = {countdown_seconds};
-  cdW.className='countdown-wrap show';
-  sb.style.display='block';
-  cb.style.display='block';
-  cdN.innerText = remaining;
-  cdF.style.strokeDashoffset = 0;
-  sm.className='st ok';
-  sm.innerText='✅ Sending in ' + remaining + ' seconds... (or click Send Now)';
-
-  // Animate the ring
-  cdTimer = setInterval(function() {{
-    remaining--;
-    cdN.innerText = remaining;
-    var offset = CIRCUMFERENCE * (1 - remaining / {countdown_seconds});
-    cdF.style.strokeDashoffset = offset;
-    sm.innerText='✅ Sending in ' + remaining + ' seconds... (or click Send Now)';
-
-    if (remaining <= 0) {{
-      clearInterval(cdTimer); cdTimer=null;
-      sendNow();
-    }}
-  }}, 1000);
-}}
-
-function cancelCountdown() {{
-  if (cdTimer) {{ clearInterval(cdTimer); cdTimer=null; }}
-  cdW.className='countdown-wrap';
-  sb.style.display='none';
-  cb.style.display='none';
-  sm.className='st';
-  sm.innerText='Press button · speak your question clearly';
-  hm.innerText='✅ Ready · {lang} · {gender} voice';
-}}
-
-// ── Send to Streamlit ────────────────────────────────────────
-function sendNow() {{
-  if (cdTimer) {{ clearInterval(cdTimer); cdTimer=null; }}
-  cdW.className='countdown-wrap';
-  var text = tb.innerText.trim();
-  if (!text) return;
-
-  window.parent.postMessage({{ type: 'voice_transcript', text: text }}, '*');
-
-  sb.innerHTML='✅ Sent!'; sb.style.background='#10B981';
-  cb.style.display='none';
-  sm.className='st ok'; sm.innerText='✅ Sent! AI is thinking... response coming soon.';
-  hm.innerText='You can speak again after the answer appears';
-
-  setTimeout(function() {{
-    tb.style.display='none'; tb.innerText='';
-    sb.style.display='none'; sb.innerHTML='✅ Send This Question'; sb.style.background='';
-    FT='';
-    sm.className='st'; sm.innerText='Press button · speak your question clearly';
-    hm.innerText='✅ Ready · {lang} · {gender} voice';
-  }}, 3000);
-}}
-
-// ── TTS: Speak AI Response ───────────────────────────────────
-// This runs when component re-renders with new speak text
-var speakText = '{safe_speak}';
-
-function doSpeak(text) {{
-  if (!window.speechSynthesis || !text || text.trim().length < 3) return;
-  window.speechSynthesis.cancel();
-
-  var u = new SpeechSynthesisUtterance(text);
-  u.lang   = '{lang}';
-  u.rate   = 0.88;
-  u.pitch  = {pitch};
-  u.volume = 1.0;
-
-  u.onstart = function() {{
-    spkB.className='speak-bars show';
-    sm.className='st spk';
-    sm.innerText='🔊 Speaking AI response...';
-  }};
-  u.onend = function() {{
-    spkB.className='speak-bars';
-    sm.className='st';
-    sm.innerText='Press button · speak your question clearly';
-  }};
-  u.onerror = function() {{
-    spkB.className='speak-bars';
-  }};
-
-  function go() {{
-    var voices = window.speechSynthesis.getVoices();
-    var pick = null;
-    for (var i=0; i<voices.length; i++) {{
-      var v = voices[i];
-      if (v.lang.indexOf('{lang}'.split('-')[0]) === 0) {{
-        pick = v;
-        var n = v.name;
-        if ('{gender}' === 'Female') {{
-          if (n.indexOf('Female')>=0 || n.indexOf('Heera')>=0 ||
-              n.indexOf('Raveena')>=0 || n.indexOf('Zira')>=0 ||
-              n.indexOf('Susan')>=0  || n.indexOf('female')>=0) {{ break; }}
-        }} else {{
-          if (n.indexOf('Male')>=0 || n.indexOf('Hemant')>=0 ||
-              n.indexOf('David')>=0 || n.indexOf('Mark')>=0 ||
-              n.indexOf('male')>=0) {{ break; }}
-        }}
-      }}
-    }}
-    if (pick) u.voice = pick;
-    window.speechSynthesis.speak(u);
-  }}
-
-  if (window.speechSynthesis.getVoices().length === 0) {{
-    window.speechSynthesis.onvoiceschanged = go;
-  }} else {{
-    go();
-  }}
-}}
-
-// Auto-speak when new AI response arrives (text injected by Python)
-if (speakText && speakText.trim().length > 3) {{
-  setTimeout(function() {{ doSpeak(speakText); }}, 1200);
-}}
-
-// Allow parent page to trigger speech stop
-window.addEventListener('message', function(e) {{
-  if (e.data && e.data.type === 'stop_speak') {{
-    if (window.speechSynthesis) window.speechSynthesis.cancel();
-    spkB.className='speak-bars';
-  }}
-}});
-</script></body></html>"""
+    return _voice_component(
+        lang=VOICE_LANGS.get(lang_code, "en-IN"),
+        gender=gender,
+        pitch=1.3 if gender == "Female" else 0.8,
+        speak_text=speak_text,
+        speak_items=speak_items,
+        speak_pending=speak_pending,
+        speak_id=speak_id,
+        auto_speak=auto_speak,
+        server_stt=stt_service is not None,
+        stt_mode=os.getenv("STT_MODE", "auto"),
+        stt=stt,
+        countdown_seconds=countdown_seconds,
+        key="voice_widget",
+        default=None
+    )
 
 # ═══════════════════════════════════════════════════════════════
 # 6. SYSTEM PROMPT
 # ═══════════════════════════════════════════════════════════════
-def build_system_prompt(school_name, student_name, student_class):
-    return f"""
-You are a **Professional AI Tutor from {school_name}**, specializing in Telangana State Board (SCERT) English Medium Curriculum for Academic Year 2025-26.
-
-You are currently helping: **{student_name}** | Class: **{student_class}**
-
-═══════════════════════════════════════════════════════════════
-📚 KNOWLEDGE BASE & SCOPE
-═══════════════════════════════════════════════════════════════
-
-OFFICIAL SOURCE: SCERT Telangana e-Textbooks (https://scert.telangana.gov.in/)
-Academic Year: 2025-26 | Medium: English Only | Classes: 1-10
-
-SUBJECTS: Languages (English/Telugu/Hindi/Urdu/Sanskrit), Mathematics, Physical Science, Biological Science, Environmental Science, Social Studies, Computer Science
-
-═══════════════════════════════════════════════════════════════
-🎓 TEACHING STYLE - PROFESSIONAL + FRIENDLY + ANALOGIES
-═══════════════════════════════════════════════════════════════
-
-ALWAYS USE ANALOGIES:
-• Science: "A plant is like a solar-powered kitchen - it uses sunlight to cook food"
-• Math: "Algebra variables are like empty boxes waiting to be filled with numbers"
-• History: "The Constitution is like the rulebook of a country, just like school has rules"
-• Geography: "Latitude lines are like horizontal rungs on a ladder circling the Earth"
-• Physics: "Electricity flows like water in pipes - more voltage = more pressure"
-• Biology: "DNA is like a recipe book - it contains instructions to build every part of your body"
-
-COMMUNICATION STYLE:
-✅ Professional yet warm - like an experienced, caring teacher
-✅ Start explanations with: "Great question! Let me explain [topic] from your Class [X] textbook..."
-✅ Use "Think of it this way..." before every analogy
-✅ End responses with: "Does this make sense? Would you like me to explain any part differently?"
-✅ For complex topics, break into numbered steps
-✅ Use encouraging phrases: "You're thinking in the right direction!", "Excellent observation!"
-
-VOICE-FRIENDLY RESPONSES:
-Since students may be listening via text-to-speech:
-- Keep sentences clear and not too long
-- Spell out formulas verbally: "six CO2 plus six H2O gives C6H12O6 plus six O2"
-- Avoid excessive bullet points in main explanations
-
-═══════════════════════════════════════════════════════════════
-📋 CURRICULUM: 10th Social Studies (English Medium) 2025-26
-═══════════════════════════════════════════════════════════════
-
-Part I - Resources Development and Equity:
-Ch1: India Relief Features (pp1-14) | Ch2: Ideas of Development (pp15-28)
-Ch3: Production and Employment (pp29-44) | Ch4: Climate of India (pp45-58)
-Ch5: Indian Rivers and Water Resources (pp59-71) | Ch6: The Population (pp72-87)
-Ch7: Settlements-Migrations (pp88-102) | Ch8: Rampur A Village Economy (pp103-117)
-Ch9: Globalisation (pp118-131) | Ch10: Food Security (pp132-145)
-Ch11: Sustainable Development with Equity (pp146-162)
-
-Part II - Contemporary World and India:
-Ch12: World Between the World Wars 1914-1945 (pp163-186)
-Ch13: National Liberation Movements in the Colonies (pp187-197)
-Ch14: National Movement in India Partition and Independence 1939-1947 (pp198-211)
-Ch15: The Making of Independent India's Constitution (pp212-228)
-Ch16: Election Process in India (pp229-238)
-Ch17: Independent India The First 30 years 1947-77 (pp239-253)
-Ch18: Emerging Political Trends 1977 to 2000 (pp254-271)
-Ch19: Post War World and India (pp272-287)
-Ch20: Social Movements in Our Times (pp288-303)
-Ch21: The Movement for the Formation of Telangana State (pp304-336)
-
-═══════════════════════════════════════════════════════════════
-📝 EXAM ANSWER FORMATS (SSC Board 2025-26)
-═══════════════════════════════════════════════════════════════
-
-1-mark: One precise sentence with key term
-2-mark: Two clear points or one point with example  
-4-mark: Definition + 3 explanation points + real example
-8-mark: Introduction (2 lines) + 6 detailed points + conclusion (2 lines) + diagram note if needed
-
-ALWAYS mention: "This is a [X]-mark topic in your board exam"
-
-═══════════════════════════════════════════════════════════════
-🚫 BOUNDARIES
-═══════════════════════════════════════════════════════════════
-
-NEVER: Answer non-SCERT Telangana topics | Give direct homework answers without teaching
-NEVER: Use other board content | Discuss non-educational topics
-ALWAYS: Teach the concept FIRST, then help solve | Reference chapter and page numbers
-ALWAYS: Use Telangana examples (Hyderabad Metro, Charminar, Hussain Sagar, Bathukamma)
-
-Your mission: Make every student feel confident and capable. You're not just answering questions — you're building young minds for a better Telangana! 🎓
-"""
+# Assembled from cached, versioned fragments in prompts.py; only the
+# curriculum for the student's class and detected subject is included.
 
 # ═══════════════════════════════════════════════════════════════
-# 7. GROQ API CLIENT
+# 7. LLM PROVIDER
 # ═══════════════════════════════════════════════════════════════
 # Support both .env (local) and Streamlit Cloud secrets
 api_key = os.getenv("GROK-API-KEY") or st.secrets.get("GROK-API-KEY", None)
-client = None
-if api_key:
-    client = Groq(api_key=api_key)
+
+@st.cache_resource
+def get_llm_provider(api_key):
+    # Groq by default; LLM_PROVIDER=mock points at mock_llm_server.py
+    return get_provider(api_key)
+
+provider = get_llm_provider(api_key)
+
+# Render answers token-by-token as they arrive; set STREAM_RESPONSES=0 to
+# wait for the full completion instead
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") != "0"
+STREAM_RENDER_INTERVAL = 0.05  # seconds between bubble repaints
+
+# Groq list price of the default model in USD per million tokens, for the
+# dashboard's spend estimates; set both when switching model or provider
+PRICE_PER_M_INPUT = float(os.getenv("LLM_PRICE_PER_M_INPUT", "1.00"))
+PRICE_PER_M_OUTPUT = float(os.getenv("LLM_PRICE_PER_M_OUTPUT", "3.00"))
+
+def token_cost(prompt_tokens, completion_tokens):
+    return (prompt_tokens * PRICE_PER_M_INPUT + completion_tokens * PRICE_PER_M_OUTPUT) / 1_000_000
+
+# ═══════════════════════════════════════════════════════════════
+# 7b. CONVERSATION CONTEXT
+# ═══════════════════════════════════════════════════════════════
+def summarize_turns(previous_summary, turns):
+    """Fold older turns into the rolling summary (runs on a background thread)."""
+    prompt = (
+        "Update the running summary of a tutoring conversation. Keep the topics, "
+        "chapters and the student's difficulties; drop pleasantries. Max 120 words.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New turns:\n{format_transcript(turns)}"
+    )
+    return provider.complete(
+        [{"role": "user", "content": prompt}],
+        max_completion_tokens=300,
+        temperature=0.3
+    ).text
+
+@st.cache_resource
+def get_answer_cache():
+    # Shared by all sessions: one student's answer serves the whole class
+    # (entries are keyed by school, the size bound is for all of them)
+    return AnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "2000")),
+        ttl=int(os.getenv("ANSWER_CACHE_TTL", "86400")),
+        similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.82")),
+        shared=get_shared_state()
+    )
+
+answer_cache = get_answer_cache()
+
+@st.cache_resource
+def get_llm_queue():
+    # Worker pool shared by every session; bounds concurrent API calls
+    shared = get_shared_state()
+    return LLMQueue(
+        workers=int(os.getenv("LLM_WORKERS", "4")),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+        per_user_limit=int(os.getenv("LLM_PER_USER_INFLIGHT", "1")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+        shared=SharedInflight(shared) if shared else None
+    )
+
+llm_queue = get_llm_queue()
+
+@st.cache_resource
+def get_question_limits():
+    shared = get_shared_state()
+    # Buckets on the shared server when replicas run behind a load balancer
+    return limits_from_env(SharedBuckets(shared) if shared else LocalBuckets())
+
+question_limits = get_question_limits()
+# Model budget reserved per question on top of its prompt; settled against
+# the real usage once the answer is in
+ANSWER_TOKENS_ESTIMATE = int(os.getenv("ANSWER_TOKENS_ESTIMATE", "700"))
+
+context_builder = ContextBuilder(
+    max_turns=int(os.getenv("CONTEXT_MAX_TURNS", "6")),
+    token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000")),
+    summarize=summarize_turns
+)
+
+# ═══════════════════════════════════════════════════════════════
+# 7c. METRICS (metrics.py; Prometheus endpoint on METRICS_PORT)
+# ═══════════════════════════════════════════════════════════════
+@st.cache_resource
+def get_metrics_server():
+    """(server, error message); both None when METRICS_PORT is unset."""
+    port = int(os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None, None
+    try:
+        return serve_metrics(port, os.getenv("METRICS_HOST", "0.0.0.0")), None
+    except OSError as e:
+        # Another replica on this host may already have the port; shown in the System tab
+        return None, f"Could not listen on port {port}: {e}"
+
+metrics_server, metrics_error = get_metrics_server()
+LLM_QUEUE.set_function(lambda: {(k,): v for k, v in llm_queue.stats().items()})
+CACHE_ENTRIES.set_function(lambda: answer_cache.stats()["entries"])
 
 # ═══════════════════════════════════════════════════════════════
 # 8. INITIALIZE SESSION STATE
@@ -953,19 +486,26 @@ defaults = {
     "voice_gender": "Female",
     "voice_lang": "English",
     "auto_speak": True,
-    "school_data": None,
     "voice_transcript": "",
     "page": "login",
-    "last_spoken_idx": -1
+    "last_spoken_idx": -1,
+    "context_summary": None,
+    "context_stats": {},
+    "cache_status": ""
 }
+# A session belongs to one school; switching the link signs it out
+if st.session_state.get("tenant", TENANT) != TENANT:
+    for k in list(st.session_state.keys()):
+        del st.session_state[k]
+st.session_state.tenant = TENANT
+
 for k, v in defaults.items():
     if k not in st.session_state:
         st.session_state[k] = v
 
-if st.session_state.school_data is None:
-    st.session_state.school_data = load_data()
+if st.session_state.context_summary is None:
+    st.session_state.context_summary = RollingSummary()
 
-data = st.session_state.school_data
 
 # ═══════════════════════════════════════════════════════════════
 # 9. LOGIN PAGE
@@ -973,7 +513,7 @@ data = st.session_state.school_data
 def show_login():
     col1, col2, col3 = st.columns([1, 1.4, 1])
     with col2:
-        school = data["settings"]["school_name"]
+        school = store.get_setting("school_name")
         st.markdown(f"""
         <div class="login-container">
             <div class="login-logo">🎓</div>
@@ -988,20 +528,22 @@ def show_login():
             submitted = st.form_submit_button("Sign In →", use_container_width=True)
 
             if submitted:
-                if not api_key:
+                if not provider:
                     st.error("⚠️ API Key not found. Add GROK-API-KEY to your .env or Streamlit secrets.")
-                elif authenticate(username, password, data):
-                    user = data["users"][username]
-                    st.session_state.logged_in = True
-                    st.session_state.username = username
-                    st.session_state.role = user["role"]
-                    st.session_state.user_name = user["name"]
-                    st.session_state.user_class = user.get("class", "")
-                    st.session_state.messages = []
-                    st.session_state.page = "dashboard" if user["role"] == "teacher" else "chat"
-                    st.rerun()
                 else:
-                    st.error("❌ Invalid username or password.")
+                    ok, error = authenticate(username, password, store)
+                    if ok:
+                        user = store.get_user(username)
+                        st.session_state.logged_in = True
+                        st.session_state.username = username
+                        st.session_state.role = user["role"]
+                        st.session_state.user_name = user["name"]
+                        st.session_state.user_class = user.get("class", "")
+                        st.session_state.messages = []
+                        st.session_state.page = "dashboard" if user["role"] == "teacher" else "chat"
+                        st.rerun()
+                    else:
+                        st.error(error)
 
         st.markdown("""
         <div style='text-align:center; margin-top:1rem; color:var(--text-muted); font-size:0.8rem;'>
@@ -1013,7 +555,7 @@ def show_login():
 # 10. TEACHER DASHBOARD
 # ═══════════════════════════════════════════════════════════════
 def show_teacher_dashboard():
-    school = data["settings"]["school_name"]
+    school = store.get_setting("school_name")
 
     st.markdown(f"""
     <div class="hero-banner">
@@ -1022,23 +564,24 @@ def show_teacher_dashboard():
     </div>
     """, unsafe_allow_html=True)
 
-    tabs = st.tabs(["📈 Overview", "👥 Students", "⚙️ Settings", "📝 Add Student"])
+    tabs = st.tabs(["📈 Overview", "📉 Trends", "👥 Students", "⚙️ Settings", "📝 Add Student", "🖥️ System"])
 
     # ── Overview ──────────────────────────────────────────────
-    with tabs[0]:
-        students = {u: d for u, d in data["users"].items() if d["role"] == "student"}
-        today_logs = [l for l in data["logs"] if l.get("date") == str(datetime.date.today())]
-        total_q = sum(d["total_usage"] for d in students.values())
+    with tabs[0], RENDER_SECONDS.time(view="overview"):
+        # Precomputed counters: constant time regardless of history size
+        today = str(datetime.date.today())
+        today_count = store.count_logs(today)
+        total_q = store.student_questions_total()
 
         c1, c2, c3, c4 = st.columns(4)
         with c1:
             st.markdown(f"""<div class="stat-card">
-                <div class="stat-number">{len(students)}</div>
+                <div class="stat-number">{store.student_count()}</div>
                 <div class="stat-label">Total Students</div>
             </div>""", unsafe_allow_html=True)
         with c2:
             st.markdown(f"""<div class="stat-card">
-                <div class="stat-number">{len(today_logs)}</div>
+                <div class="stat-number">{today_count}</div>
                 <div class="stat-label">Questions Today</div>
             </div>""", unsafe_allow_html=True)
         with c3:
@@ -1047,17 +590,29 @@ def show_teacher_dashboard():
                 <div class="stat-label">Total Questions</div>
             </div>""", unsafe_allow_html=True)
         with c4:
-            active = sum(1 for d in students.values() if d.get("last_active_date","") == str(datetime.date.today()))
+            active = store.active_students(today)
             st.markdown(f"""<div class="stat-card">
                 <div class="stat-number">{active}</div>
                 <div class="stat-label">Active Today</div>
             </div>""", unsafe_allow_html=True)
 
+        by_class = store.usage.classes_on(today)
+        by_subject = store.usage.subjects_on(today)
+        if by_class:
+            class_txt = " · ".join(f"Class {c}: {n}" for c, n in sorted(by_class.items()) if c != "N/A")
+            subject_txt = " · ".join(f"{s}: {n}" for s, n in sorted(by_subject.items(), key=lambda x: -x[1]))
+            st.caption(f"📚 Today by class — {class_txt or '—'}  \n🧪 By subject — {subject_txt}")
+        if store.rollups is not None:
+            _, prompt_t, completion_t = store.rollups.tokens("day", "all", today, today).get("*", (0, 0, 0))
+            if prompt_t or completion_t:
+                st.caption(f"🔢 Model tokens today — {prompt_t + completion_t:,} "
+                           f"({prompt_t:,} in · {completion_t:,} out) · ≈ \\${token_cost(prompt_t, completion_t):.2f}")
+
         st.markdown("<br>", unsafe_allow_html=True)
 
         # Recent activity
         st.markdown("<div class='card'><b>📋 Recent Activity (Last 20)</b></div>", unsafe_allow_html=True)
-        recent = data["logs"][-20:][::-1]
+        recent = store.recent_logs(20)
         if recent:
             table_rows = ""
             for log in recent:
@@ -1079,15 +634,44 @@ def show_teacher_dashboard():
         else:
             st.info("No activity recorded yet.")
 
+    # ── Trends ────────────────────────────────────────────────
+    with tabs[1], RENDER_SECONDS.time(view="trends"):
+        show_trends()
+
     # ── Students ──────────────────────────────────────────────
-    with tabs[1]:
-        students = {u: d for u, d in data["users"].items() if d["role"] == "student"}
-        daily_limit = data["settings"]["daily_limit"]
+    with tabs[2], RENDER_SECONDS.time(view="students"):
+        daily_limit = store.get_setting("daily_limit")
+
+        if store.student_count():
+            f1, f2, f3, f4 = st.columns([3, 1.4, 1.8, 1])
+            search = f1.text_input("🔍 Search name or username", key="students_search")
+            class_filter = f2.selectbox("Class", ["All"] + [str(i) for i in range(1, 11)], key="students_class")
+            sort_label = f3.selectbox("Sort by", list(STUDENT_SORTS), key="students_sort")
+            page_size = f4.selectbox("Per page", [25, 50, 100], key="students_page_size")
+
+            # Any filter change sends the teacher back to the first page
+            view = (search, class_filter, sort_label, page_size)
+            if st.session_state.get("students_view") != view:
+                st.session_state.students_view = view
+                st.session_state.students_page = 0
+
+            sort_key, descending = STUDENT_SORTS[sort_label]
+            page = st.session_state.get("students_page", 0)
+            rows, total = store.query_students(
+                search=search, student_class=None if class_filter == "All" else class_filter,
+                sort=sort_key, descending=descending, offset=page * page_size, limit=page_size)
+            pages = max(1, -(-total // page_size))
+            if page >= pages:
+                page = st.session_state.students_page = pages - 1
+                rows, _ = store.query_students(
+                    search=search, student_class=None if class_filter == "All" else class_filter,
+                    sort=sort_key, descending=descending, offset=page * page_size, limit=page_size)
 
-        if students:
             table_rows = ""
-            for uname, udata in students.items():
-                used = udata.get("usage_today", 0) if udata.get("last_active_date","") == str(datetime.date.today()) else 0
+            for uname, udata in rows:
+                active_today = udata.get("last_active_date", "") == str(datetime.date.today())
+                used = udata.get("usage_today", 0) if active_today else 0
+                tokens = udata.get("tokens_today", 0) if active_today else 0
                 pct = min(100, int(used / daily_limit * 100))
                 color = "#22D3A5" if pct < 70 else "#F59E0B" if pct < 90 else "#EF4444"
                 badge_cls = "badge-green" if pct < 70 else "badge-yellow" if pct < 90 else "badge-red"
@@ -1102,31 +686,46 @@ def show_teacher_dashboard():
                             <span class='badge {badge_cls}'>{used}/{daily_limit}</span>
                         </div>
                     </td>
+                    <td>{tokens:,}</td>
                     <td>{udata.get('total_usage',0)}</td>
                     <td style='color:var(--text-muted);font-size:0.8rem;'>{str(udata.get('last_active','—'))[:16]}</td>
                 </tr>"""
             st.markdown(f"""
             <table class='dash-table'>
                 <thead><tr>
-                    <th>Student</th><th>Class</th><th>Today's Usage</th><th>Total</th><th>Last Active</th>
+                    <th>Student</th><th>Class</th><th>Today's Usage</th><th>Tokens Today</th><th>Total</th><th>Last Active</th>
                 </tr></thead>
                 <tbody>{table_rows}</tbody>
             </table>""", unsafe_allow_html=True)
+
+            p1, p2, p3 = st.columns([1, 3, 1])
+            if p1.button("← Prev", key="students_prev", disabled=page == 0, use_container_width=True):
+                st.session_state.students_page = page - 1
+                st.rerun()
+            p2.markdown(f"<div style='text-align:center; color:var(--text-muted); font-size:0.85rem; padding-top:0.5rem;'>"
+                        f"Page {page + 1} of {pages} · {total} student{'s' if total != 1 else ''}</div>",
+                        unsafe_allow_html=True)
+            if p3.button("Next →", key="students_next", disabled=page >= pages - 1, use_container_width=True):
+                st.session_state.students_page = page + 1
+                st.rerun()
         else:
             st.info("No students added yet. Use the 'Add Student' tab.")
 
     # ── Settings ──────────────────────────────────────────────
-    with tabs[2]:
+    with tabs[3], RENDER_SECONDS.time(view="settings"):
         st.markdown("<div class='card'><b>⚙️ School Settings</b></div>", unsafe_allow_html=True)
         with st.form("settings_form"):
-            new_school = st.text_input("School Name", value=data["settings"]["school_name"])
+            new_school = st.text_input("School Name", value=store.get_setting("school_name"))
             new_limit = st.number_input("Daily Question Limit per Student", min_value=5, max_value=200,
-                                         value=data["settings"]["daily_limit"])
+                                         value=store.get_setting("daily_limit"))
+            new_tokens = st.number_input("Daily Token Budget per Student (0 = no limit)", min_value=0,
+                                         max_value=2_000_000, step=5000,
+                                         value=store.get_setting("daily_token_limit", 0),
+                                         help="Model tokens (question + answer) a student may use per day. "
+                                              "A short answer is a few hundred tokens, an 8-mark essay a few thousand.")
             if st.form_submit_button("💾 Save Settings", use_container_width=True):
-                data["settings"]["school_name"] = new_school
-                data["settings"]["daily_limit"] = int(new_limit)
-                st.session_state.school_data = data
-                save_data(data)
+                store.update_settings(school_name=new_school, daily_limit=int(new_limit),
+                                      daily_token_limit=int(new_tokens))
                 st.success("✅ Settings saved!")
                 st.rerun()
 
@@ -1137,19 +736,21 @@ def show_teacher_dashboard():
             new_pw = st.text_input("New Password", type="password")
             conf_pw = st.text_input("Confirm New Password", type="password")
             if st.form_submit_button("🔒 Update Password", use_container_width=True):
-                if hash_password(curr_pw) != data["users"][st.session_state.username]["password"]:
-                    st.error("❌ Current password incorrect.")
-                elif new_pw != conf_pw:
-                    st.error("❌ Passwords do not match.")
-                elif len(new_pw) < 6:
-                    st.error("❌ Password must be at least 6 characters.")
-                else:
-                    data["users"][st.session_state.username]["password"] = hash_password(new_pw)
-                    save_data(data)
-                    st.success("✅ Password updated!")
+                try:
+                    if not password_hasher.check(curr_pw, store.get_user(st.session_state.username)["password"])[0]:
+                        st.error("❌ Current password incorrect.")
+                    elif new_pw != conf_pw:
+                        st.error("❌ Passwords do not match.")
+                    elif len(new_pw) < 6:
+                        st.error("❌ Password must be at least 6 characters.")
+                    else:
+                        store.update_user(st.session_state.username, password=hash_password(new_pw))
+                        st.success("✅ Password updated!")
+                except LoginBusy:
+                    st.warning(PASSWORDS_BUSY)
 
     # ── Add Student ───────────────────────────────────────────
-    with tabs[3]:
+    with tabs[4], RENDER_SECONDS.time(view="add_student"):
         st.markdown("<div class='card'><b>➕ Add New Student</b></div>", unsafe_allow_html=True)
         with st.form("add_student_form"):
             col_a, col_b = st.columns(2)
@@ -1161,15 +762,21 @@ def show_teacher_dashboard():
                 new_pw_s = st.text_input("Password", type="password", placeholder="Min 6 chars")
 
             if st.form_submit_button("➕ Add Student", use_container_width=True):
+                hashed = None
                 if not new_uname or not new_name or not new_pw_s:
                     st.error("❌ Please fill all fields.")
-                elif new_uname in data["users"]:
+                elif store.has_user(new_uname):
                     st.error("❌ Username already exists.")
                 elif len(new_pw_s) < 6:
                     st.error("❌ Password must be at least 6 characters.")
                 else:
-                    data["users"][new_uname] = {
-                        "password": hash_password(new_pw_s),
+                    try:
+                        hashed = hash_password(new_pw_s)
+                    except LoginBusy:
+                        st.warning(PASSWORDS_BUSY)
+                if hashed:
+                    added = store.add_user(new_uname, {
+                        "password": hashed,
                         "role": "student",
                         "name": new_name,
                         "class": new_class,
@@ -1177,49 +784,239 @@ def show_teacher_dashboard():
                         "total_usage": 0,
                         "last_active": "",
                         "created": str(datetime.date.today())
-                    }
-                    save_data(data)
-                    st.session_state.school_data = data
-                    st.success(f"✅ Student **{new_name}** added! Username: `{new_uname}`")
+                    })
+                    if added:
+                        st.success(f"✅ Student **{new_name}** added! Username: `{new_uname}`")
+                    else:
+                        # Another session took the username in the meantime
+                        st.error("❌ Username already exists.")
+
+        st.markdown("<div class='card'><b>📥 Bulk Import / Export</b></div>", unsafe_allow_html=True)
+        st.caption("Columns: username, name, class (1–10), password (min 6 chars). "
+                   "CSV, or XLSX if openpyxl is installed.")
+        roster_file = st.file_uploader("Student roster", type=["csv", "xlsx"], key="roster_upload")
+        skip_invalid = st.checkbox("Import valid rows even if some rows have errors", value=False)
+        if roster_file is not None and st.button("📥 Import Students", use_container_width=True):
+            try:
+                with st.spinner("Validating and importing..."):
+                    report = import_students(store, roster_file, roster_file.name, skip_invalid)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                if report.imported:
+                    st.success(f"✅ Imported {report.imported} of {report.rows} students.")
+                elif report.errors and not skip_invalid:
+                    st.warning(f"⚠️ Nothing imported: {len(report.errors)} of {report.rows} rows have errors.")
+                else:
+                    st.info("No student rows found in the file.")
+                if report.errors:
+                    st.dataframe([e._asdict() for e in report.errors[:200]], use_container_width=True)
+                    st.download_button("⬇️ Download error report", report.error_csv(),
+                                       file_name="import_errors.csv", mime="text/csv")
+
+        # Built on request only: copying every student on each rerun would undo the paging
+        if st.session_state.get("student_export") is None:
+            if st.button("📤 Prepare Student Export (CSV)", use_container_width=True):
+                st.session_state.student_export = "".join(iter_export_csv(store.users(role="student")))
+                st.rerun()
+        else:
+            st.download_button("⬇️ Download Students (CSV)", st.session_state.student_export,
+                               file_name=f"students_{datetime.date.today()}.csv", mime="text/csv",
+                               use_container_width=True,
+                               on_click=lambda: st.session_state.pop("student_export", None))
+
+    # ── System ────────────────────────────────────────────────
+    with tabs[5], RENDER_SECONDS.time(view="system"):
+        show_system()
+
+STUDENT_SORTS = {
+    "Name (A–Z)":          ("name", False),
+    "Class":               ("class", False),
+    "Today's usage ↓":     ("usage_today", True),
+    "Total questions ↓":   ("total_usage", True),
+    "Recently active":     ("last_active", True),
+}
+
+TREND_PERIODS = {
+    "Last 48 hours": ("hour", datetime.timedelta(hours=47)),
+    "Last 30 days":  ("day",  datetime.timedelta(days=29)),
+    "Last 12 weeks": ("week", datetime.timedelta(weeks=11)),
+    "Academic year": ("week", None),
+}
+
+def show_trends():
+    import pandas as pd  # ships with streamlit
+
+    rollups = store.rollups
+    col_p, col_d, col_k = st.columns(3)
+    with col_p:
+        period = st.selectbox("Period", list(TREND_PERIODS), index=1, key="trend_period")
+    with col_d:
+        group = st.selectbox("Show", ["Whole school", "Class", "Subject", "Student"], key="trend_group")
+    dim = {"Whole school": "all", "Class": "class", "Subject": "subject", "Student": "user"}[group]
+    with col_k:
+        if dim == "class":
+            key = st.selectbox("Class", [str(c) for c in range(1, 11)], key="trend_class")
+        elif dim == "subject":
+            key = st.selectbox("Subject", list(SUBJECT_KEYWORDS) + ["General"], key="trend_subject")
+        elif dim == "user":
+            key = st.selectbox("Student", sorted(store.users(role="student")), key="trend_student")
+        else:
+            key = "*"
+
+    now = datetime.datetime.now()
+    granularity, span = TREND_PERIODS[period]
+    if span is None:
+        # Telangana academic year starts in June
+        year = now.year if now.month >= 6 else now.year - 1
+        start_dt = datetime.datetime(year, 6, 1)
+    else:
+        start_dt = now - span
+    buckets = bucket_range(granularity, start_dt, now)
+
+    t0 = time.perf_counter()
+    per_type = rollups.by_type(granularity, dim, key, buckets[0], buckets[-1])
+    classes = rollups.breakdown(granularity, "class", buckets[0], buckets[-1])
+    subjects = rollups.breakdown(granularity, "subject", buckets[0], buckets[-1])
+    spend = rollups.tokens(granularity, "class", buckets[0], buckets[-1])
+    query_ms = (time.perf_counter() - t0) * 1000
+
+    chart = pd.DataFrame({
+        "⌨️ Text":  [per_type.get(b, {}).get("text", 0) for b in buckets],
+        "🎙️ Voice": [per_type.get(b, {}).get("voice", 0) for b in buckets],
+    }, index=buckets)
+    st.markdown(f"<div class='card'><b>📉 Questions per {granularity}</b> · {group}{'' if key == '*' else ' · ' + key}</div>",
+                unsafe_allow_html=True)
+    st.bar_chart(chart)
+
+    col_c, col_s = st.columns(2)
+    with col_c:
+        st.markdown("**By class**")
+        classes.pop("N/A", None)
+        if classes:
+            st.bar_chart(pd.DataFrame({"Questions": list(classes.values())},
+                                      index=[f"Class {c}" for c in classes]))
+        else:
+            st.info("No student activity in this period.")
+    with col_s:
+        st.markdown("**By subject**")
+        if subjects:
+            st.bar_chart(pd.DataFrame({"Questions": list(subjects.values())}, index=list(subjects)))
+        else:
+            st.info("No activity in this period.")
+
+    st.markdown("<div class='card'><b>💰 Model usage by class</b> · estimated at "
+                f"${PRICE_PER_M_INPUT:g} / ${PRICE_PER_M_OUTPUT:g} per million tokens in / out</div>",
+                unsafe_allow_html=True)
+    spend.pop("N/A", None)
+    if any(p or c for _, p, c in spend.values()):
+        table_rows = ""
+        totals = [0, 0, 0]
+        for cls, (n, prompt_t, completion_t) in spend.items():
+            totals = [totals[0] + n, totals[1] + prompt_t, totals[2] + completion_t]
+            table_rows += f"""<tr>
+                <td>Class {cls}</td><td>{n}</td><td>{prompt_t:,}</td><td>{completion_t:,}</td>
+                <td>{(prompt_t + completion_t) // max(1, n):,}</td>
+                <td><b>${token_cost(prompt_t, completion_t):.2f}</b></td>
+            </tr>"""
+        st.markdown(f"""
+        <table class='dash-table'>
+            <thead><tr>
+                <th>Class</th><th>Questions</th><th>Prompt Tokens</th><th>Answer Tokens</th>
+                <th>Tokens / Question</th><th>Est. Cost</th>
+            </tr></thead>
+            <tbody>{table_rows}</tbody>
+        </table>""", unsafe_allow_html=True)
+        st.caption(f"All classes: {totals[1] + totals[2]:,} tokens for {totals[0]} questions · "
+                   f"≈ \\${token_cost(totals[1], totals[2]):.2f}. Cached answers use no tokens.")
+    else:
+        st.info("No model usage recorded in this period.")
+    st.caption(f"{int(chart.values.sum())} questions · {len(buckets)} buckets · queried in {query_ms:.1f} ms")
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "—"
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.1f} s"
+
+def show_system():
+    # This app process only (every school it serves); the same numbers
+    # Prometheus scrapes from METRICS_PORT
+    questions = QUESTION_SECONDS.series()
+    asked = sum(count for _, _, count in questions.values())
+    overall = [sum(col) for col in zip(*(c for c, _, _ in questions.values()))]
+    lookups = {r: CACHE_LOOKUPS.value(result=r) for r in ("hit", "miss", "skip")}
+    cacheable = lookups["hit"] + lookups["miss"]
+    queue = llm_queue.stats()
+    rate = LLM_TOKENS_PER_SECOND.series().get(())
+    tokens_per_sec = LLM_TOKENS_PER_SECOND.quantile(0.5, rate[0]) if rate else None
+
+    cards = [
+        (asked, "Questions Handled"),
+        (format_seconds(QUESTION_SECONDS.quantile(0.95, overall)), "p95 Question Time"),
+        (f"{lookups['hit'] / cacheable:.0%}" if cacheable else "—", "Cache Hit Rate"),
+        (f"{queue['queued']} / {queue['running']}", f"Queued / Running ({queue['workers']} workers)"),
+        (f"{tokens_per_sec:.0f}" if tokens_per_sec else "—", "Median Tokens / Sec"),
+    ]
+    for col, (value, label) in zip(st.columns(len(cards)), cards):
+        col.markdown(f"""<div class="stat-card">
+            <div class="stat-number">{value}</div>
+            <div class="stat-label">{label}</div>
+        </div>""", unsafe_allow_html=True)
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown("<div class='card'><b>⏱️ Latency</b></div>", unsafe_allow_html=True)
+    table_rows = ""
+    for title, histogram in (("Question", QUESTION_SECONDS), ("Step", STAGE_SECONDS), ("Dashboard", RENDER_SECONDS)):
+        for (label,), (cumulative, total, count) in histogram.series().items():
+            table_rows += f"""<tr>
+                <td>{title} · <b>{label}</b></td><td>{count}</td><td>{format_seconds(total / count)}</td>
+                <td>{format_seconds(histogram.quantile(0.5, cumulative))}</td>
+                <td>{format_seconds(histogram.quantile(0.95, cumulative))}</td>
+                <td>{format_seconds(histogram.quantile(0.99, cumulative))}</td>
+            </tr>"""
+    if table_rows:
+        st.markdown(f"""
+        <table class='dash-table'>
+            <thead><tr>
+                <th>Timer</th><th>Count</th><th>Mean</th><th>p50</th><th>p95</th><th>p99</th>
+            </tr></thead>
+            <tbody>{table_rows}</tbody>
+        </table>""", unsafe_allow_html=True)
+    else:
+        st.info("Nothing timed yet on this server.")
+
+    logins = " · ".join(f"{r}: {LOGINS.value(result=r)}" for r in ("ok", "failed", "locked", "busy"))
+    st.caption(f"🔢 Model tokens — {LLM_TOKENS.value(kind='prompt'):,} prompt · "
+               f"{LLM_TOKENS.value(kind='completion'):,} completion  \n"
+               f"🗂️ Answer cache — {lookups['hit']} hits · {lookups['miss']} misses · "
+               f"{lookups['skip']} not cacheable · {answer_cache.stats()['entries']} entries  \n"
+               f"🔑 Sign-ins — {logins}")
+    if metrics_server is not None:
+        st.caption(f"📡 Prometheus endpoint: port {metrics_server.server_address[1]}, path /metrics. "
+                   "Each app replica reports its own numbers.")
+    elif metrics_error:
+        st.warning(f"📡 Prometheus endpoint not started. {metrics_error}")
+    else:
+        st.caption("📡 Set METRICS_PORT to serve these numbers at /metrics for Prometheus.")
+    with st.expander("Raw metrics"):
+        st.code(REGISTRY.render(), language="text")
 
 # ═══════════════════════════════════════════════════════════════
 # 11. STUDENT CHAT PAGE
 # ═══════════════════════════════════════════════════════════════
 def show_chat():
-    school = data["settings"]["school_name"]
+    school = store.get_setting("school_name")
     student_name = st.session_state.user_name
     student_class = st.session_state.user_class
     username = st.session_state.username
-    daily_limit = data["settings"]["daily_limit"]
-
-    # ── Listen for postMessage from voice component ───────────
-    # Injected listener that writes to a hidden text area
-    st.markdown("""
-    <script>
-    window.addEventListener('message', function(e) {
-        if (e.data && e.data.type === 'voice_transcript') {
-            var inp = window.parent.document.querySelector('[data-testid="stTextInput"] input');
-            if (!inp) {
-                var inputs = window.parent.document.querySelectorAll('input[type="text"]');
-                inp = inputs[inputs.length - 1];
-            }
-            if (inp) {
-                var nativeInputValueSetter = Object.getOwnPropertyDescriptor(window.HTMLInputElement.prototype, 'value').set;
-                nativeInputValueSetter.call(inp, e.data.text);
-                inp.dispatchEvent(new Event('input', { bubbles: true }));
-            }
-        }
-    });
-    </script>
-    """, unsafe_allow_html=True)
+    daily_limit = store.get_setting("daily_limit")
 
     # ── Sidebar ──────────────────────────────────────────────
     with st.sidebar:
         st.markdown(f"<div style='text-align:center; padding:1rem 0;'><div style='font-size:2.5rem;'>🎓</div><div style='font-weight:700; font-size:1.1rem;'>{school}</div><div style='color:var(--text-muted); font-size:0.82rem;'>Smart Tutor · 2025-26</div></div>", unsafe_allow_html=True)
         st.divider()
 
-        user = data["users"].get(username, {})
-        used_today = user.get("usage_today", 0) if user.get("last_active_date","") == str(datetime.date.today()) else 0
+        used_today = store.usage_today(username)
         pct = min(100, int(used_today / daily_limit * 100))
         bar_color = "#22D3A5" if pct < 70 else "#F59E0B" if pct < 90 else "#EF4444"
 
@@ -1288,10 +1085,22 @@ def show_chat():
 
         if st.button("🗑️ Clear Chat", use_container_width=True):
             st.session_state.messages = []
+            st.session_state.context_summary.reset()
             st.rerun()
 
+        if st.session_state.cache_status:
+            cs = answer_cache.stats()
+            label = {"hit": "⚡ cached answer", "miss": "🌐 fresh answer", "skip": "🌐 follow-up, not cached"}
+            st.caption(f"{label[st.session_state.cache_status]} · cache hit rate {cs['hit_rate']:.0%} "
+                       f"({cs['hits']}/{cs['hits'] + cs['misses']})")
+
+        ctx = st.session_state.context_stats
+        if ctx:
+            st.caption(f"🧮 Last request: ~{ctx['total_tokens']:,} tokens · "
+                       f"{ctx['kept_messages']} recent msgs · {ctx['summarized_messages']} summarized")
+
     # ── Main Chat Area ────────────────────────────────────────
-    used_today = data["users"].get(username, {}).get("usage_today", 0) if data["users"].get(username, {}).get("last_active_date","") == str(datetime.date.today()) else 0
+    used_today = store.usage_today(username)
     pct_main = min(100, int(used_today / daily_limit * 100))
     badge_cls = "badge-green" if pct_main < 70 else "badge-yellow" if pct_main < 90 else "badge-red"
 
@@ -1311,7 +1120,7 @@ def show_chat():
     """, unsafe_allow_html=True)
 
     # Usage limit warning
-    if not check_usage_limit(data, username):
+    if not check_usage_limit(store, username):
         st.markdown(f"""
         <div style='background:rgba(239,68,68,0.1); border:1px solid #EF4444; border-radius:12px; padding:1rem; margin-bottom:1rem; text-align:center;'>
             <div style='font-size:1.5rem;'>⏸️</div>
@@ -1337,14 +1146,35 @@ def show_chat():
                     st.session_state["last_spoken_idx"] = last_ai_idx
                 break
 
-    # Render voice component (real iframe = microphone access works)
-    voice_html = get_voice_html(
-        lang_code       = st.session_state.voice_lang,
-        gender          = st.session_state.voice_gender,
-        auto_speak_text = speak_content,
-        countdown_seconds = 9
+    # Audio uploaded by the component (server-side STT) is in its widget
+    # state before it renders, so partial transcripts go out with this run
+    stt_args = handle_voice_audio(st.session_state.get("voice_widget"), username,
+                                  st.session_state.voice_lang)
+
+    # Server-side TTS: clips for the new answer (mostly synthesized while it
+    # streamed; cached answers and repeated sentences come straight from disk)
+    speak_items, speak_pending = None, False
+    if speech_synth and speak_content:
+        speak_items = speech_items(st.session_state["last_spoken_idx"], speak_content, final=True)
+        speak_pending = len(speak_items) < len(st.session_state.tts_answer["clips"])
+
+    # Render voice component (mounted once; reruns only update its args)
+    voice = voice_widget(
+        lang_code         = st.session_state.voice_lang,
+        gender            = st.session_state.voice_gender,
+        speak_text        = speak_content,
+        speak_id          = st.session_state.get("last_spoken_idx", 0),
+        countdown_seconds = 9,
+        auto_speak        = st.session_state.auto_speak,
+        stt               = stt_args,
+        speak_items       = speak_items,
+        speak_pending     = speak_pending
     )
-    components.html(voice_html, height=260, scrolling=False)
+    # The component keeps returning its last value, so only act on a new id
+    voice_question = None
+    if voice and voice.get("kind") == "text" and voice.get("id") != st.session_state.get("voice_handled_id"):
+        st.session_state.voice_handled_id = voice.get("id")
+        voice_question = (voice.get("text") or "").strip()
 
     st.caption("💡 **How to use:** Tap blue button → speak → wait 9 seconds (auto-sends) or click ✅ Send. Works on Chrome & Android.")
 
@@ -1360,22 +1190,18 @@ def show_chat():
             </div>""", unsafe_allow_html=True)
         else:
             for i, msg in enumerate(st.session_state.messages):
-                if msg["role"] == "user":
-                    icon = "🎙️" if msg.get("type") == "voice" else "⌨️"
-                    st.markdown(f"""
-                    <div class='chat-user'>{icon} {msg['content']}<div class='chat-meta'>{msg.get('time','')}</div></div>
-                    <div class='chat-clear'></div>""", unsafe_allow_html=True)
-                elif msg["role"] == "assistant":
-                    st.markdown(f"""
-                    <div class='chat-ai'>🎓 {msg['content']}
-                        <div class='chat-meta'>{msg.get('time','')}</div>
-                    </div>
-                    <div class='chat-clear'></div>""", unsafe_allow_html=True)
+                if msg["role"] in ("user", "assistant"):
+                    st.markdown(chat_bubble_html(msg), unsafe_allow_html=True)
 
     # ── Text Input ────────────────────────────────────────────
     st.markdown("<br>", unsafe_allow_html=True)
 
-    if check_usage_limit(data, username):
+    if check_usage_limit(store, username):
+        if voice_question:
+            process_message(voice_question, "voice", store, username, student_name, student_class, school,
+                            container=chat_container)
+            st.rerun()
+
         with st.form("chat_form", clear_on_submit=True):
             col_inp, col_btn = st.columns([5, 1])
             with col_inp:
@@ -1388,7 +1214,8 @@ def show_chat():
                 send = st.form_submit_button("Send ➤", use_container_width=True)
 
             if send and user_input.strip():
-                process_message(user_input.strip(), "text", data, username, student_name, student_class, school)
+                process_message(user_input.strip(), "text", store, username, student_name, student_class, school,
+                                container=chat_container)
                 st.rerun()
     else:
         st.info(f"⏸️ Daily limit of {daily_limit} questions reached. See you tomorrow!")
@@ -1404,40 +1231,178 @@ def show_chat():
 # ═══════════════════════════════════════════════════════════════
 # 12. MESSAGE PROCESSOR
 # ═══════════════════════════════════════════════════════════════
-def process_message(user_text, msg_type, data, username, student_name, student_class, school):
-    if not client:
+def chat_bubble_html(msg, streaming=False):
+    if msg["role"] == "user":
+        icon = "🎙️" if msg.get("type") == "voice" else "⌨️"
+        return f"""
+        <div class='chat-user'>{icon} {msg['content']}<div class='chat-meta'>{msg.get('time','')}</div></div>
+        <div class='chat-clear'></div>"""
+    cursor = " ▌" if streaming else ""
+    return f"""
+    <div class='chat-ai'>🎓 {msg['content']}{cursor}
+        <div class='chat-meta'>{msg.get('time','')}</div>
+    </div>
+    <div class='chat-clear'></div>"""
+
+def tts_stream_html(speak_id, text):
+    # Hidden copy of the raw streaming text for the voice component, which
+    # starts speaking complete sentences before the answer has finished.
+    # With server-side TTS it carries the ready sentence clips instead.
+    if speech_synth:
+        attr = "data-items", json.dumps(speech_items(speak_id, text))
+    else:
+        attr = "data-text", text
+    data = html.escape(attr[1], quote=True).replace("\n", "&#10;")
+    return f"<div class='tts-stream' data-tts-id='{speak_id}' {attr[0]}=\"{data}\" style='display:none'></div>"
+
+def run_completion(api_messages, job):
+    """
+    Runs on an LLM worker thread. Streams deltas into the job when
+    STREAM_RESPONSES is on. Returns (completion, complete).
+    """
+    params = dict(max_completion_tokens=4096, temperature=0.6, top_p=0.9)
+    if not STREAM_RESPONSES:
+        return provider.complete(api_messages, **params), True
+
+    try:
+        return provider.stream(api_messages, job.emit, **params), True
+    except Exception as e:
+        if not job.chunks:
+            raise
+        # Keep what already arrived rather than discarding a half-read answer
+        job.emit(f"\n\n⚠️ The response was interrupted: {str(e)}")
+        return Completion(job.text, {}, None), False
+
+def wait_for_job(job, placeholder):
+    """Poll a queued job, showing its place in line and then the streamed text."""
+    last_paint = 0.0
+    while not job.wait(STREAM_RENDER_INTERVAL):
+        if time.monotonic() - last_paint < STREAM_RENDER_INTERVAL:
+            continue
+        if job.state == "queued":
+            pos = llm_queue.position(job)
+            status = f"⏳ Many students are asking right now. You're #{pos} in line..." if pos > 1 else "⏳ Thinking..."
+            placeholder.markdown(chat_bubble_html({"role": "assistant", "content": status}), unsafe_allow_html=True)
+        elif job.state == "retrying":
+            placeholder.markdown(chat_bubble_html(
+                {"role": "assistant", "content": "⏳ The tutor is busy, trying again in a moment..."}), unsafe_allow_html=True)
+        elif job.chunks:
+            bubble = chat_bubble_html({"role": "assistant", "content": job.text}, streaming=True)
+            if st.session_state.auto_speak:
+                # Same id the finished answer gets as speak_id (its message index + 1)
+                bubble += tts_stream_html(len(st.session_state.messages) + 1, job.text)
+            placeholder.markdown(bubble, unsafe_allow_html=True)
+        last_paint = time.monotonic()
+
+def process_message(user_text, msg_type, store, username, student_name, student_class, school, container=None):
+    started = time.perf_counter()
+    outcome = answer_question(user_text, msg_type, store, username, student_name, student_class, school, container)
+    QUESTION_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+
+def answer_question(user_text, msg_type, store, username, student_name, student_class, school, container=None):
+    """Ask, answer and log one question; returns its outcome for the metrics."""
+    if not provider:
         st.error("⚠️ API Key not found. Please check your .env file.")
-        return
+        return "unavailable"
 
     now = datetime.datetime.now().strftime("%I:%M %p")
 
-    # Add user message
-    st.session_state.messages.append({
+    user_msg = {
         "role": "user",
         "content": user_text,
         "type": msg_type,
         "time": now
-    })
-
-    # Build message list for API (without custom fields)
-    system_prompt = build_system_prompt(school, student_name, student_class)
-    api_messages = [{"role": "system", "content": system_prompt}]
-    for m in st.session_state.messages:
-        if m["role"] in ("user", "assistant"):
-            api_messages.append({"role": m["role"], "content": m["content"]})
+    }
 
+    started = time.perf_counter()
+    subject = detect_subject(user_text)
+    version = prompt_version(student_class, subject)
+    cacheable = is_cacheable(user_text)
+    answer = answer_cache.get(student_class, user_text, version, tenant=TENANT) if cacheable else None
+    st.session_state.cache_status = ("hit" if answer else "miss") if cacheable else "skip"
+    CACHE_LOOKUPS.inc(result=st.session_state.cache_status)
+
+    if answer:
+        # Served from the shared cache: no API call, but still counted below
+        admission = admit_question(store, username, student_class)
+        if not admission.ok:
+            st.warning(limit_message(admission))
+            return "limited"
+        st.session_state.messages.append(user_msg)
+        with (container or st.container()):
+            st.markdown(chat_bubble_html(user_msg), unsafe_allow_html=True)
+        finish_message(answer, store, username, msg_type, user_text, subject,
+                       usage={"prompt_tokens": 0, "completion_tokens": 0, "cached": True,
+                              "latency_ms": round((time.perf_counter() - started) * 1000)})
+        return "cached"
+
+    # Recent turns verbatim + rolling summary, kept under the token budget
+    with STAGE_SECONDS.time(stage="prompt_build"):
+        # Answers that may be cached are shared with the class: don't name the student
+        system_prompt = build_system_prompt(school, None if cacheable else student_name, student_class, subject)
+        api_messages, ctx_stats = context_builder.build(
+            system_prompt, st.session_state.messages + [user_msg], st.session_state.context_summary)
+
+    admission = admit_question(store, username, student_class,
+                               api_tokens=ctx_stats["total_tokens"] + ANSWER_TOKENS_ESTIMATE)
+    if not admission.ok:
+        st.warning(limit_message(admission))
+        return "limited"
     try:
-        response = client.chat.completions.create(
-            model="moonshotai/kimi-k2-instruct-0905",
-            messages=api_messages,
-            max_completion_tokens=4096,
-            temperature=0.6,
-            top_p=0.9
-        )
-        answer = response.choices[0].message.content or "I apologize, I couldn't generate a response. Please try again."
-    except Exception as e:
-        answer = f"⚠️ An error occurred: {str(e)}\n\nPlease check your API key and internet connection."
-
+        job = llm_queue.submit(user_key(username), lambda job: run_completion(api_messages, job))
+    except UserBusy:
+        admission.refund()
+        st.warning("⏳ Your previous question is still being answered. Please wait for it to finish.")
+        return "busy"
+    except QueueFull:
+        admission.refund()
+        st.warning("🚦 The tutor is answering a lot of questions right now. Please try again in a minute.")
+        return "busy"
+
+    # Only a question that made it into the queue becomes part of the conversation
+    st.session_state.messages.append(user_msg)
+    st.session_state.context_stats = ctx_stats
+
+    with (container or st.container()):
+        st.markdown(chat_bubble_html(user_msg), unsafe_allow_html=True)
+        placeholder = st.empty()
+        placeholder.markdown(chat_bubble_html(
+            {"role": "assistant", "content": "", "time": ""}, streaming=True), unsafe_allow_html=True)
+    wait_for_job(job, placeholder)
+
+    usage = call_usage(job, job.result[0] if job.state == "done" else None)
+    observe_model_call(job, usage)
+    if job.state == "done":
+        completion, complete = job.result
+        admission.settle(completion.usage)
+        answer = completion.text
+        if answer and complete and cacheable and not mentions_name(answer, student_name):
+            answer_cache.put(student_class, user_text, answer, version, tenant=TENANT)
+        answer = answer or "I apologize, I couldn't generate a response. Please try again."
+    elif is_rate_limited(job.error):
+        admission.settle({"total_tokens": 0})
+        answer = "⏳ The tutor is handling a lot of questions right now and couldn't answer in time. Please ask again in a minute."
+    else:
+        # No answer came back: give the reserved student and API tokens back
+        admission.settle({"total_tokens": 0})
+        answer = f"⚠️ An error occurred: {str(job.error)}\n\nPlease check your API key and internet connection."
+
+    finish_message(answer, store, username, msg_type, user_text, subject, usage)
+    return "answered" if job.state == "done" else "error"
+
+def call_usage(job, completion=None):
+    """Tokens and timings of one model call, as stored on its log entry."""
+    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    if completion is not None:
+        usage.update({k: v for k, v in completion.usage.items() if k != "total_tokens"})
+    usage["latency_ms"] = round((job.finished_at - job.submitted_at) * 1000)
+    if job.started_at is not None:
+        usage["queue_ms"] = round((job.started_at - job.submitted_at) * 1000)
+    usage["model"] = provider.model
+    return usage
+
+def finish_message(answer, store, username, msg_type, user_text, subject, usage=None):
+    # Persist the final message once, after the stream has finished
     st.session_state.messages.append({
         "role": "assistant",
         "content": answer,
@@ -1445,11 +1410,13 @@ def process_message(user_text, msg_type, data, username, student_name, student_c
     })
 
     # Log interaction
-    st.session_state.school_data = log_interaction(
-        st.session_state.school_data,
+    log_interaction(
+        store,
         username,
         msg_type,
-        user_text[:50]
+        user_text[:50],
+        subject,
+        usage=usage
     )
 
 # ═══════════════════════════════════════════════════════════════
@@ -0,0 +1,156 @@
+"""
+Static assets: theme CSS, fonts and the login background.
+
+Sources live in assets/. build() writes them to static/ under content-hash
+names (theme.3f9a1c2e.css, classroom_bg.8d01b7aa.webp, …), so every page
+load after the first is served from the browser cache and a change to a
+source file gets a new URL instead of a stale copy:
+
+    python assets.py build          # also runs automatically at app start
+    python assets.py fetch-fonts    # self-host Outfit / JetBrains Mono
+
+Images and fonts are served by Streamlit's static file handler at
+app/static/<name>?v=<hash>, which answers a versioned URL with a ten-year
+max-age. The stylesheet is served from the same folder through a component
+route because the static handler only sends proper MIME types for images,
+fonts and a few other types, and browsers refuse a text/plain stylesheet.
+
+With Pillow installed the background also gets a WebP copy (about a fifth
+of the JPEG), offered first through image-set(). Without it the JPEG is used.
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+SOURCE_DIR = ROOT / "assets"
+STATIC_DIR = ROOT / "static"
+FONT_DIR = SOURCE_DIR / "fonts"
+
+FONTS_URL = ("https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;500;600;700;800"
+             "&family=JetBrains+Mono:wght@400;500&display=swap")
+# Google Fonts only returns woff2 to browsers it recognises
+FONTS_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120 Safari/537.36"
+WEBP_QUALITY = 72
+
+STATIC_URL = "../../app/static/"   # from component/<name>/ back to the app root
+HASHED_RE = re.compile(r"^(.+)\.[0-9a-f]{10}\.(\w+)$")
+ASSET_RE = re.compile(r"""url\((["']?)asset:([\w./-]+)\1\)""")
+IMPORT_RE = re.compile(r"@import url\([^)]*fonts\.googleapis\.com[^)]*\);\n?")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _write(name, data):
+    path = STATIC_DIR / name
+    if not path.exists():
+        tmp = path.with_name(f".tmp-{os.getpid()}-{name}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    return name
+
+
+def _publish(path):
+    """Copy a source file to static/ under its hashed name; (name, digest)."""
+    data = path.read_bytes()
+    digest = _digest(data)
+    return _write(f"{path.stem}.{digest}{path.suffix}", data), digest
+
+
+def _webp(path, digest):
+    try:
+        from PIL import Image  # optional dependency
+    except ImportError:
+        return None
+    # Named after the source JPEG's hash so the encode is skipped on restart
+    name = f"{path.stem}.{digest}.webp"
+    if not (STATIC_DIR / name).exists():
+        with Image.open(path) as img:
+            tmp = STATIC_DIR / f".tmp-{os.getpid()}-{name}"
+            img.convert("RGB").save(tmp, "WEBP", quality=WEBP_QUALITY, method=6)
+            os.replace(tmp, STATIC_DIR / name)
+    return name
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def build():
+    """Publish everything under assets/ to static/; returns the manifest."""
+    STATIC_DIR.mkdir(exist_ok=True)
+    files = {}       # logical name -> hashed file in static/
+    for path in sorted(SOURCE_DIR.glob("*")):
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png"):
+            name, digest = _publish(path)
+            files[path.name] = name
+            webp = _webp(path, digest)
+            if webp:
+                files[f"{path.stem}.webp"] = webp
+
+    css = (SOURCE_DIR / "theme.css").read_text(encoding="utf-8")
+    fonts_css = FONT_DIR / "fonts.css"
+    if fonts_css.exists():
+        local = fonts_css.read_text(encoding="utf-8")
+        for font in sorted(FONT_DIR.glob("*.woff2")):
+            files[f"fonts/{font.name}"] = _publish(font)[0]
+        css = IMPORT_RE.sub(lambda _: local + "\n", css)
+
+    def url(m):
+        name = m.group(2)
+        # No WebP without Pillow: image-set() falls back to the JPEG twice
+        if name not in files and name.endswith(".webp"):
+            name = name[:-5] + ".jpg"
+        hashed = files[name]
+        return f'url("{STATIC_URL}{hashed}?v={hashed.split(".")[-2]}")'
+
+    css = minify_css(ASSET_RE.sub(url, css)).encode()
+    files["theme.css"] = _write(f"theme.{_digest(css)}.css", css)
+
+    keep = set(files.values()) | {"manifest.json"}
+    for path in STATIC_DIR.iterdir():
+        if path.name not in keep and HASHED_RE.match(path.name):
+            path.unlink()
+    manifest = {"files": files}
+    (STATIC_DIR / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def stylesheet_tag(manifest, component):
+    """<link> for the theme, served through the `component` route over static/."""
+    return f'<link rel="stylesheet" href="component/{component}/{manifest["files"]["theme.css"]}">'
+
+
+def fetch_fonts():
+    """Download the Google Fonts woff2 files so the app no longer needs fonts.googleapis.com."""
+    FONT_DIR.mkdir(exist_ok=True)
+    req = urllib.request.Request(FONTS_URL, headers={"User-Agent": FONTS_AGENT})
+    css = urllib.request.urlopen(req, timeout=30).read().decode()
+    for i, src in enumerate(dict.fromkeys(re.findall(r"url\((https://[^)]+\.woff2)\)", css))):
+        family = re.findall(r"font-family: '([^']+)'", css[:css.index(src)])[-1]
+        name = f"{family.replace(' ', '')}-{i}.woff2"
+        (FONT_DIR / name).write_bytes(urllib.request.urlopen(src, timeout=30).read())
+        css = css.replace(f"url({src})", f'url("asset:fonts/{name}")')
+    (FONT_DIR / "fonts.css").write_text(css, encoding="utf-8")
+    print(f"Saved {len(list(FONT_DIR.glob('*.woff2')))} font files to {FONT_DIR}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "fetch-fonts":
+        fetch_fonts()
+    elif command == "build":
+        for logical, name in build()["files"].items():
+            print(f"{logical:28} static/{name}  {(STATIC_DIR / name).stat().st_size:>8} bytes")
+    else:
+        sys.exit("usage: python assets.py [build|fetch-fonts]")
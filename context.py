@@ -0,0 +1,129 @@
+"""
+Conversation context for each model request.
+
+The last `max_turns` exchanges are sent verbatim, trimmed further if they
+would push the request past `token_budget`. Everything older is folded into
+a rolling summary that is produced in a background thread, so building the
+context never waits on the model. Token counts are estimated locally
+(about four characters per token), which is close enough for budgeting.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4  # role markers etc. per chat message
+
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-summary")
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def message_tokens(msg):
+    return estimate_tokens(msg.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+class RollingSummary:
+    """
+    Per-conversation summary of turns that fell out of the window.
+    `covered` is how many history messages the summary already includes.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.covered = 0
+        self._future = None
+        self._generation = 0        # bumped by reset(); older folds are dropped
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._future is not None and not self._future.done()
+
+    def reset(self):
+        with self._lock:
+            self.text = ""
+            self.covered = 0
+            self._generation += 1
+            if self._future is not None:
+                self._future.cancel()
+            self._future = None
+
+    def schedule(self, messages, upto, summarize):
+        """Fold messages[covered:upto] into the summary in the background."""
+        with self._lock:
+            if self.pending or upto <= self.covered:
+                return
+            previous, start = self.text, self.covered
+            batch = [{"role": m["role"], "content": m["content"]} for m in messages[start:upto]]
+            self._future = _summary_pool.submit(self._fold, previous, batch, upto, summarize,
+                                                self._generation)
+
+    def _fold(self, previous, batch, upto, summarize, generation):
+        try:
+            text = summarize(previous, batch)
+        except Exception:
+            return  # keep the old summary; the next request will retry
+        with self._lock:
+            if generation == self._generation and upto > self.covered:
+                self.text = (text or "").strip()
+                self.covered = upto
+
+
+class ContextBuilder:
+    def __init__(self, max_turns=6, token_budget=6000, summarize=None):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summarize = summarize
+
+    def build(self, system_prompt, messages, summary=None):
+        """
+        Returns (api_messages, stats). `messages` is the chat history in
+        session format; only user/assistant entries are sent.
+        """
+        history = [m for m in messages if m.get("role") in ("user", "assistant")]
+        system_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        summary_text = summary.text if summary else ""
+        summary_tokens = estimate_tokens(summary_text) + MESSAGE_OVERHEAD_TOKENS if summary_text else 0
+
+        # Newest first: keep whole messages while they fit the window and budget
+        remaining = self.token_budget - system_tokens - summary_tokens
+        kept = []
+        for m in reversed(history[-self.max_turns * 2:]):
+            cost = message_tokens(m)
+            if kept and cost > remaining:
+                break
+            kept.append(m)
+            remaining -= cost
+        kept.reverse()
+        cutoff = len(history) - len(kept)
+
+        if summary is not None and self.summarize and cutoff > summary.covered:
+            summary.schedule(history, cutoff, self.summarize)
+
+        api_messages = [{"role": "system", "content": system_prompt}]
+        if summary_text:
+            api_messages.append({
+                "role": "system",
+                "content": "Summary of the earlier part of this conversation:\n" + summary_text
+            })
+        api_messages.extend({"role": m["role"], "content": m["content"]} for m in kept)
+
+        history_tokens = sum(message_tokens(m) for m in kept)
+        stats = {
+            "system_tokens": system_tokens,
+            "summary_tokens": summary_tokens,
+            "history_tokens": history_tokens,
+            "total_tokens": system_tokens + summary_tokens + history_tokens,
+            "kept_messages": len(kept),
+            "summarized_messages": summary.covered if summary else 0,
+            "dropped_messages": cutoff - (min(summary.covered, cutoff) if summary else 0),
+        }
+        return api_messages, stats
+
+
+def format_transcript(messages):
+    return "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
@@ -0,0 +1,194 @@
+"""
+Append-only interaction log stored as JSON-Lines segment files.
+
+One segment per day (interactions-YYYY-MM-DD.jsonl), rolled over to a
+numbered part when it grows past max_segment_bytes. Writes go to an open
+handle and are fsynced in batches. Sealed segments older than
+compress_after_days are gzipped in place by compact().
+"""
+import os
+import io
+import gzip
+import json
+import time
+import datetime
+import threading
+from pathlib import Path
+
+SEGMENT_PREFIX = "interactions-"
+
+
+def _segment_sort_key(path):
+    # interactions-2025-06-01.jsonl, interactions-2025-06-01.2.jsonl(.gz)
+    stem = path.name[len(SEGMENT_PREFIX):].split(".jsonl")[0]
+    day, _, part = stem.partition(".")
+    return day, int(part or 0)
+
+
+class SegmentedLog:
+    def __init__(self, directory="logs", fsync_every=20, fsync_interval=2.0,
+                 max_segment_bytes=16 * 1024 * 1024, compress_after_days=7,
+                 retain_days=None):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.compress_after_days = compress_after_days
+        self.retain_days = retain_days
+        self._lock = threading.Lock()
+        self._fh = None
+        self._fh_path = None
+        self._fh_day = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    # ── Segment bookkeeping ──────────────────────────────────
+    def segments(self):
+        """All segment files, oldest first."""
+        paths = [p for p in self.dir.iterdir()
+                 if p.name.startswith(SEGMENT_PREFIX) and (p.suffix == ".jsonl" or p.name.endswith(".jsonl.gz"))]
+        return sorted(paths, key=_segment_sort_key)
+
+    def _segments_for_day(self, day):
+        return [p for p in self.segments() if _segment_sort_key(p)[0] == day]
+
+    def _open_segment(self, day):
+        self._close_handle()
+        parts = self._segments_for_day(day)
+        path = parts[-1] if parts else self.dir / f"{SEGMENT_PREFIX}{day}.jsonl"
+        # Never reopen a compressed or full segment; start the next part instead
+        if parts and (path.suffix != ".jsonl" or path.stat().st_size >= self.max_segment_bytes):
+            path = self.dir / f"{SEGMENT_PREFIX}{day}.{_segment_sort_key(path)[1] + 1}.jsonl"
+        self._fh = open(path, "a", encoding="utf-8")
+        self._fh_path = path
+        self._fh_day = day
+
+    def _close_handle(self):
+        if self._fh is not None:
+            self._sync()
+            self._fh.close()
+            self._fh = None
+            self._fh_path = None
+            self._fh_day = None
+
+    def _sync(self):
+        if self._fh is not None and self._pending:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    # ── Writing ──────────────────────────────────────────────
+    def append(self, entry):
+        day = entry.get("date") or str(datetime.date.today())
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            rolled = self._fh is not None and self._fh_day != day
+            if self._fh is None or self._fh_day != day or self._fh.tell() >= self.max_segment_bytes:
+                self._open_segment(day)
+            self._fh.write(line)
+            self._pending += 1
+            if (self._pending >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            else:
+                self._fh.flush()
+        if rolled:
+            self.compact()
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._close_handle()
+
+    # ── Reading ──────────────────────────────────────────────
+    @staticmethod
+    def _open_read(path):
+        if path.name.endswith(".gz"):
+            return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
+        return open(path, "r", encoding="utf-8")
+
+    @staticmethod
+    def _parse(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None  # torn final line after a crash
+
+    def iter_entries(self, day=None):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+            paths = self._segments_for_day(day) if day else self.segments()
+        for path in paths:
+            with self._open_read(path) as f:
+                for line in f:
+                    entry = self._parse(line)
+                    if entry is not None:
+                        yield entry
+
+    def count(self, day):
+        return sum(1 for _ in self.iter_entries(day))
+
+    def tail(self, limit=20, block_size=64 * 1024):
+        """Newest-first last `limit` entries, read backwards from the newest segments."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+            paths = self.segments()
+        out = []
+        for path in reversed(paths):
+            if path.name.endswith(".gz"):
+                with self._open_read(path) as f:
+                    lines = f.readlines()
+            else:
+                lines = self._read_tail_lines(path, limit - len(out), block_size)
+            for line in reversed(lines):
+                entry = self._parse(line)
+                if entry is not None:
+                    out.append(entry)
+                    if len(out) >= limit:
+                        return out
+        return out
+
+    @staticmethod
+    def _read_tail_lines(path, want, block_size):
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            buf = b""
+            while pos > 0 and buf.count(b"\n") <= want:
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+        lines = buf.decode("utf-8", errors="ignore").splitlines()
+        if pos > 0:
+            lines = lines[1:]  # first line is likely partial
+        return lines[-want:] if want > 0 else []
+
+    # ── Rotation / compaction ────────────────────────────────
+    def compact(self, today=None):
+        """Gzip sealed segments past compress_after_days and drop those past retain_days."""
+        today = today or datetime.date.today()
+        removed, compressed = 0, 0
+        with self._lock:
+            for path in self.segments():
+                if path == self._fh_path:
+                    continue
+                day = datetime.date.fromisoformat(_segment_sort_key(path)[0])
+                age = (today - day).days
+                if self.retain_days is not None and age > self.retain_days:
+                    path.unlink()
+                    removed += 1
+                elif age > self.compress_after_days and path.suffix == ".jsonl":
+                    gz_path = path.with_name(path.name + ".gz")
+                    with open(path, "rb") as src, gzip.open(gz_path, "wb") as dst:
+                        dst.writelines(src)
+                    path.unlink()
+                    compressed += 1
+        return compressed, removed
@@ -0,0 +1,178 @@
+"""
+Bounded job queue and worker pool for model calls.
+
+Script threads submit a job and poll it; a fixed pool of workers runs jobs in
+FIFO order. Each user may only have `per_user_limit` jobs in flight, and the
+queue refuses work beyond `max_queue` so a burst of students gets clear
+feedback instead of piling up blocked script runs. Rate-limit errors are
+retried with jittered exponential backoff, as long as nothing has been
+streamed to the student yet. With `shared` (a SharedInflight, see
+shared_state.py) the per-user limit holds across app replicas too.
+"""
+import time
+import random
+import threading
+from collections import deque, Counter
+
+QUEUED, RUNNING, RETRYING, DONE, FAILED = "queued", "running", "retrying", "done", "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UserBusy(Exception):
+    pass
+
+
+def is_rate_limited(exc):
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    return "RateLimit" in type(exc).__name__
+
+
+def retry_after(exc):
+    """Seconds from a Retry-After header on the error's response, if any."""
+    if getattr(exc, "retry_after", None) is not None:
+        return exc.retry_after
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Job:
+    """
+    One model request. The worker calls fn(job); streaming functions push
+    text through job.emit() so the script thread can render it live.
+    """
+
+    def __init__(self, username, fn):
+        self.username = username
+        self.fn = fn
+        self.state = QUEUED
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def emit(self, text):
+        self.chunks.append(text)
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class LLMQueue:
+    def __init__(self, workers=4, max_queue=100, per_user_limit=1, max_retries=4,
+                 backoff_base=1.0, backoff_cap=20.0, shared=None):
+        self.max_queue = max_queue
+        self.shared = shared
+        self.per_user_limit = per_user_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._pending = deque()
+        self._inflight = Counter()
+        self._running = 0
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    # ── Submission ───────────────────────────────────────────
+    def submit(self, username, fn):
+        with self._cond:
+            if self._inflight[username] >= self.per_user_limit:
+                raise UserBusy(username)
+            if len(self._pending) >= self.max_queue:
+                raise QueueFull(len(self._pending))
+            self._inflight[username] += 1
+        if self.shared is not None and not self.shared.acquire(username, self.per_user_limit):
+            self._release(username)
+            raise UserBusy(username)
+        with self._cond:
+            full = len(self._pending) >= self.max_queue
+            if not full:
+                job = Job(username, fn)
+                self._pending.append(job)
+                self._cond.notify()
+        if full:
+            self._release(username, shared=True)
+            raise QueueFull(self.max_queue)
+        return job
+
+    def _release(self, username, shared=False):
+        with self._cond:
+            self._inflight[username] -= 1
+            if self._inflight[username] <= 0:
+                del self._inflight[username]
+        if shared and self.shared is not None:
+            self.shared.release(username)
+
+    def position(self, job):
+        """1-based place in line, or 0 once a worker has picked the job up."""
+        with self._cond:
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def stats(self):
+        with self._cond:
+            return {"queued": len(self._pending), "running": self._running,
+                    "workers": len(self._threads)}
+
+    # ── Workers ──────────────────────────────────────────────
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                self._running += 1
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                self._release(job.username, shared=True)
+                job.finished_at = time.monotonic()
+                job._done.set()
+
+    def _run(self, job):
+        job.started_at = time.monotonic()
+        while True:
+            job.attempts += 1
+            job.state = RUNNING
+            try:
+                job.result = job.fn(job)
+                job.state = DONE
+                return
+            except Exception as e:
+                retryable = is_rate_limited(e) and not job.chunks
+                if not retryable or job.attempts > self.max_retries:
+                    job.error = e
+                    job.state = FAILED
+                    return
+                job.state = RETRYING
+                delay = min(self.backoff_cap, self.backoff_base * 2 ** (job.attempts - 1))
+                delay = max(retry_after(e) or 0, delay * random.uniform(0.5, 1.5))
+                time.sleep(delay)
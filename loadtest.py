@@ -0,0 +1,364 @@
+"""
+Classroom load test: N concurrent simulated students against a mock LLM.
+
+Each simulated student is a headless Streamlit session (streamlit.testing
+AppTest running app.py) that logs in through the real login form, asks a
+few questions through process_message and, for teacher sessions, renders
+the dashboard. AppTest needs a Streamlit runtime of its own, so every
+session runs in its own process; they share the throwaway store like app
+replicas do. A second phase hammers the storage layer directly to time
+interaction writes. Everything runs against mock_llm_server.py in a temp
+directory, so no network or API key is needed and the working tree is
+left alone.
+
+    python loadtest.py --students 40 --questions 3 --out results.json
+
+Results are written as JSON (latency percentiles in ms, throughput, write
+times, memory per session) so runs can be compared in CI. The exit status
+is 1 when any operation failed or no question was answered.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import argparse
+import tempfile
+import platform
+import threading
+import tracemalloc
+import datetime
+import multiprocessing
+
+from mock_llm_server import start_mock_server
+
+QUESTIONS = [
+    "What is photosynthesis?",
+    "Explain Ch1 Social Studies India Relief Features",
+    "How to solve quadratic equations?",
+    "Explain democracy with an example",
+    "Climate of India summary for exams",
+    "What is globalisation in simple words?",
+]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+
+    def pick(p):
+        return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+    return {
+        "count": len(s),
+        "mean_ms": round(sum(s) / len(s) * 1000, 2),
+        "p50_ms": round(pick(50) * 1000, 2),
+        "p95_ms": round(pick(95) * 1000, 2),
+        "p99_ms": round(pick(99) * 1000, 2),
+        "max_ms": round(s[-1] * 1000, 2),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, op, seconds):
+        with self._lock:
+            self.samples.setdefault(op, []).append(seconds)
+
+    def error(self, op, exc):
+        with self._lock:
+            self.errors.setdefault(op, []).append(f"{type(exc).__name__}: {exc}")
+
+    def merge(self, samples, errors):
+        with self._lock:
+            for op, values in samples.items():
+                self.samples.setdefault(op, []).extend(values)
+            for op, values in errors.items():
+                self.errors.setdefault(op, []).extend(values)
+
+    def timed(self, op, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.error(op, e)
+            return None
+        self.add(op, time.perf_counter() - t0)
+        return result
+
+
+# ═══════════════════════════════════════════════════════════════
+# ENVIRONMENT
+# ═══════════════════════════════════════════════════════════════
+def prepare_environment(workdir, mock_url, backend, n_students):
+    """Point app.py at a throwaway store and the mock LLM, then seed students."""
+    os.environ.update({
+        "STORAGE_BACKEND": backend,
+        "DB_FILE": os.path.join(workdir, "school_data.db"),
+        "DATA_FILE": os.path.join(workdir, "school_data.json"),
+        "LOG_DIR": os.path.join(workdir, "logs"),
+        "ANALYTICS_DB": os.path.join(workdir, "analytics.db"),
+        "LLM_PROVIDER": "mock",
+        "MOCK_LLM_URL": mock_url,
+        "GROK-API-KEY": "loadtest",
+    })
+    from storage import open_storage
+    backend_store = open_storage()
+    settings = backend_store.load_settings()
+    settings["daily_limit"] = 10_000
+    backend_store.save_settings(settings)
+    today = str(datetime.date.today())
+    backend_store.save_users({
+        f"load{i:04d}": {
+            "password": hashlib.sha256(f"pw{i:04d}".encode()).hexdigest(),
+            "role": "student",
+            "name": f"Load Student {i}",
+            "class": str(1 + i % 10),
+            "usage_today": 0,
+            "total_usage": 0,
+            "last_active": "",
+            "created": today,
+        }
+        for i in range(n_students)
+    })
+    backend_store.close()
+
+
+# ═══════════════════════════════════════════════════════════════
+# UI PHASE (headless Streamlit sessions)
+# ═══════════════════════════════════════════════════════════════
+def _by_label(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"widget {label!r} not found")
+
+
+def login(at, username, password):
+    _by_label(at.text_input, "👤 Username").input(username)
+    _by_label(at.text_input, "🔒 Password").input(password)
+    _by_label(at.button, "Sign In →").click()
+    at.run()
+    if not at.session_state["logged_in"]:
+        raise RuntimeError(f"login failed for {username}")
+    return True
+
+
+def ask(at, question):
+    before = len(at.session_state["messages"])
+    _by_label(at.text_input, "Ask your question:").input(question)
+    _by_label(at.button, "Send ➤").click()
+    at.run()
+    if len(at.session_state["messages"]) < before + 2:
+        raise RuntimeError("question was not answered")
+    return True
+
+
+def student_session(app_path, idx, n_questions, rec, barrier, timeout):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    barrier.wait(timeout)
+    rec.timed("first_render", at.run)
+    if rec.timed("login", login, at, f"load{idx:04d}", f"pw{idx:04d}") is None:
+        return
+    for q in range(n_questions):
+        rec.timed("ask", ask, at, QUESTIONS[(idx + q) % len(QUESTIONS)])
+
+
+def teacher_session(app_path, n_views, rec, barrier, timeout):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    barrier.wait(timeout)
+    at.run()
+    if rec.timed("teacher_login", login, at, "admin", "admin123") is None:
+        return
+    for _ in range(n_views):
+        rec.timed("dashboard", at.run)
+
+
+def session_process(kind, app_path, idx, args, barrier, results):
+    """One session in a child process; reports (samples, errors, memory, start, end)."""
+    rec = Recorder()
+    tracemalloc.start()
+    start = time.time()
+    try:
+        if kind == "teacher":
+            teacher_session(app_path, args.dashboard_views, rec, barrier, args.timeout)
+        else:
+            student_session(app_path, idx, args.questions, rec, barrier, args.timeout)
+    except Exception as e:
+        rec.error(f"{kind}_session", e)
+    results.put((rec.samples, rec.errors, tracemalloc.get_traced_memory()[0], start, time.time()))
+
+
+def run_ui_phase(args, rec):
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(args.students + args.teachers), ctx.Queue()
+    procs = [ctx.Process(target=session_process, args=("student", app_path, i, args, barrier, results))
+             for i in range(args.students)]
+    procs += [ctx.Process(target=session_process, args=("teacher", app_path, 0, args, barrier, results))
+              for _ in range(args.teachers)]
+    for p in procs:
+        p.start()
+
+    # Read the results before joining, so a child is never stuck on a full pipe
+    deadline = time.monotonic() + args.timeout * (max(args.questions, args.dashboard_views) + 3)
+    memory, spans = [], []
+    for _ in procs:
+        try:
+            samples, errors, mem, start, end = results.get(timeout=max(1.0, deadline - time.monotonic()))
+        except queue.Empty:
+            rec.error("session", RuntimeError("session process did not report back"))
+            break
+        rec.merge(samples, errors)
+        memory.append(mem)
+        spans.append((start, end))
+    for p in procs:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.terminate()
+
+    wall = max(e for _, e in spans) - min(s for s, _ in spans) if spans else 0.0
+    answered = len(rec.samples.get("ask", []))
+    return {
+        "wall_seconds": round(wall, 3),
+        "questions_answered": answered,
+        "throughput_qps": round(answered / wall, 3) if wall else 0.0,
+        "memory_per_session_kb": round(sum(memory) / max(1, len(memory)) / 1024, 1),
+    }
+
+
+# ═══════════════════════════════════════════════════════════════
+# LOGIN PHASE (class-start burst)
+# ═══════════════════════════════════════════════════════════════
+def run_login_phase(args, rec):
+    """
+    Every student of a class signs in at the same moment: a burst of
+    password checks through the shared KDF pool, first against legacy
+    SHA-256 hashes (verify + rehash) and then against the upgraded ones.
+    """
+    from passwords import PasswordHasher
+    hasher = PasswordHasher(workers=args.password_workers, max_pending=args.students)
+    passwords = [f"pw{i:04d}" for i in range(args.students)]
+    stored = [hashlib.sha256(p.encode()).hexdigest() for p in passwords]
+    results = {}
+
+    def burst(op):
+        barrier = threading.Barrier(args.students)
+
+        def login(i):
+            barrier.wait()
+            result = rec.timed(op, hasher.check, passwords[i], stored[i])
+            if result and result[1]:
+                stored[i] = result[1]
+
+        threads = [threading.Thread(target=login, args=(i,)) for i in range(args.students)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+        results[op] = {"wall_seconds": round(wall, 3),
+                       "logins_per_sec": round(args.students / wall, 1) if wall else 0.0}
+
+    burst("login_legacy_rehash")
+    burst("login_kdf")
+    return results
+
+
+# ═══════════════════════════════════════════════════════════════
+# STORAGE PHASE
+# ═══════════════════════════════════════════════════════════════
+def run_storage_phase(args, rec, workdir, mock_url):
+    """Concurrent record_interaction calls against a fresh store, like a busy class."""
+    from storage import open_storage
+    from store import SchoolStore
+    storage_dir = os.path.join(workdir, "storage-phase")
+    os.makedirs(storage_dir)
+    prepare_environment(storage_dir, mock_url, args.backend, args.students)
+    store = SchoolStore(open_storage())
+    usernames = [f"load{i:04d}" for i in range(args.students)]
+
+    def writer(username):
+        for _ in range(args.writes):
+            rec.timed("record_interaction", store.record_interaction, username, "text", "load test")
+
+    threads = [threading.Thread(target=writer, args=(u,)) for u in usernames]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    writes = len(rec.samples.get("record_interaction", []))
+    t1 = time.perf_counter()
+    store.recent_logs(20)
+    store.count_logs(str(datetime.date.today()))
+    rec.add("dashboard_queries", time.perf_counter() - t1)
+    store.backend.close()
+    return {"writes": writes, "writes_per_sec": round(writes / wall, 1) if wall else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--teachers", type=int, default=1)
+    parser.add_argument("--questions", type=int, default=3, help="questions per student")
+    parser.add_argument("--dashboard-views", type=int, default=5)
+    parser.add_argument("--writes", type=int, default=50, help="storage-phase writes per student")
+    parser.add_argument("--backend", choices=("sqlite", "json"), default="sqlite")
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=150)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--password-workers", type=int, default=4, help="login-phase KDF pool size")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout (s)")
+    parser.add_argument("--skip-ui", action="store_true", help="only run the storage phase")
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    server, mock_url = start_mock_server(
+        ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, reply_tokens=args.reply_tokens,
+        rate_limit_rate=args.rate_limit_rate, error_rate=args.error_rate, seed=1)
+    workdir = tempfile.mkdtemp(prefix="tutor-loadtest-")
+    prepare_environment(workdir, mock_url, args.backend, args.students)
+
+    rec = Recorder()
+    results = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+    }
+    if not args.skip_ui:
+        results["ui"] = run_ui_phase(args, rec)
+    results["login"] = run_login_phase(args, rec)
+    results["storage"] = run_storage_phase(args, rec, workdir, mock_url)
+    results["latency"] = {op: percentiles(s) for op, s in sorted(rec.samples.items())}
+    results["errors"] = {op: {"count": len(e), "sample": e[:3]} for op, e in rec.errors.items()}
+    server.shutdown()
+
+    payload = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(payload)
+        print(f"Results written to {args.out} (workdir {workdir})", file=sys.stderr)
+    else:
+        print(payload)
+
+    failed = bool(rec.errors)
+    if "ui" in results and args.students and args.questions and not results["ui"]["questions_answered"]:
+        print("No question was answered", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Latency and throughput metrics in the Prometheus text format.
+
+Histograms time the hot paths (a question end to end, prompt build, queue
+wait, the model call, logging an interaction, sign-in and the dashboard
+views); counters and gauges cover model tokens, answer-cache lookups and
+the LLM queue. With METRICS_PORT set the app serves them at
+http://<host>:<METRICS_PORT>/metrics for Prometheus to scrape, and the
+dashboard's System tab shows the same numbers.
+
+Metrics are per process: every replica serves its own and Prometheus adds
+them up. No third-party dependencies.
+
+    with STAGE_SECONDS.time(stage="prompt_build"):
+        ...
+
+    @STAGE_SECONDS.timed(stage="authenticate")
+    def authenticate(...):
+        ...
+"""
+import math
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "ai9campus_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; fine at the low end for in-process work, up to a slow model answer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75,
+                   1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self):
+        """[(suffix, label values, extra labels, value)] for render()."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, values, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name + "_total", help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [("", key, (), v) for key, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """A value read at scrape time from `fn` ({label values tuple: value}, or a number without labels)."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def set_function(self, fn):
+        self.fn = fn
+
+    def values(self):
+        if self.fn is None:
+            return {}
+        try:
+            result = self.fn()
+        except Exception:
+            return {}                 # a broken source must not break the scrape
+        return result if isinstance(result, dict) else {(): result}
+
+    def samples(self):
+        return [("", tuple(str(v) for v in key), (), value) for key, value in sorted(self.values().items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}             # label values -> [counts per bucket + overflow, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """Decorator form of time()."""
+        def wrap(fn):
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                with self.time(**labels):
+                    return fn(*args, **kwargs)
+            return inner
+        return wrap
+
+    def series(self):
+        """{label values: (cumulative bucket counts, sum, count)}."""
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        out = {}
+        for key, counts, total in sorted(items):
+            cumulative, running = [], 0
+            for n in counts:
+                running += n
+                cumulative.append(running)
+            out[key] = (cumulative, total, running)
+        return out
+
+    def quantile(self, q, cumulative):
+        """Estimate of the q-quantile from cumulative counts, interpolated within a bucket."""
+        count = cumulative[-1] if cumulative else 0
+        if not count:
+            return None
+        rank = q * count
+        i = bisect.bisect_left(cumulative, rank)
+        if i >= len(self.buckets):
+            return self.buckets[-1]   # in the overflow bucket: report its lower edge
+        lower = self.buckets[i - 1] if i else 0.0
+        below = cumulative[i - 1] if i else 0
+        in_bucket = cumulative[i] - below
+        return lower + (self.buckets[i] - lower) * ((rank - below) / in_bucket if in_bucket else 1.0)
+
+    def samples(self):
+        out = []
+        for key, (cumulative, total, count) in self.series().items():
+            for edge, n in zip(self.buckets + (math.inf,), cumulative):
+                out.append(("_bucket", key, (("le", _number(float(edge))),), n))
+            out.append(("_sum", key, (), total))
+            out.append(("_count", key, (), count))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def metrics(self):
+        return list(self._metrics)
+
+    def render(self):
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ═══════════════════════════════════════════════════════════════
+# THE APP'S METRICS
+# ═══════════════════════════════════════════════════════════════
+QUESTION_SECONDS = REGISTRY.register(Histogram(
+    "question_seconds", "Time to handle one question, by outcome "
+    "(answered, cached, limited, busy, error, unavailable).", ["outcome"]))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "stage_seconds", "Time spent in one step of the hot path "
+    "(prompt_build, queue_wait, model, log_interaction, authenticate, sync).", ["stage"]))
+RENDER_SECONDS = REGISTRY.register(Histogram(
+    "render_seconds", "Time to build one teacher dashboard view.", ["view"]))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens", "Model tokens used, by kind (prompt, completion).", ["kind"]))
+LLM_TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "llm_tokens_per_second", "Completion tokens per second of model time, per answer.",
+    buckets=RATE_BUCKETS))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "answer_cache_lookups", "Answer cache lookups by result (hit, miss, skip).", ["result"]))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "answer_cache_entries", "Answers held in this process's answer cache."))
+LLM_QUEUE = REGISTRY.register(Gauge(
+    "llm_queue", "LLM queue jobs waiting and running, and the worker count.", ["state"]))
+LOGINS = REGISTRY.register(Counter(
+    "logins", "Sign-in attempts by result (ok, failed, locked, busy).", ["result"]))
+
+
+def observe_model_call(job, usage):
+    """Record a finished LLMQueue job: queue wait, model time, tokens and tokens/sec."""
+    if job.started_at is None or job.finished_at is None:
+        return
+    model_seconds = job.finished_at - job.started_at
+    STAGE_SECONDS.observe(job.started_at - job.submitted_at, stage="queue_wait")
+    STAGE_SECONDS.observe(model_seconds, stage="model")
+    prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    LLM_TOKENS.inc(prompt, kind="prompt")
+    LLM_TOKENS.inc(completion, kind="completion")
+    if completion and model_seconds > 0:
+        LLM_TOKENS_PER_SECOND.observe(completion / model_seconds)
+
+
+# ═══════════════════════════════════════════════════════════════
+# ENDPOINT
+# ═══════════════════════════════════════════════════════════════
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass                          # scraped every few seconds; keep the app log clean
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve /metrics on a daemon thread; returns the server (port 0 picks a free one)."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,174 @@
+"""
+Local stand-in for the chat-completions API, for offline load testing.
+
+Serves POST /v1/chat/completions (and /openai/v1/... like Groq) with or
+without SSE streaming. Answers are canned text of a configurable length,
+paced by a time-to-first-token delay and a token rate. Errors can be
+injected: 429 rate limits, 500s, and streams cut off half way.
+
+    python mock_llm_server.py --port 8808 --ttft 0.4 --tokens-per-sec 60
+    LLM_PROVIDER=mock streamlit run app.py
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = ("Think of it this way the idea works like a simple everyday example from "
+          "Hyderabad where each part depends on the next and together they explain "
+          "the whole chapter in your textbook").split()
+
+
+class MockConfig:
+    def __init__(self, ttft=0.3, tokens_per_sec=80.0, reply_tokens=200, error_rate=0.0,
+                 rate_limit_rate=0.0, disconnect_rate=0.0, retry_after=1, seed=None):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.disconnect_rate = disconnect_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def roll(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+
+def _prompt_tokens(messages):
+    return sum(len(m.get("content", "")) // 4 + 4 for m in messages)
+
+
+def _reply_words(messages, n):
+    question = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    words = f"Great question! Let me explain {question[:60]} from your textbook.".split()
+    while len(words) < n:
+        words.extend(FILLER)
+    return words[:n]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/health"):
+            self._json(200, {"status": "ok", "requests": self.config.requests})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        cfg = self.config
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        req = json.loads(self.rfile.read(length) or b"{}")
+        with cfg.lock:
+            cfg.requests += 1
+
+        if cfg.roll(cfg.rate_limit_rate):
+            self._json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit"}},
+                       {"Retry-After": str(cfg.retry_after)})
+            return
+        if cfg.roll(cfg.error_rate):
+            self._json(500, {"error": {"message": "Internal error (mock)"}})
+            return
+
+        messages = req.get("messages", [])
+        limit = req.get("max_completion_tokens") or req.get("max_tokens") or cfg.reply_tokens
+        words = _reply_words(messages, min(cfg.reply_tokens, limit))
+        usage = {"prompt_tokens": _prompt_tokens(messages), "completion_tokens": len(words)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"mock-{cfg.requests}", "model": req.get("model", "mock"), "created": int(time.time())}
+
+        time.sleep(cfg.ttft)
+        if not req.get("stream"):
+            time.sleep(len(words) / cfg.tokens_per_sec)
+            self._json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": " ".join(words)}}]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        cut_at = len(words) // 2 if cfg.roll(cfg.disconnect_rate) else None
+        try:
+            for i, word in enumerate(words):
+                if i == cut_at:
+                    self.close_connection = True
+                    return
+                self._event(dict(base, object="chat.completion.chunk", choices=[{
+                    "index": 0, "finish_reason": None,
+                    "delta": {"content": word if i == 0 else " " + word}}]))
+                time.sleep(1.0 / cfg.tokens_per_sec)
+            self._event(dict(base, object="chat.completion.chunk", usage=usage, x_groq={"usage": usage},
+                             choices=[{"index": 0, "finish_reason": "stop", "delta": {}}]))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def _event(self, payload):
+        self.wfile.write(b"data: " + json.dumps(payload).encode() + b"\n\n")
+        self.wfile.flush()
+
+
+def start_mock_server(host="127.0.0.1", port=0, **config):
+    """Start the stand-in on a background thread; returns (server, base_url)."""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": MockConfig(**config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local chat-completions stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="fraction of streams cut off mid-answer")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server, url = start_mock_server(
+        args.host, args.port, ttft=args.ttft, tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, disconnect_rate=args.disconnect_rate, seed=args.seed)
+    print(f"Mock LLM listening on {url}  (LLM_PROVIDER=mock MOCK_LLM_URL={url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""
+Local stand-in for a Redis server, for tests and multi-replica load runs.
+
+Implements the subset of commands shared_state.py and storage.RedisStorage
+use (strings, counters, hashes, lists, streams, expiry, MULTI/EXEC/WATCH)
+over the real RESP protocol, so the app can't tell it from Redis. Data is
+in memory only; every command runs under one lock, like Redis' single
+thread.
+
+    python mock_redis_server.py --port 6399
+    SHARED_STATE_URL=redis://127.0.0.1:6399/0 streamlit run app.py --server.port 8501
+    SHARED_STATE_URL=redis://127.0.0.1:6399/0 streamlit run app.py --server.port 8502
+"""
+import time
+import socket
+import argparse
+import threading
+import socketserver
+from collections import defaultdict
+
+
+class CommandError(Exception):
+    pass
+
+
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+
+class Stream:
+    def __init__(self):
+        self.entries = []                        # [((ms, seq), [field, value, ...])]
+
+
+class MockRedis:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.dbs = defaultdict(dict)             # db -> key -> value
+        self.expires = defaultdict(dict)         # db -> key -> monotonic deadline
+        self.versions = defaultdict(int)         # (db, key) -> write counter, for WATCH
+        self.commands = 0
+
+    # ── Keyspace ─────────────────────────────────────────────
+    def _get(self, db, key, kind=None):
+        deadline = self.expires[db].get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.dbs[db].pop(key, None)
+            del self.expires[db][key]
+            self.versions[(db, key)] += 1
+        value = self.dbs[db].get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise CommandError(WRONGTYPE)
+        return value
+
+    def _set(self, db, key, value, keep_ttl=False):
+        self.dbs[db][key] = value
+        if not keep_ttl:
+            self.expires[db].pop(key, None)
+        self._touch(db, key)
+
+    def _touch(self, db, key):
+        self.versions[(db, key)] += 1
+
+    def _delete(self, db, key):
+        existed = self._get(db, key) is not None
+        self.dbs[db].pop(key, None)
+        self.expires[db].pop(key, None)
+        self._touch(db, key)
+        return existed
+
+    # ── Dispatch ─────────────────────────────────────────────
+    def run(self, db, args):
+        name = args[0].upper()
+        handler = getattr(self, "cmd_" + name.lower(), None)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{args[0]}'")
+        self.commands += 1
+        return handler(db, *args[1:])
+
+    # ── Strings and counters ─────────────────────────────────
+    def cmd_ping(self, db, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_get(self, db, key):
+        return self._get(db, key, str)
+
+    def cmd_set(self, db, key, value, *options):
+        options = [o.upper() for o in options]
+        ttl = None
+        if "EX" in options:
+            ttl = float(options[options.index("EX") + 1])
+        if "PX" in options:
+            ttl = float(options[options.index("PX") + 1]) / 1000
+        exists = self._get(db, key) is not None
+        if ("NX" in options and exists) or ("XX" in options and not exists):
+            return None
+        self._set(db, key, value)
+        if ttl:
+            self.expires[db][key] = time.monotonic() + ttl
+        return "OK"
+
+    def cmd_incrby(self, db, key, amount):
+        try:
+            value = int(self._get(db, key, str) or 0) + int(amount)
+        except ValueError:
+            raise CommandError("ERR value is not an integer or out of range")
+        self._set(db, key, str(value), keep_ttl=True)
+        return value
+
+    def cmd_incr(self, db, key):
+        return self.cmd_incrby(db, key, 1)
+
+    def cmd_decrby(self, db, key, amount):
+        return self.cmd_incrby(db, key, -int(amount))
+
+    def cmd_decr(self, db, key):
+        return self.cmd_incrby(db, key, -1)
+
+    def cmd_del(self, db, *keys):
+        return sum(1 for key in keys if self._delete(db, key))
+
+    def cmd_exists(self, db, *keys):
+        return sum(1 for key in keys if self._get(db, key) is not None)
+
+    def cmd_expire(self, db, key, seconds):
+        return self.cmd_pexpire(db, key, float(seconds) * 1000)
+
+    def cmd_pexpire(self, db, key, ms):
+        if self._get(db, key) is None:
+            return 0
+        self.expires[db][key] = time.monotonic() + float(ms) / 1000
+        return 1
+
+    def cmd_pttl(self, db, key):
+        if self._get(db, key) is None:
+            return -2
+        deadline = self.expires[db].get(key)
+        return -1 if deadline is None else int((deadline - time.monotonic()) * 1000)
+
+    def cmd_ttl(self, db, key):
+        ms = self.cmd_pttl(db, key)
+        return ms if ms < 0 else (ms + 999) // 1000
+
+    def cmd_dbsize(self, db):
+        return sum(1 for key in list(self.dbs[db]) if self._get(db, key) is not None)
+
+    def cmd_flushdb(self, db):
+        for key in list(self.dbs[db]):
+            self._delete(db, key)
+        return "OK"
+
+    # ── Hashes ───────────────────────────────────────────────
+    def _hash(self, db, key, create=False):
+        value = self._get(db, key, dict)
+        if value is None and create:
+            value = {}
+            self._set(db, key, value)
+        return value
+
+    def cmd_hset(self, db, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise CommandError("ERR wrong number of arguments for 'hset' command")
+        h = self._hash(db, key, create=True)
+        added = sum(1 for f in pairs[::2] if f not in h)
+        h.update(zip(pairs[::2], pairs[1::2]))
+        self._touch(db, key)
+        return added
+
+    def cmd_hget(self, db, key, field):
+        return (self._hash(db, key) or {}).get(field)
+
+    def cmd_hmget(self, db, key, *fields):
+        h = self._hash(db, key) or {}
+        return [h.get(f) for f in fields]
+
+    def cmd_hgetall(self, db, key):
+        return [x for pair in (self._hash(db, key) or {}).items() for x in pair]
+
+    def cmd_hdel(self, db, key, *fields):
+        h = self._hash(db, key) or {}
+        removed = sum(1 for f in fields if h.pop(f, None) is not None)
+        if removed:
+            self._touch(db, key)
+        return removed
+
+    def cmd_hlen(self, db, key):
+        return len(self._hash(db, key) or {})
+
+    def cmd_hincrby(self, db, key, field, amount):
+        h = self._hash(db, key, create=True)
+        h[field] = str(int(h.get(field, 0)) + int(amount))
+        self._touch(db, key)
+        return int(h[field])
+
+    # ── Lists ────────────────────────────────────────────────
+    def cmd_rpush(self, db, key, *values):
+        items = self._get(db, key, list)
+        if items is None:
+            items = []
+            self._set(db, key, items)
+        items.extend(values)
+        self._touch(db, key)
+        return len(items)
+
+    def cmd_llen(self, db, key):
+        return len(self._get(db, key, list) or [])
+
+    @staticmethod
+    def _span(n, start, stop):
+        start, stop = int(start), int(stop)
+        start = max(0, start + n if start < 0 else start)
+        stop = stop + n if stop < 0 else min(stop, n - 1)
+        return start, stop + 1
+
+    def cmd_lrange(self, db, key, start, stop):
+        items = self._get(db, key, list) or []
+        a, b = self._span(len(items), start, stop)
+        return items[a:b]
+
+    def cmd_ltrim(self, db, key, start, stop):
+        items = self._get(db, key, list)
+        if items is not None:
+            a, b = self._span(len(items), start, stop)
+            items[:] = items[a:b]
+            self._touch(db, key)
+        return "OK"
+
+    # ── Streams ──────────────────────────────────────────────
+    @staticmethod
+    def _stream_id(text, high=False):
+        if text == "-":
+            return (0, 0)
+        if text == "+":
+            return (float("inf"), 0)
+        ms, _, seq = text.partition("-")
+        return (int(ms), int(seq) if seq else (2 ** 63 if high else 0))
+
+    def cmd_xadd(self, db, key, *args):
+        args = list(args)
+        maxlen = None
+        if args[0].upper() == "MAXLEN":
+            args.pop(0)
+            if args[0] in ("~", "="):
+                args.pop(0)
+            maxlen = int(args.pop(0))
+        requested, fields = args[0], args[1:]
+        stream = self._get(db, key, Stream)
+        if stream is None:
+            stream = Stream()
+            self._set(db, key, stream)
+        last = stream.entries[-1][0] if stream.entries else (0, 0)
+        if requested == "*":
+            ms = int(time.time() * 1000)
+            new = (ms, 0) if ms > last[0] else (last[0], last[1] + 1)
+        else:
+            new = self._stream_id(requested)
+            if new <= last:
+                raise CommandError("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+        stream.entries.append((new, list(fields)))
+        if maxlen is not None and len(stream.entries) > maxlen:
+            del stream.entries[:len(stream.entries) - maxlen]
+        self._touch(db, key)
+        return f"{new[0]}-{new[1]}"
+
+    def _xrange(self, db, key, start, end, count, reverse):
+        stream = self._get(db, key, Stream)
+        entries = stream.entries if stream else []
+        lo_exclusive, hi_exclusive = start.startswith("("), end.startswith("(")
+        lo, hi = self._stream_id(start.lstrip("(")), self._stream_id(end.lstrip("("), high=True)
+        out = [e for e in entries
+               if (e[0] > lo if lo_exclusive else e[0] >= lo) and (e[0] < hi if hi_exclusive else e[0] <= hi)]
+        if reverse:
+            out.reverse()
+        if count is not None:
+            out = out[:count]
+        return [[f"{i[0]}-{i[1]}", fields] for i, fields in out]
+
+    def cmd_xrange(self, db, key, start, end, *options):
+        count = int(options[1]) if options and options[0].upper() == "COUNT" else None
+        return self._xrange(db, key, start, end, count, False)
+
+    def cmd_xrevrange(self, db, key, end, start, *options):
+        count = int(options[1]) if options and options[0].upper() == "COUNT" else None
+        return self._xrange(db, key, start, end, count, True)
+
+    def cmd_xlen(self, db, key):
+        stream = self._get(db, key, Stream)
+        return len(stream.entries) if stream else 0
+
+
+class Session:
+    """Per-connection state: selected db, queued MULTI commands, WATCHed keys."""
+
+    def __init__(self):
+        self.db = 0
+        self.queued = None
+        self.watched = {}
+
+
+class RespHandler(socketserver.BaseRequestHandler):
+    redis = None
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = bytearray()
+
+    def _fill(self):
+        data = self.request.recv(65536)
+        if not data:
+            raise ConnectionError()
+        self.buffer += data
+
+    def _line(self):
+        while True:
+            end = self.buffer.find(b"\r\n")
+            if end >= 0:
+                line = bytes(self.buffer[:end])
+                del self.buffer[:end + 2]
+                return line
+            self._fill()
+
+    def _exact(self, n):
+        while len(self.buffer) < n + 2:
+            self._fill()
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n + 2]
+        return data
+
+    def read_command(self):
+        line = self._line()
+        if not line.startswith(b"*"):
+            return line.decode().split()           # inline command (telnet)
+        return [self._exact(int(self._line()[1:])).decode("utf-8", "surrogateescape")
+                for _ in range(int(line[1:]))]
+
+    @staticmethod
+    def encode(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, CommandError):
+            return b"-" + str(value).encode() + b"\r\n"
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(RespHandler.encode(v) for v in value)
+        if value in ("OK", "PONG", "QUEUED"):
+            return b"+" + value.encode() + b"\r\n"
+        data = str(value).encode("utf-8", "surrogateescape")
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def execute(self, session, args):
+        name = args[0].upper()
+        redis = self.redis
+        if name in ("AUTH", "CLIENT", "HELLO"):
+            return "OK"
+        if name == "SELECT":
+            session.db = int(args[1])
+            return "OK"
+        if name == "MULTI":
+            session.queued = []
+            return "OK"
+        if name == "DISCARD":
+            session.queued, session.watched = None, {}
+            return "OK"
+        if name == "WATCH":
+            with redis.lock:
+                for key in args[1:]:
+                    redis._get(session.db, key)
+                    session.watched[key] = redis.versions[(session.db, key)]
+            return "OK"
+        if name == "UNWATCH":
+            session.watched = {}
+            return "OK"
+        if name == "EXEC":
+            queued, watched = session.queued or [], session.watched
+            session.queued, session.watched = None, {}
+            with redis.lock:
+                for key, version in watched.items():
+                    redis._get(session.db, key)
+                    if redis.versions[(session.db, key)] != version:
+                        return None
+                return [self._run(session.db, cmd) for cmd in queued]
+        if session.queued is not None:
+            session.queued.append(args)
+            return "QUEUED"
+        with redis.lock:
+            return self._run(session.db, args)
+
+    def _run(self, db, args):
+        try:
+            return self.redis.run(db, args)
+        except CommandError as e:
+            return e
+        except (TypeError, ValueError, IndexError):
+            return CommandError(f"ERR wrong arguments for '{args[0]}' command")
+
+    def handle(self):
+        session = Session()
+        replies = []
+        while True:
+            try:
+                args = self.read_command()
+            except (ConnectionError, OSError, ValueError):
+                return
+            if args:
+                try:
+                    replies.append(self.encode(self.execute(session, args)))
+                except CommandError as e:
+                    replies.append(self.encode(e))
+            # Answer a pipelined batch with one write once it is all read
+            if not self.buffer:
+                try:
+                    self.request.sendall(b"".join(replies))
+                except OSError:
+                    return
+                replies.clear()
+
+
+class MockRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_mock_redis(host="127.0.0.1", port=0):
+    """Start the stand-in on a background thread; returns (server, url)."""
+    handler = type("ConfiguredRespHandler", (RespHandler,), {"redis": MockRedis()})
+    server = MockRedisServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="mock-redis", daemon=True).start()
+    return server, f"redis://{host}:{server.server_address[1]}/0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for shared state")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+
+    server, url = start_mock_redis(args.host, args.port)
+    print(f"Mock Redis listening on {url}  (SHARED_STATE_URL={url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Password hashing shared by the login form, the Add Student tab and bulk
+imports. Kept in its own module so worker processes can import it.
+
+Stored hashes carry their scheme and parameters, so the cost can be raised
+later without breaking existing logins:
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>          (default)
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+    <64 hex characters>                       legacy unsalted SHA-256
+
+Legacy and weaker hashes are replaced with the current format the next time
+the user logs in successfully. KDF work runs on a small bounded pool so a
+class logging in at once never stalls the Streamlit script threads, and a
+throttle per username and client slows down password guessing.
+"""
+import os
+import hmac
+import base64
+import hashlib
+import secrets
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+SCHEME = os.getenv("PASSWORD_SCHEME", "scrypt")
+SCRYPT_N = int(os.getenv("SCRYPT_N", 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", 600_000))
+SALT_BYTES = 16
+
+
+class LoginBusy(Exception):
+    """Too many password checks already waiting for the pool."""
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def _is_legacy(stored):
+    return len(stored) == 64 and "$" not in stored
+
+
+# ═══════════════════════════════════════════════════════════════
+# HASH / VERIFY
+# ═══════════════════════════════════════════════════════════════
+def hash_password(password, scheme=None):
+    scheme = scheme or SCHEME
+    salt = secrets.token_bytes(SALT_BYTES)
+    if scheme == "pbkdf2_sha256":
+        digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+    if scheme == "scrypt":
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"unknown password scheme {scheme!r}")
+
+
+def verify_password(password, stored):
+    """Constant-time check of a password against any supported stored format."""
+    stored = stored or ""
+    if _is_legacy(stored):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    parts = stored.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            digest = _scrypt(password, _unb64(parts[4]), n, r, p)
+        elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            digest = _pbkdf2(password, _unb64(parts[2]), int(parts[1]))
+        else:
+            return False
+        return hmac.compare_digest(digest, _unb64(parts[-1]))
+    except (ValueError, TypeError):
+        return False
+
+
+def needs_rehash(stored):
+    """True when a hash is legacy, uses another scheme or weaker parameters."""
+    parts = (stored or "").split("$")
+    if parts[0] != SCHEME:
+        return True
+    if SCHEME == "scrypt":
+        return int(parts[1]) < SCRYPT_N
+    return int(parts[1]) < PBKDF2_ITERATIONS
+
+
+def check_password(password, stored):
+    """(ok, new_hash): new_hash is set when a correct password should be re-stored."""
+    if not verify_password(password, stored):
+        return False, None
+    return True, hash_password(password) if needs_rehash(stored) else None
+
+
+# ═══════════════════════════════════════════════════════════════
+# POOL + THROTTLE
+# ═══════════════════════════════════════════════════════════════
+class PasswordHasher:
+    """
+    Runs KDF work on a fixed thread pool (hashlib releases the GIL while
+    hashing). At most `max_pending` checks may wait at once; beyond that
+    LoginBusy is raised so the login form can ask the student to retry.
+    """
+
+    def __init__(self, workers=4, max_pending=64, wait=10.0):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.wait = wait
+        self._dummy = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            raise LoginBusy()
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(hash_password, password)
+
+    def check(self, password, stored):
+        if stored is None:
+            # Unknown user: spend the same KDF time so usernames can't be probed
+            if self._dummy is None:
+                self._dummy = hash_password(secrets.token_hex(8))
+            self._run(verify_password, password, self._dummy)
+            return False, None
+        return self._run(check_password, password, stored)
+
+
+class LoginThrottle:
+    """
+    Two limits on password guessing. A client (username + IP address) is
+    locked for `lockout` seconds after `max_failures` misses within
+    `window`. A username that keeps failing from several clients is only
+    slowed down to one attempt per `spacing` seconds, so a classmate typing
+    wrong passwords can't lock a student out.
+    """
+
+    def __init__(self, max_failures=5, window=300.0, lockout=300.0, spacing=10.0):
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.spacing = spacing
+        self._failures = {}         # ("client" | "user", key) -> deque of failure times
+        self._until = {}            # same keys -> time the lock or slow-down ends
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def retry_in(self, username, client=""):
+        """Seconds until this username may be tried again from `client` (0 when allowed)."""
+        now = time.monotonic()
+        with self._lock:
+            until = max(self._until.get(("client", f"{username}@{client}"), 0),
+                        self._until.get(("user", username), 0))
+            return max(0.0, until - now)
+
+    def failed(self, username, client=""):
+        now = time.monotonic()
+        with self._lock:
+            for kind, key, hold in (("client", f"{username}@{client}", self.lockout),
+                                    ("user", username, self.spacing)):
+                attempts = self._failures.setdefault((kind, key), deque())
+                attempts.append(now)
+                while attempts[0] < now - self.window:
+                    attempts.popleft()
+                if len(attempts) >= self.max_failures:
+                    self._until[(kind, key)] = now + hold
+                    if kind == "client":
+                        del self._failures[(kind, key)]
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+    def succeeded(self, username, client=""):
+        with self._lock:
+            self._failures.pop(("client", f"{username}@{client}"), None)
+
+    def _sweep(self, now):
+        # Drop made-up usernames and old failures so the tables stay small
+        self._failures = {k: d for k, d in self._failures.items() if d and d[-1] >= now - self.window}
+        self._until = {k: t for k, t in self._until.items() if t > now}
+        self._next_sweep = now + 60
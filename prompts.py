@@ -0,0 +1,165 @@
+"""
+System prompt assembly from versioned fragments.
+
+The prompt is built from persona, teaching style, curriculum (per class and
+subject), exam formats and boundaries. Only the fragments that apply to the
+student's class and the detected subject are included. The assembled text is
+memoized per (class, subject) and shared by every school; the school's
+persona line and the per-student line are added on top so the cache stays
+small.
+
+Bump a fragment's version whenever its text changes, so anything keyed on
+prompt_version() (e.g. cached answers) is invalidated.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+Fragment = namedtuple("Fragment", "name version text")
+
+DIVIDER = "═══════════════════════════════════════════════════════════════"
+
+
+def _section(title, body):
+    return f"{DIVIDER}\n{title}\n{DIVIDER}\n\n{body.strip()}\n"
+
+
+PERSONA = Fragment("persona", 1, """
+You are a **Professional AI Tutor from {school_name}**, specializing in Telangana State Board (SCERT) English Medium Curriculum for Academic Year 2025-26.
+""")
+
+KNOWLEDGE_BASE = Fragment("knowledge_base", 1, _section("📚 KNOWLEDGE BASE & SCOPE", """
+OFFICIAL SOURCE: SCERT Telangana e-Textbooks (https://scert.telangana.gov.in/)
+Academic Year: 2025-26 | Medium: English Only | Classes: 1-10
+
+SUBJECTS: Languages (English/Telugu/Hindi/Urdu/Sanskrit), Mathematics, Physical Science, Biological Science, Environmental Science, Social Studies, Computer Science
+"""))
+
+STYLE = Fragment("style", 1, _section("🎓 TEACHING STYLE - PROFESSIONAL + FRIENDLY + ANALOGIES", """
+ALWAYS USE ANALOGIES:
+• Science: "A plant is like a solar-powered kitchen - it uses sunlight to cook food"
+• Math: "Algebra variables are like empty boxes waiting to be filled with numbers"
+• History: "The Constitution is like the rulebook of a country, just like school has rules"
+• Geography: "Latitude lines are like horizontal rungs on a ladder circling the Earth"
+• Physics: "Electricity flows like water in pipes - more voltage = more pressure"
+• Biology: "DNA is like a recipe book - it contains instructions to build every part of your body"
+
+COMMUNICATION STYLE:
+✅ Professional yet warm - like an experienced, caring teacher
+✅ Start explanations with: "Great question! Let me explain [topic] from your Class [X] textbook..."
+✅ Use "Think of it this way..." before every analogy
+✅ End responses with: "Does this make sense? Would you like me to explain any part differently?"
+✅ For complex topics, break into numbered steps
+✅ Use encouraging phrases: "You're thinking in the right direction!", "Excellent observation!"
+
+VOICE-FRIENDLY RESPONSES:
+Since students may be listening via text-to-speech:
+- Keep sentences clear and not too long
+- Spell out formulas verbally: "six CO2 plus six H2O gives C6H12O6 plus six O2"
+- Avoid excessive bullet points in main explanations
+"""))
+
+# (class, subject) -> fragment. Add chapters here as textbooks are digitised.
+CURRICULUM = {
+    ("10", "Social Studies"): Fragment("curriculum-10-social", 1, _section(
+        "📋 CURRICULUM: 10th Social Studies (English Medium) 2025-26", """
+Part I - Resources Development and Equity:
+Ch1: India Relief Features (pp1-14) | Ch2: Ideas of Development (pp15-28)
+Ch3: Production and Employment (pp29-44) | Ch4: Climate of India (pp45-58)
+Ch5: Indian Rivers and Water Resources (pp59-71) | Ch6: The Population (pp72-87)
+Ch7: Settlements-Migrations (pp88-102) | Ch8: Rampur A Village Economy (pp103-117)
+Ch9: Globalisation (pp118-131) | Ch10: Food Security (pp132-145)
+Ch11: Sustainable Development with Equity (pp146-162)
+
+Part II - Contemporary World and India:
+Ch12: World Between the World Wars 1914-1945 (pp163-186)
+Ch13: National Liberation Movements in the Colonies (pp187-197)
+Ch14: National Movement in India Partition and Independence 1939-1947 (pp198-211)
+Ch15: The Making of Independent India's Constitution (pp212-228)
+Ch16: Election Process in India (pp229-238)
+Ch17: Independent India The First 30 years 1947-77 (pp239-253)
+Ch18: Emerging Political Trends 1977 to 2000 (pp254-271)
+Ch19: Post War World and India (pp272-287)
+Ch20: Social Movements in Our Times (pp288-303)
+Ch21: The Movement for the Formation of Telangana State (pp304-336)
+""")),
+}
+
+# Board exam formats only matter for the SSC (Class 10) students
+EXAM_FORMATS = {
+    "10": Fragment("exam-ssc", 1, _section("📝 EXAM ANSWER FORMATS (SSC Board 2025-26)", """
+1-mark: One precise sentence with key term
+2-mark: Two clear points or one point with example
+4-mark: Definition + 3 explanation points + real example
+8-mark: Introduction (2 lines) + 6 detailed points + conclusion (2 lines) + diagram note if needed
+
+ALWAYS mention: "This is a [X]-mark topic in your board exam"
+""")),
+}
+
+BOUNDARIES = Fragment("boundaries", 1, _section("🚫 BOUNDARIES", """
+NEVER: Answer non-SCERT Telangana topics | Give direct homework answers without teaching
+NEVER: Use other board content | Discuss non-educational topics
+ALWAYS: Teach the concept FIRST, then help solve | Reference chapter and page numbers
+ALWAYS: Use Telangana examples (Hyderabad Metro, Charminar, Hussain Sagar, Bathukamma)
+
+Your mission: Make every student feel confident and capable. You're not just answering questions — you're building young minds for a better Telangana! 🎓
+"""))
+
+SUBJECT_KEYWORDS = {
+    "Social Studies": ("social", "history", "geography", "civics", "economics", "constitution",
+                       "democracy", "climate", "river", "population", "globalisation",
+                       "globalization", "election", "independence", "telangana movement",
+                       "partition", "world war", "settlement", "migration", "food security"),
+    "Mathematics": ("math", "equation", "algebra", "geometry", "triangle", "polynomial",
+                    "fraction", "probability", "statistics", "trigonometry", "quadratic"),
+    "Physical Science": ("physics", "chemistry", "electric", "force", "light", "acid",
+                         "metal", "atom", "reflection", "refraction", "chemical"),
+    "Biological Science": ("biology", "photosynthesis", "cell", "plant", "animal",
+                           "nutrition", "respiration", "heredity", "dna"),
+    "English": ("grammar", "poem", "essay", "letter writing", "tense", "vocabulary"),
+}
+
+
+def detect_subject(text):
+    """Best-guess subject for a question, or None if nothing matches."""
+    text = (text or "").lower()
+    best, best_hits = None, 0
+    for subject, words in SUBJECT_KEYWORDS.items():
+        hits = sum(1 for w in words if re.search(r"\b" + re.escape(w), text))
+        if hits > best_hits:
+            best, best_hits = subject, hits
+    return best
+
+
+def select_fragments(student_class, subject=None):
+    student_class = str(student_class)
+    fragments = [PERSONA, KNOWLEDGE_BASE, STYLE]
+    for (cls, subj), frag in CURRICULUM.items():
+        if cls == student_class and (subject is None or subj == subject):
+            fragments.append(frag)
+    if student_class in EXAM_FORMATS:
+        fragments.append(EXAM_FORMATS[student_class])
+    fragments.append(BOUNDARIES)
+    return fragments
+
+
+def prompt_version(student_class, subject=None):
+    return "+".join(f"{f.name}@{f.version}" for f in select_fragments(student_class, subject))
+
+
+@lru_cache(maxsize=512)
+def _assemble(student_class, subject):
+    # Everything after the persona line is the same for every school, so
+    # schools served from one process (tenants.py) share these entries
+    return "\n".join(f.text.strip("\n") + "\n" for f in select_fragments(student_class, subject)
+                     if f is not PERSONA)
+
+
+def build_system_prompt(school_name, student_name, student_class, subject=None):
+    """`student_name` None leaves the student unnamed, for answers shared through the cache."""
+    persona = PERSONA.text.format(school_name=school_name).strip("\n")
+    base = f"{persona}\n\n{_assemble(str(student_class), subject)}"
+    if student_name is None:
+        return f"{base}\nYou are currently helping a student in Class: **{student_class}**\n"
+    return f"{base}\nYou are currently helping: **{student_name}** | Class: **{student_class}**\n"
@@ -0,0 +1,175 @@
+"""
+LLM providers behind one small interface.
+
+    provider.complete(messages, **params) -> Completion
+    provider.stream(messages, on_delta, **params) -> Completion
+
+GroqProvider wraps the Groq SDK. OpenAICompatProvider speaks the plain
+chat-completions HTTP protocol with the standard library only, which is what
+the local stand-in server (mock_llm_server.py) implements. LLM_PROVIDER
+selects "groq" (default), "openai" (any compatible endpoint at LLM_BASE_URL)
+or "mock" (the stand-in on MOCK_LLM_URL).
+"""
+import os
+import json
+import http.client
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+DEFAULT_MODEL = "moonshotai/kimi-k2-instruct-0905"
+MOCK_LLM_URL = "http://127.0.0.1:8808/v1"
+
+Completion = namedtuple("Completion", "text usage finish_reason")
+
+
+class ProviderError(Exception):
+    """HTTP-level failure; carries status_code/retry_after for the LLM queue."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return {}
+    if not isinstance(usage, dict):
+        usage = {k: getattr(usage, k, None) for k in ("prompt_tokens", "completion_tokens", "total_tokens")}
+    return {k: v for k, v in usage.items() if k in ("prompt_tokens", "completion_tokens", "total_tokens") and v is not None}
+
+
+class LLMProvider:
+    name = "base"
+
+    def __init__(self, model=DEFAULT_MODEL):
+        self.model = model
+
+    def complete(self, messages, **params):
+        raise NotImplementedError
+
+    def stream(self, messages, on_delta, **params):
+        raise NotImplementedError
+
+
+# ═══════════════════════════════════════════════════════════════
+# GROQ SDK
+# ═══════════════════════════════════════════════════════════════
+class GroqProvider(LLMProvider):
+    name = "groq"
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, base_url=None):
+        super().__init__(model)
+        from groq import Groq
+        self.client = Groq(api_key=api_key, base_url=base_url) if base_url else Groq(api_key=api_key)
+
+    def complete(self, messages, **params):
+        response = self.client.chat.completions.create(model=self.model, messages=messages, **params)
+        choice = response.choices[0]
+        return Completion(choice.message.content or "", _usage_dict(response.usage), choice.finish_reason)
+
+    def stream(self, messages, on_delta, **params):
+        stream = self.client.chat.completions.create(model=self.model, messages=messages, stream=True, **params)
+        parts, usage, finish = [], {}, None
+        for chunk in stream:
+            # Groq reports usage on the final chunk under x_groq
+            x_groq = getattr(chunk, "x_groq", None)
+            if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                usage = _usage_dict(x_groq.usage)
+            elif getattr(chunk, "usage", None) is not None:
+                usage = _usage_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish = choice.finish_reason or finish
+            delta = choice.delta.content
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        return Completion("".join(parts), usage, finish)
+
+
+# ═══════════════════════════════════════════════════════════════
+# OPENAI-COMPATIBLE HTTP (stdlib only)
+# ═══════════════════════════════════════════════════════════════
+class OpenAICompatProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, base_url, api_key="", model=DEFAULT_MODEL, timeout=120):
+        super().__init__(model)
+        parts = urlsplit(base_url.rstrip("/"))
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path + "/chat/completions"
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _request(self, body):
+        conn_cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(self.host, self.port, timeout=self.timeout)
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        conn.request("POST", self.path, body=json.dumps(body), headers=headers)
+        resp = conn.getresponse()
+        if resp.status >= 400:
+            detail = resp.read().decode("utf-8", errors="replace")[:300]
+            retry = resp.getheader("Retry-After")
+            conn.close()
+            raise ProviderError(f"HTTP {resp.status}: {detail}", resp.status,
+                                float(retry) if retry else None)
+        return conn, resp
+
+    def complete(self, messages, **params):
+        conn, resp = self._request({"model": self.model, "messages": messages, **params})
+        try:
+            data = json.loads(resp.read())
+        finally:
+            conn.close()
+        choice = data["choices"][0]
+        return Completion(choice["message"].get("content") or "", _usage_dict(data.get("usage")),
+                          choice.get("finish_reason"))
+
+    def stream(self, messages, on_delta, **params):
+        body = {"model": self.model, "messages": messages, "stream": True,
+                "stream_options": {"include_usage": True}, **params}
+        conn, resp = self._request(body)
+        parts, usage, finish = [], {}, None
+        try:
+            for raw in resp:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                if chunk.get("usage"):
+                    usage = _usage_dict(chunk["usage"])
+                for choice in chunk.get("choices", []):
+                    finish = choice.get("finish_reason") or finish
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        on_delta(delta)
+        finally:
+            conn.close()
+        if finish is None:
+            raise ProviderError("stream ended before the model finished")
+        return Completion("".join(parts), usage, finish)
+
+
+def get_provider(api_key=None, model=None):
+    """Build the provider selected by LLM_PROVIDER, or None if it can't be configured."""
+    kind = os.getenv("LLM_PROVIDER", "groq")
+    model = model or os.getenv("LLM_MODEL", DEFAULT_MODEL)
+    if kind == "mock":
+        return OpenAICompatProvider(os.getenv("MOCK_LLM_URL", MOCK_LLM_URL), model=model)
+    if kind == "openai":
+        return OpenAICompatProvider(os.environ["LLM_BASE_URL"], api_key or "", model=model)
+    if kind != "groq":
+        raise ValueError(f"Unknown LLM_PROVIDER: {kind}")
+    if not api_key:
+        return None
+    return GroqProvider(api_key, model=model, base_url=os.getenv("GROQ_BASE_URL"))
@@ -0,0 +1,256 @@
+"""
+Atomic question quotas and API rate limits.
+
+A question takes from several token buckets in one step, all or nothing,
+before it is answered:
+
+    daily     per student: the school's daily_limit, reset at midnight
+    tokens    per student: the school's daily_token_limit of model tokens
+    student   per student: QUESTION_BURST at once, then QUESTIONS_PER_MIN
+    class     per class: CLASS_BURST at once, then CLASS_QUESTIONS_PER_MIN
+    api       per API key: LLM_TOKENS_PER_MIN model tokens (questions that
+              reach the model only), shared by every school on the key
+
+Taking up front closes the gap between "check the limit" and "count the
+question" that let a student with two tabs go past daily_limit. A question
+that never reaches the queue gets its tokens back, and the token
+reservations (estimates) are settled against response.usage once the
+answer is in.
+A limit of 0 turns that bucket off; teachers skip the question buckets.
+
+Buckets are kept as (fill level, timestamp) and drain at their rate, so a
+changed limit applies at once. LocalBuckets keeps them in memory for one
+process; SharedBuckets keeps them on the shared server (SHARED_STATE_URL)
+with WATCH/MULTI, so the limits hold across app replicas.
+"""
+import os
+import time
+import datetime
+import threading
+from collections import namedtuple
+
+# key, capacity, refill per second, cost, seconds to keep, initial fill
+Bucket = namedtuple("Bucket", "key capacity rate cost ttl seed")
+
+
+def _drain(fill, stamp, rate, now):
+    return max(0.0, fill - rate * max(0.0, now - stamp))
+
+
+def _retry_after(bucket, fill):
+    if bucket.cost > bucket.capacity:
+        return None                                   # can never fit
+    if not bucket.rate:
+        return None                                   # only resets with its key
+    return (fill + bucket.cost - bucket.capacity) / bucket.rate
+
+
+# ═══════════════════════════════════════════════════════════════
+# BUCKET ENGINES
+# ═══════════════════════════════════════════════════════════════
+class LocalBuckets:
+    def __init__(self):
+        self._state = {}              # key -> (fill, stamp, expires)
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def take(self, buckets, now=None):
+        """
+        Take every bucket's cost, or none of them. Returns (None, 0) on
+        success, else (the bucket that was short, seconds until it fits or
+        None if it won't today).
+        """
+        now = now or time.time()
+        with self._lock:
+            fills = []
+            for b in buckets:
+                fill, stamp, _ = self._state.get(b.key, (b.seed, now, 0))
+                fill = _drain(fill, stamp, b.rate, now)
+                if fill + b.cost > b.capacity:
+                    return b, _retry_after(b, fill)
+                fills.append(fill)
+            for b, fill in zip(buckets, fills):
+                self._state[b.key] = (fill + b.cost, now, now + b.ttl)
+            if now >= self._next_purge:
+                self._purge(now)
+        return None, 0
+
+    def adjust(self, buckets, now=None):
+        """Add each bucket's cost without checking (negative cost refunds)."""
+        now = now or time.time()
+        with self._lock:
+            for b in buckets:
+                fill, stamp, _ = self._state.get(b.key, (b.seed, now, 0))
+                self._state[b.key] = (max(0.0, _drain(fill, stamp, b.rate, now) + b.cost), now, now + b.ttl)
+
+    def level(self, bucket, now=None):
+        now = now or time.time()
+        with self._lock:
+            fill, stamp, _ = self._state.get(bucket.key, (bucket.seed, now, 0))
+            return _drain(fill, stamp, bucket.rate, now)
+
+    def _purge(self, now):
+        self._state = {k: v for k, v in self._state.items() if v[2] > now}
+        self._next_purge = now + 60
+
+
+class SharedBuckets:
+    """Same interface on the shared server; one optimistic transaction per take."""
+
+    def __init__(self, state):
+        self.state = state.scoped("ratelimit")
+
+    def _read(self, buckets, replies, now):
+        fills = []
+        for b, raw in zip(buckets, replies):
+            fill, stamp = (float(x) for x in raw.split()) if raw else (b.seed, now)
+            fills.append(_drain(fill, stamp, b.rate, now))
+        return fills
+
+    def _write(self, buckets, fills, now):
+        return [("SET", self.state.key(b.key), f"{fill:.3f} {now:.3f}", "EX", int(b.ttl))
+                for b, fill in zip(buckets, fills)]
+
+    def take(self, buckets, now=None):
+        keys = [self.state.key(b.key) for b in buckets]
+
+        def build(replies):
+            t = now or time.time()
+            fills = self._read(buckets, replies, t)
+            for b, fill in zip(buckets, fills):
+                if fill + b.cost > b.capacity:
+                    return (b, _retry_after(b, fill)), []
+            return (None, 0), self._write(buckets, [f + b.cost for b, f in zip(buckets, fills)], t)
+
+        return self.state.client.watch(keys, [("GET", k) for k in keys], build)
+
+    def adjust(self, buckets, now=None):
+        keys = [self.state.key(b.key) for b in buckets]
+
+        def build(replies):
+            t = now or time.time()
+            fills = self._read(buckets, replies, t)
+            return None, self._write(buckets, [max(0.0, f + b.cost) for b, f in zip(buckets, fills)], t)
+
+        self.state.client.watch(keys, [("GET", k) for k in keys], build)
+
+    def level(self, bucket, now=None):
+        now = now or time.time()
+        return self._read([bucket], [self.state.client.execute("GET", self.state.key(bucket.key))], now)[0]
+
+
+# ═══════════════════════════════════════════════════════════════
+# QUESTION LIMITS
+# ═══════════════════════════════════════════════════════════════
+class Admission:
+    """Result of QuestionLimits.admit(); holds what was taken so it can be given back."""
+
+    def __init__(self, limits, taken, blocked=None, retry_after=0):
+        self.limits = limits
+        self.taken = taken
+        self.blocked = blocked            # "daily", "tokens", "student", "class" or "api"
+        self.retry_after = retry_after
+
+    @property
+    def ok(self):
+        return self.blocked is None
+
+    def refund(self):
+        """The question was never asked: give everything back."""
+        if self.ok and self.taken:
+            self.limits.engine.adjust([b._replace(cost=-b.cost) for b in self.taken])
+            self.taken = []
+
+    def settle(self, usage):
+        """Correct the token reservations to the tokens actually used."""
+        usage = usage or {}
+        used = usage.get("total_tokens")
+        if used is None and "completion_tokens" in usage:
+            used = usage.get("prompt_tokens", 0) + usage["completion_tokens"]
+        reserved = [b for b in self.taken if QuestionLimits.kind(b) in QuestionLimits.TOKEN_KINDS]
+        if not self.ok or not reserved or used is None:
+            return
+        self.limits.engine.adjust([b._replace(cost=used - b.cost) for b in reserved])
+        self.taken = [b for b in self.taken if b not in reserved]
+
+
+class QuestionLimits:
+    API_KEY = "api"
+    TOKEN_KINDS = ("tokens", "api")
+    DAY = 86400
+
+    def __init__(self, engine, per_min=6, burst=3, class_per_min=60, class_burst=20,
+                 api_tokens_per_min=0, api_wait=10.0):
+        self.engine = engine
+        self.per_min = per_min
+        self.burst = burst
+        self.class_per_min = class_per_min
+        self.class_burst = class_burst
+        self.api_tokens_per_min = api_tokens_per_min
+        self.api_wait = api_wait
+
+    @classmethod
+    def kind(cls, bucket):
+        return "api" if bucket.key == cls.API_KEY else bucket.key.split(":")[1]
+
+    def buckets(self, scope, username, student_class, daily_limit, used_today=0, api_tokens=0,
+                teacher=False, today=None, daily_tokens=0, tokens_today=0):
+        today = today or str(datetime.date.today())
+        buckets = []
+        if not teacher:
+            if daily_limit:
+                buckets.append(Bucket(f"{scope}:daily:{today}:{username}", daily_limit, 0.0, 1,
+                                      2 * self.DAY, float(used_today)))
+            if daily_tokens and api_tokens:
+                buckets.append(Bucket(f"{scope}:tokens:{today}:{username}", daily_tokens, 0.0,
+                                      min(api_tokens, daily_tokens), 2 * self.DAY, float(tokens_today)))
+            if self.per_min:
+                buckets.append(Bucket(f"{scope}:student:{username}", max(1, self.burst),
+                                      self.per_min / 60.0, 1, 3600, 0.0))
+            if self.class_per_min and student_class:
+                buckets.append(Bucket(f"{scope}:class:{student_class}", max(1, self.class_burst),
+                                      self.class_per_min / 60.0, 1, 3600, 0.0))
+        if self.api_tokens_per_min and api_tokens:
+            # A full minute of budget is the burst; bigger requests are capped to it
+            buckets.append(Bucket(self.API_KEY, self.api_tokens_per_min, self.api_tokens_per_min / 60.0,
+                                  min(api_tokens, self.api_tokens_per_min), 3600, 0.0))
+        return buckets
+
+    def admit(self, scope, username, student_class, daily_limit, used_today=0, api_tokens=0,
+              teacher=False, daily_tokens=0, tokens_today=0):
+        """
+        Take one question (and `api_tokens` of model budget) for `username`.
+        When only the API budget is short, waits up to `api_wait` seconds
+        for it to refill instead of turning the student away.
+        """
+        buckets = self.buckets(scope, username, student_class, daily_limit, used_today,
+                               api_tokens, teacher, daily_tokens=daily_tokens, tokens_today=tokens_today)
+        deadline = time.monotonic() + self.api_wait
+        while True:
+            blocked, retry_after = self.engine.take(buckets)
+            if blocked is None:
+                return Admission(self, buckets)
+            kind = self.kind(blocked)
+            remaining = deadline - time.monotonic()
+            if kind != "api" or retry_after is None or retry_after > remaining:
+                return Admission(self, [], kind, retry_after)
+            time.sleep(max(0.05, retry_after))
+
+    def remaining_today(self, scope, username, daily_limit, used_today=0):
+        """Questions left today, counting ones still being answered."""
+        if not daily_limit:
+            return None
+        bucket = self.buckets(scope, username, "", daily_limit, used_today)[0]
+        return max(0, int(daily_limit - self.engine.level(bucket)))
+
+
+def from_env(engine):
+    return QuestionLimits(
+        engine,
+        per_min=float(os.getenv("QUESTIONS_PER_MIN", 6)),
+        burst=int(os.getenv("QUESTION_BURST", 3)),
+        class_per_min=float(os.getenv("CLASS_QUESTIONS_PER_MIN", 60)),
+        class_burst=int(os.getenv("CLASS_BURST", 20)),
+        api_tokens_per_min=int(os.getenv("LLM_TOKENS_PER_MIN", 0)),
+        api_wait=float(os.getenv("LLM_BUDGET_WAIT", 10)),
+    )
@@ -0,0 +1,238 @@
+"""
+Bulk student import and export (CSV, or XLSX when openpyxl is installed).
+
+Imports are read row by row and validated as they stream in: required
+columns, username format, duplicates within the file and against existing
+users, class values and password length. Passwords of the valid rows are
+hashed in a process pool, then every new student is written in a single
+backend transaction. Each rejected row is reported with its line number.
+
+    python roster.py import students.csv [--skip-invalid]
+    python roster.py export students.csv
+    python roster.py --school greenfield import students.csv   (TENANTS_DIR)
+"""
+import io
+import os
+import re
+import csv
+import sys
+import datetime
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from passwords import hash_password
+
+IMPORT_COLUMNS = ("username", "name", "class", "password")
+EXPORT_COLUMNS = ("username", "name", "class", "total_usage", "last_active", "created")
+CLASSES = tuple(str(i) for i in range(1, 11))
+MIN_PASSWORD = 6
+USERNAME_RE = re.compile(r"^[A-Za-z0-9_.-]{3,32}$")
+POOL_THRESHOLD = 200   # below this, hashing inline is cheaper than starting processes
+
+RowError = namedtuple("RowError", "line username message")
+
+
+class ImportReport:
+    def __init__(self):
+        self.valid = {}        # username -> row (plain-text password until hashed)
+        self.errors = []       # [RowError]
+        self.rows = 0
+        self.imported = 0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def error_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(("line", "username", "error"))
+        writer.writerows(self.errors)
+        return out.getvalue()
+
+
+# ═══════════════════════════════════════════════════════════════
+# READING
+# ═══════════════════════════════════════════════════════════════
+def _iter_csv(fileobj):
+    wrapper = None
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = wrapper = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(fileobj)
+        for row in reader:
+            yield reader.line_num, row
+    finally:
+        if wrapper is not None:
+            wrapper.detach()   # leave the caller's file open
+
+
+def _iter_xlsx(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Reading .xlsx files needs the openpyxl package; upload a CSV instead.")
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for line, row in enumerate(workbook.active.iter_rows(values_only=True), start=1):
+            yield line, ["" if v is None else str(v) for v in row]
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename=""):
+    """Yield (line number, {column: value}) for each data row."""
+    rows = _iter_xlsx(fileobj) if filename.lower().endswith(".xlsx") else _iter_csv(fileobj)
+    header = None
+    for line, row in rows:
+        if not any(cell.strip() for cell in row):
+            continue
+        if header is None:
+            header = [cell.strip().lower() for cell in row]
+            missing = [c for c in IMPORT_COLUMNS if c not in header]
+            if missing:
+                raise ValueError(f"Missing column(s): {', '.join(missing)}")
+            continue
+        yield line, dict(zip(header, (cell.strip() for cell in row)))
+
+
+# ═══════════════════════════════════════════════════════════════
+# VALIDATION + IMPORT
+# ═══════════════════════════════════════════════════════════════
+def _normalize_class(value):
+    value = value.lower().removeprefix("class").strip()
+    if value.endswith(".0"):   # spreadsheets turn 10 into 10.0
+        value = value[:-2]
+    return value
+
+
+def validate(fileobj, filename, existing):
+    """
+    Stream the file and sort rows into report.valid / report.errors.
+    `existing` is a callable telling whether a username is already taken.
+    """
+    report = ImportReport()
+    for line, row in iter_rows(fileobj, filename):
+        report.rows += 1
+        username = row.get("username", "")
+        cls = _normalize_class(row.get("class", ""))
+        problems = []
+        if not USERNAME_RE.match(username):
+            problems.append("username must be 3-32 letters, digits, '.', '_' or '-'")
+        elif username in report.valid:
+            problems.append("duplicate username in file")
+        elif existing(username):
+            problems.append("username already exists")
+        if not row.get("name"):
+            problems.append("name is required")
+        if cls not in CLASSES:
+            problems.append(f"class must be 1-10 (got {row.get('class', '')!r})")
+        if len(row.get("password", "")) < MIN_PASSWORD:
+            problems.append(f"password must be at least {MIN_PASSWORD} characters")
+        if problems:
+            report.errors.append(RowError(line, username, "; ".join(problems)))
+        else:
+            report.valid[username] = {"name": row["name"], "class": cls, "password": row["password"]}
+    return report
+
+
+def hash_passwords(passwords, workers=None):
+    """Hash a list of passwords, in a process pool when there are many."""
+    if len(passwords) < POOL_THRESHOLD:
+        return [hash_password(p) for p in passwords]
+    workers = workers or min(8, os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def import_students(store, fileobj, filename="", skip_invalid=False, workers=None):
+    """
+    Validate and import a roster. Unless skip_invalid is set, nothing is
+    written when any row fails validation.
+    """
+    report = validate(fileobj, filename, store.has_user)
+    if not report.valid or (report.errors and not skip_invalid):
+        return report
+    today = str(datetime.date.today())
+    usernames = list(report.valid)
+    hashes = hash_passwords([report.valid[u]["password"] for u in usernames], workers)
+    users = {
+        username: {
+            "password": hashed,
+            "role": "student",
+            "name": report.valid[username]["name"],
+            "class": report.valid[username]["class"],
+            "usage_today": 0,
+            "total_usage": 0,
+            "last_active": "",
+            "created": today
+        }
+        for username, hashed in zip(usernames, hashes)
+    }
+    taken = store.add_users(users)
+    for username in taken:
+        # Created by another session between validation and commit
+        report.errors.append(RowError("", username, "username already exists"))
+    report.imported = len(users) - len(taken)
+    return report
+
+
+# ═══════════════════════════════════════════════════════════════
+# EXPORT
+# ═══════════════════════════════════════════════════════════════
+def iter_export_csv(users):
+    """Yield the student roster as CSV text, one line at a time (no passwords)."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def line(values):
+        out.seek(0)
+        out.truncate()
+        writer.writerow(values)
+        return out.getvalue()
+
+    yield line(EXPORT_COLUMNS)
+    for username in sorted(users):
+        user = users[username]
+        if user.get("role") != "student":
+            continue
+        yield line([username] + [user.get(c, "") for c in EXPORT_COLUMNS[1:]])
+
+
+def main(argv=None):
+    import argparse
+    from storage import open_storage
+    from store import SchoolStore
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--school", default="", help="school id under TENANTS_DIR")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import")
+    imp.add_argument("path")
+    imp.add_argument("--skip-invalid", action="store_true")
+    exp = sub.add_parser("export")
+    exp.add_argument("path")
+    args = parser.parse_args(argv)
+
+    root = os.path.join(os.getenv("TENANTS_DIR", "tenants"), args.school) if args.school else None
+    if root and not os.path.isdir(root):
+        parser.error(f"no school directory {root}")
+    # Same namespace as tenants.open_school, for STORAGE_BACKEND=redis
+    store = SchoolStore(open_storage(root=root, namespace=args.school or None))
+    try:
+        if args.command == "export":
+            with open(args.path, "w", newline="", encoding="utf-8") as f:
+                f.writelines(iter_export_csv(store.users(role="student")))
+            return 0
+        with open(args.path, "rb") as f:
+            report = import_students(store, f, args.path, args.skip_invalid)
+        for error in report.errors:
+            print(f"line {error.line}: {error.username}: {error.message}", file=sys.stderr)
+        print(f"{report.imported} of {report.rows} rows imported")
+        return 0 if report.imported or not report.rows else 1
+    finally:
+        store.backend.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+Shared state for running several app replicas behind a load balancer.
+
+Set SHARED_STATE_URL (redis://[:password@]host:6379/0) and every replica
+keeps the state that has to agree across replicas in one Redis-protocol
+server:
+
+- the school data itself (STORAGE_BACKEND defaults to "redis", see
+  storage.RedisStorage) with its daily and total question counters
+- login throttling (SharedLoginThrottle)
+- the per-student in-flight limit for model calls (SharedInflight)
+- exact-match answers (AnswerCache's second level)
+
+Streamlit sessions live on the websocket, so the load balancer still needs
+sticky sessions; anything a session needs from another replica goes
+through the store above. mock_redis_server.py is a local stand-in for tests
+and load runs. There are no third-party dependencies: the client speaks
+RESP over a small connection pool.
+"""
+import os
+import json
+import queue
+import socket
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+DEFAULT_PREFIX = "ai9campus:"
+
+
+class RespError(Exception):
+    pass
+
+
+class WatchFailed(Exception):
+    """A WATCHed key kept changing; the transaction was not applied."""
+
+
+def _encode(args):
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+class _Connection:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def send(self, commands):
+        self.sock.sendall(b"".join(_encode(c) for c in commands))
+
+    def read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by the shared state server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self.reader.read(n + 2)[:-2]
+            return data.decode("utf-8", "surrogateescape")
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self.read() for _ in range(n)]
+        raise RespError(f"bad reply from server: {line!r}")
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """Thread-safe client with a small pool of persistent connections."""
+
+    def __init__(self, url, pool_size=16, timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").strip("/") or 0)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = _Connection(self.host, self.port, self.timeout)
+            setup = ([("AUTH", self.password)] if self.password else []) + \
+                    ([("SELECT", self.db)] if self.db else [])
+            if setup:
+                conn.send(setup)
+                for reply in [conn.read() for _ in setup]:
+                    if isinstance(reply, RespError):
+                        raise reply
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, broken=False):
+        if broken:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    def _roundtrip(self, conn, commands):
+        conn.send(commands)
+        return [conn.read() for _ in commands]
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def pipeline(self, commands, transaction=False):
+        """
+        Send `commands` in one round trip and return their replies. With
+        `transaction`, they run as one MULTI/EXEC block.
+        """
+        commands = list(commands)
+        if transaction:
+            commands = [("MULTI",)] + commands + [("EXEC",)]
+        conn = self._acquire()
+        try:
+            replies = self._roundtrip(conn, commands)
+        except BaseException:
+            self._release(conn, broken=True)
+            raise
+        self._release(conn)
+        if not transaction:
+            return replies
+        for reply in replies[:-1]:
+            if isinstance(reply, RespError):
+                raise reply
+        if isinstance(replies[-1], RespError):
+            raise replies[-1]
+        return replies[-1]
+
+    def watch(self, keys, read, build, retries=50):
+        """
+        Optimistic read-modify-write. WATCHes `keys`, runs the `read`
+        commands and calls build(replies) -> (result, commands); the commands
+        then run in a MULTI/EXEC that is discarded and retried if a watched
+        key changed in between. Returns the result of the applied attempt.
+        """
+        for _ in range(retries):
+            conn = self._acquire()
+            try:
+                replies = self._roundtrip(conn, [("WATCH", *keys)] + list(read))[1:]
+                result, commands = build(replies)
+                if commands:
+                    done = self._roundtrip(conn, [("MULTI",)] + list(commands) + [("EXEC",)])[-1]
+                else:
+                    self._roundtrip(conn, [("UNWATCH",)])
+                    done = True
+            except BaseException:
+                self._release(conn, broken=True)
+                raise
+            self._release(conn)
+            if isinstance(done, RespError):
+                raise done
+            if done is not None:
+                return result
+        raise WatchFailed(keys)
+
+
+class SharedState:
+    """Key helpers under a prefix (one per school)."""
+
+    def __init__(self, client, prefix=DEFAULT_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+    def key(self, *parts):
+        return self.prefix + ":".join(str(p) for p in parts)
+
+    def scoped(self, name):
+        return SharedState(self.client, f"{self.prefix}{name}:")
+
+    def incr(self, key, amount=1, ttl=None):
+        commands = [("INCRBY", self.key(key), amount)]
+        if ttl:
+            commands.append(("EXPIRE", self.key(key), int(ttl)))
+        return self.client.pipeline(commands, transaction=True)[0]
+
+    def get_int(self, key):
+        return int(self.client.execute("GET", self.key(key)) or 0)
+
+    def get_json(self, key):
+        raw = self.client.execute("GET", self.key(key))
+        return None if raw is None else json.loads(raw)
+
+    def set_json(self, key, value, ttl=None):
+        args = ["SET", self.key(key), json.dumps(value)]
+        if ttl:
+            args += ["EX", int(ttl)]
+        self.client.execute(*args)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_shared_state(prefix=None):
+    """SharedState for SHARED_STATE_URL (one connection pool per process), or None."""
+    url = os.getenv("SHARED_STATE_URL")
+    if not url:
+        return None
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = _clients[url] = RespClient(url, pool_size=int(os.getenv("SHARED_STATE_POOL", 16)))
+    return SharedState(client, prefix or os.getenv("SHARED_STATE_PREFIX", DEFAULT_PREFIX))
+
+
+# ═══════════════════════════════════════════════════════════════
+# LIMITS SHARED BY ALL REPLICAS
+# ═══════════════════════════════════════════════════════════════
+class SharedLoginThrottle:
+    """LoginThrottle with its counters on the shared server; failures expire `window` after the last one."""
+
+    def __init__(self, state, max_failures=5, window=300.0, lockout=300.0, spacing=10.0):
+        self.state = state.scoped("login")
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.spacing = spacing
+
+    @staticmethod
+    def _id(key):
+        return hashlib.sha256(key.encode()).hexdigest()[:24]
+
+    def retry_in(self, username, client=""):
+        replies = self.state.client.pipeline([
+            ("PTTL", self.state.key("locked", self._id(f"{username}@{client}"))),
+            ("PTTL", self.state.key("slow", self._id(username))),
+        ])
+        ms = max(r if isinstance(r, int) else 0 for r in replies)
+        return ms / 1000.0 if ms > 0 else 0
+
+    def failed(self, username, client=""):
+        for kind, key, hold in (("locked", f"{username}@{client}", self.lockout),
+                                ("slow", username, self.spacing)):
+            failures = self.state.incr(f"failures:{kind}:{self._id(key)}", ttl=self.window)
+            if failures >= self.max_failures:
+                commands = [("SET", self.state.key(kind, self._id(key)), 1, "PX", int(hold * 1000))]
+                if kind == "locked":
+                    commands.append(("DEL", self.state.key("failures", kind, self._id(key))))
+                self.state.client.pipeline(commands, transaction=True)
+
+    def succeeded(self, username, client=""):
+        self.state.client.execute("DEL", self.state.key("failures", "locked", self._id(f"{username}@{client}")))
+
+
+class SharedInflight:
+    """
+    Per-student in-flight counter for LLMQueue across replicas. Slots expire
+    after `ttl` seconds so a replica that dies mid-answer can't lock a
+    student out.
+    """
+
+    def __init__(self, state, ttl=300):
+        self.state = state.scoped("inflight")
+        self.ttl = ttl
+
+    def acquire(self, key, limit):
+        name = self.state.key(key)
+
+        def build(replies):
+            if int(replies[0] or 0) >= limit:
+                return False, []
+            return True, [("INCR", name), ("EXPIRE", name, int(self.ttl))]
+        return self.state.client.watch([name], [("GET", name)], build)
+
+    def release(self, key):
+        # Only while the slot still exists: after it expired a plain DECR
+        # would leave the count at -1 with no TTL
+        name = self.state.key(key)
+
+        def build(replies):
+            if int(replies[0] or 0) <= 0:
+                return None, []
+            return None, [("DECR", name)]
+        self.state.client.watch([name], [("GET", name)], build)
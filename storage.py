@@ -0,0 +1,737 @@
+"""
+Storage backends for school data.
+
+Three kinds of records are kept: users, school settings and the interaction
+log. The app talks to a StorageBackend; SqliteStorage is the default engine
+and JsonStorage keeps a JSON snapshot plus an append-only log for small
+deployments.
+
+    python storage.py migrate school_data.json school_data.db
+"""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import datetime
+import threading
+from pathlib import Path
+from collections import Counter
+
+from eventlog import SegmentedLog
+
+DATA_FILE = "school_data.json"
+DB_FILE = "school_data.db"
+LOG_DIR = "logs"
+
+# Columns stored natively in the users table; anything else lives in `extra`
+USER_FIELDS = ("password", "role", "name", "class", "usage_today", "total_usage",
+               "last_active", "last_active_date", "created")
+LOG_FIELDS = ("user", "type", "subject", "timestamp", "date")
+
+
+def get_default_data():
+    return {
+        "users": {
+            "admin": {
+                "password": hashlib.sha256("admin123".encode()).hexdigest(),
+                "role": "teacher",
+                "name": "Administrator",
+                "class": "N/A",
+                "usage_today": 0,
+                "total_usage": 0,
+                "last_active": "",
+                "created": str(datetime.date.today())
+            },
+            "student1": {
+                "password": hashlib.sha256("student123".encode()).hexdigest(),
+                "role": "student",
+                "name": "Demo Student",
+                "class": "10",
+                "usage_today": 0,
+                "total_usage": 0,
+                "last_active": "",
+                "created": str(datetime.date.today())
+            }
+        },
+        "settings": {
+            "school_name": "School Name",
+            "daily_limit": 30,
+            "daily_token_limit": 0,
+            "total_limit": 500
+        },
+        "logs": []
+    }
+
+
+def apply_interaction(user, entry):
+    """Bump a user's question and token counters for one log entry (in place)."""
+    today = entry.get("date", "")
+    tokens = int(entry.get("prompt_tokens") or 0) + int(entry.get("completion_tokens") or 0)
+    user["total_usage"] = user.get("total_usage", 0) + 1
+    user["last_active"] = entry.get("timestamp", "")
+    if user.get("last_active_date", "") != today:
+        user["usage_today"] = 0
+        user["tokens_today"] = 0
+        user["last_active_date"] = today
+    user["usage_today"] = user.get("usage_today", 0) + 1
+    user["tokens_today"] = user.get("tokens_today", 0) + tokens
+    user["total_tokens"] = user.get("total_tokens", 0) + tokens
+    return user
+
+
+# ═══════════════════════════════════════════════════════════════
+# BACKEND INTERFACE
+# ═══════════════════════════════════════════════════════════════
+class StorageBackend:
+    """Interface every storage engine implements."""
+
+    def load_users(self):
+        raise NotImplementedError
+
+    def load_settings(self):
+        raise NotImplementedError
+
+    def save_user(self, username, user):
+        raise NotImplementedError
+
+    def save_users(self, users):
+        for username, user in users.items():
+            self.save_user(username, user)
+
+    def save_settings(self, settings):
+        raise NotImplementedError
+
+    def append_log(self, entry):
+        raise NotImplementedError
+
+    def record_interaction(self, entry, username, user):
+        """Append a log entry and persist the updated user together."""
+        self.append_log(entry)
+        if user is not None:
+            self.save_user(username, user)
+
+    def recent_logs(self, limit=20):
+        """Newest-first list of the last `limit` log entries."""
+        raise NotImplementedError
+
+    def count_logs(self, date):
+        raise NotImplementedError
+
+    def iter_logs(self):
+        raise NotImplementedError
+
+    def aggregate_logs(self):
+        """(date, user, class, detected_subject, count) rows over the whole log."""
+        counts = Counter()
+        for l in self.iter_logs():
+            counts[(l.get("date", ""), l.get("user", ""), l.get("class", ""), l.get("detected_subject"))] += 1
+        return [key + (n,) for key, n in counts.items()]
+
+    def load_data(self):
+        return {"users": self.load_users(), "settings": self.load_settings()}
+
+    def save_data(self, data):
+        self.save_settings(data["settings"])
+        self.save_users(data["users"])
+
+    def close(self):
+        pass
+
+
+# ═══════════════════════════════════════════════════════════════
+# JSON SNAPSHOT + APPEND-ONLY LOG BACKEND
+# ═══════════════════════════════════════════════════════════════
+class JsonStorage(StorageBackend):
+    """
+    Users and settings in a small JSON snapshot (replaced atomically on
+    change); interactions go to daily JSON-Lines segments in LOG_DIR.
+    Legacy files with an embedded "logs" list are split out on first load.
+
+    A question only appends to the log; the counters it bumps reach the
+    snapshot at most `snapshot_interval` seconds later. After a crash they
+    are replayed from log entries newer than each user's last_active.
+    """
+
+    def __init__(self, path=DATA_FILE, log_dir=LOG_DIR, snapshot_interval=5.0):
+        self.path = Path(path)
+        self.log = SegmentedLog(log_dir)
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+        self._timer = None          # pending snapshot write, if any
+        self._data = self._read()
+        self._recover()
+        self.log.compact()
+
+    def _read(self):
+        data = None
+        if self.path.exists():
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                pass
+        if data is None:
+            data = get_default_data()
+        legacy_logs = data.pop("logs", None)
+        if legacy_logs:
+            for entry in sorted(legacy_logs, key=lambda l: l.get("date", "")):
+                self.log.append(entry)
+            self.log.flush()
+            self._data = data
+            self._write()
+        return data
+
+    def _recover(self):
+        users = self._data["users"]
+        marks = {u: str(d.get("last_active", "")) for u, d in users.items()}
+        since = min((m[:10] for m in marks.values() if m), default="")
+        replayed = 0
+        for entry in self.log.iter_entries():
+            name = entry.get("user", "")
+            if entry.get("date", "") < since or name not in users:
+                continue
+            if str(entry.get("timestamp", "")) > marks[name]:
+                apply_interaction(users[name], entry)
+                replayed += 1
+        if replayed:
+            self._write()
+
+    def _write(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def load_users(self):
+        with self._lock:
+            return json.loads(json.dumps(self._data["users"]))
+
+    def load_settings(self):
+        with self._lock:
+            return dict(self._data["settings"])
+
+    def save_user(self, username, user):
+        with self._lock:
+            self._data["users"][username] = dict(user)
+            self._write()
+
+    def save_users(self, users):
+        with self._lock:
+            for username, user in users.items():
+                self._data["users"][username] = dict(user)
+            self._write()
+
+    def save_settings(self, settings):
+        with self._lock:
+            self._data["settings"] = dict(settings)
+            self._write()
+
+    def append_log(self, entry):
+        self.log.append(entry)
+
+    def record_interaction(self, entry, username, user):
+        with self._lock:
+            self.log.append(entry)
+            if user is None:
+                return
+            self._data["users"][username] = dict(user)
+            if self._timer is None:
+                self._timer = threading.Timer(self.snapshot_interval, self._flush_snapshot)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_snapshot(self):
+        with self._lock:
+            if self._timer is not None:
+                self._write()
+
+    def recent_logs(self, limit=20):
+        return self.log.tail(limit)
+
+    def count_logs(self, date):
+        return self.log.count(date)
+
+    def iter_logs(self):
+        return self.log.iter_entries()
+
+    def save_data(self, data):
+        with self._lock:
+            self._data["settings"] = dict(data["settings"])
+            self._data["users"] = json.loads(json.dumps(data["users"]))
+            self._write()
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._write()
+        self.log.close()
+
+
+# ═══════════════════════════════════════════════════════════════
+# SQLITE BACKEND (WAL mode)
+# ═══════════════════════════════════════════════════════════════
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username         TEXT PRIMARY KEY,
+    password         TEXT NOT NULL,
+    role             TEXT NOT NULL DEFAULT 'student',
+    name             TEXT NOT NULL DEFAULT '',
+    class            TEXT NOT NULL DEFAULT '',
+    usage_today      INTEGER NOT NULL DEFAULT 0,
+    total_usage      INTEGER NOT NULL DEFAULT 0,
+    last_active      TEXT NOT NULL DEFAULT '',
+    last_active_date TEXT NOT NULL DEFAULT '',
+    created          TEXT NOT NULL DEFAULT '',
+    extra            TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS logs (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    user      TEXT NOT NULL,
+    type      TEXT NOT NULL,
+    subject   TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL,
+    date      TEXT NOT NULL,
+    extra     TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_logs_date ON logs(date);
+CREATE INDEX IF NOT EXISTS idx_logs_user ON logs(user, date);
+"""
+
+
+class SqliteStorage(StorageBackend):
+    """
+    SQLite engine in WAL mode. Each interaction is one indexed row insert;
+    users and settings are updated row by row instead of rewriting a file.
+    Connections are per thread, so one instance can be shared by sessions.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = str(path)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def is_empty(self):
+        row = self._conn().execute("SELECT COUNT(*) FROM users").fetchone()
+        return row[0] == 0
+
+    # ── Users ────────────────────────────────────────────────
+    @staticmethod
+    def _user_row(username, user):
+        extra = {k: v for k, v in user.items() if k not in USER_FIELDS}
+        return (
+            username,
+            user.get("password", ""),
+            user.get("role", "student"),
+            user.get("name", ""),
+            str(user.get("class", "")),
+            int(user.get("usage_today", 0)),
+            int(user.get("total_usage", 0)),
+            str(user.get("last_active", "")),
+            str(user.get("last_active_date", "")),
+            str(user.get("created", "")),
+            json.dumps(extra),
+        )
+
+    @staticmethod
+    def _user_from_row(row):
+        user = {k: row[k] for k in USER_FIELDS}
+        if not user["last_active_date"]:
+            del user["last_active_date"]
+        user.update(json.loads(row["extra"] or "{}"))
+        return user
+
+    def load_users(self):
+        rows = self._conn().execute("SELECT * FROM users ORDER BY rowid").fetchall()
+        return {r["username"]: self._user_from_row(r) for r in rows}
+
+    def save_user(self, username, user):
+        with self._conn() as conn:
+            self._upsert_user(conn, username, user)
+
+    def save_users(self, users):
+        with self._conn() as conn:
+            for username, user in users.items():
+                self._upsert_user(conn, username, user)
+
+    def _upsert_user(self, conn, username, user):
+        conn.execute(
+            "INSERT OR REPLACE INTO users (username, password, role, name, class, usage_today, "
+            "total_usage, last_active, last_active_date, created, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._user_row(username, user),
+        )
+
+    # ── Settings ─────────────────────────────────────────────
+    def load_settings(self):
+        rows = self._conn().execute("SELECT key, value FROM settings").fetchall()
+        settings = dict(get_default_data()["settings"])
+        settings.update({r["key"]: json.loads(r["value"]) for r in rows})
+        return settings
+
+    def save_settings(self, settings):
+        with self._conn() as conn:
+            self._write_settings(conn, settings)
+
+    @staticmethod
+    def _write_settings(conn, settings):
+        conn.executemany(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in settings.items()],
+        )
+
+    # ── Logs ─────────────────────────────────────────────────
+    @staticmethod
+    def _log_row(entry):
+        extra = {k: v for k, v in entry.items() if k not in LOG_FIELDS}
+        return (entry.get("user", ""), entry.get("type", ""), entry.get("subject", "") or "",
+                entry.get("timestamp", ""), entry.get("date", ""), json.dumps(extra))
+
+    @staticmethod
+    def _log_from_row(row):
+        entry = {k: row[k] for k in LOG_FIELDS}
+        entry.update(json.loads(row["extra"] or "{}"))
+        return entry
+
+    def _insert_log(self, conn, entry):
+        conn.execute(
+            "INSERT INTO logs (user, type, subject, timestamp, date, extra) VALUES (?, ?, ?, ?, ?, ?)",
+            self._log_row(entry),
+        )
+
+    def append_log(self, entry):
+        with self._conn() as conn:
+            self._insert_log(conn, entry)
+
+    def record_interaction(self, entry, username, user):
+        with self._conn() as conn:
+            self._insert_log(conn, entry)
+            if user is not None:
+                self._upsert_user(conn, username, user)
+
+    def recent_logs(self, limit=20):
+        rows = self._conn().execute(
+            "SELECT * FROM logs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._log_from_row(r) for r in rows]
+
+    def count_logs(self, date):
+        row = self._conn().execute("SELECT COUNT(*) FROM logs WHERE date = ?", (date,)).fetchone()
+        return row[0]
+
+    def iter_logs(self):
+        cur = self._conn().execute("SELECT * FROM logs ORDER BY id")
+        for row in cur:
+            yield self._log_from_row(row)
+
+    def aggregate_logs(self):
+        return [tuple(r) for r in self._conn().execute(
+            "SELECT date, user, json_extract(extra, '$.class'), json_extract(extra, '$.detected_subject'), "
+            "COUNT(*) FROM logs GROUP BY 1, 2, 3, 4")]
+
+    def save_data(self, data):
+        with self._conn() as conn:
+            self._write_settings(conn, data["settings"])
+            for username, user in data["users"].items():
+                self._upsert_user(conn, username, user)
+
+    def import_data(self, data):
+        """Load a full legacy document (users, settings, logs) in one transaction."""
+        with self._conn() as conn:
+            self._write_settings(conn, data.get("settings", {}))
+            for username, user in data.get("users", {}).items():
+                self._upsert_user(conn, username, user)
+            conn.executemany(
+                "INSERT INTO logs (user, type, subject, timestamp, date, extra) VALUES (?, ?, ?, ?, ?, ?)",
+                (self._log_row(l) for l in data.get("logs", [])),
+            )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ═══════════════════════════════════════════════════════════════
+# SHARED BACKEND (Redis protocol, for several app replicas)
+# ═══════════════════════════════════════════════════════════════
+class RedisStorage(StorageBackend):
+    """
+    Users, settings and the log on a Redis-protocol server (see
+    shared_state.py), so app replicas on different nodes serve one school.
+
+    Question and token counters are hash fields bumped with HINCRBY, so two
+    replicas logging for the same student never lose an increment. Every
+    write is also appended to a change feed (a capped stream); each replica's
+    SchoolStore applies the other replicas' writes on its next run via
+    changes().
+    """
+
+    FEED_MAXLEN = 20000
+    USAGE_TTL = 3 * 86400
+    LOG_PAGE = 1000
+
+    def __init__(self, state):
+        self.state = state
+        self.origin = os.urandom(6).hex()     # tells our own feed entries apart
+        last = state.client.execute("XREVRANGE", state.key("feed"), "+", "-", "COUNT", 1)
+        self._cursor = last[0][0] if last else "0-0"
+
+    def _feed(self, kind, **data):
+        return ("XADD", self.state.key("feed"), "MAXLEN", "~", self.FEED_MAXLEN, "*",
+                "origin", self.origin, "kind", kind, "data", json.dumps(data))
+
+    def is_empty(self):
+        return not self.state.client.execute("HLEN", self.state.key("users"))
+
+    # ── Users ────────────────────────────────────────────────
+    def load_users(self):
+        today = str(datetime.date.today())
+        raw, totals, used, total_tokens, tokens = self.state.client.pipeline([
+            ("HGETALL", self.state.key("users")),
+            ("HGETALL", self.state.key("total_usage")),
+            ("HGETALL", self.state.key("usage", today)),
+            ("HGETALL", self.state.key("total_tokens")),
+            ("HGETALL", self.state.key("tokens", today)),
+        ])
+        users = {name: json.loads(data) for name, data in zip(raw[::2], raw[1::2])}
+        for field, counts in (("total_usage", totals), ("total_tokens", total_tokens)):
+            for name, n in zip(counts[::2], counts[1::2]):
+                if name in users:
+                    users[name][field] = int(n)
+        for field, counts in (("usage_today", used), ("tokens_today", tokens)):
+            for name, n in zip(counts[::2], counts[1::2]):
+                if name in users:
+                    if users[name].get("last_active_date") != today:
+                        users[name].update(usage_today=0, tokens_today=0, last_active_date=today)
+                    users[name][field] = int(n)
+        return users
+
+    def save_user(self, username, user):
+        self.save_users({username: user})
+
+    def save_users(self, users):
+        if not users:
+            return
+        commands = []
+        for username, user in users.items():
+            commands.append(("HSET", self.state.key("users"), username, json.dumps(user)))
+            commands.append(self._feed("user", name=username, user=user))
+        self.state.client.pipeline(commands, transaction=True)
+
+    def usage_today(self, username, today):
+        """The student's question count for `today`, straight from the shared counter."""
+        return int(self.state.client.execute("HGET", self.state.key("usage", today), username) or 0)
+
+    def tokens_today(self, username, today):
+        return int(self.state.client.execute("HGET", self.state.key("tokens", today), username) or 0)
+
+    # ── Settings ─────────────────────────────────────────────
+    def load_settings(self):
+        raw = self.state.client.execute("HGETALL", self.state.key("settings"))
+        settings = dict(get_default_data()["settings"])
+        settings.update({k: json.loads(v) for k, v in zip(raw[::2], raw[1::2])})
+        return settings
+
+    def save_settings(self, settings):
+        pairs = [x for k, v in settings.items() for x in (k, json.dumps(v))]
+        self.state.client.pipeline([
+            ("HSET", self.state.key("settings"), *pairs),
+            self._feed("settings", settings=settings),
+        ], transaction=True)
+
+    # ── Logs ─────────────────────────────────────────────────
+    def _log_commands(self, entry):
+        return [("RPUSH", self.state.key("logs"), json.dumps(entry)),
+                ("INCR", self.state.key("logs", "day", entry.get("date", "")))]
+
+    def append_log(self, entry):
+        self.state.client.pipeline(self._log_commands(entry) + [self._feed("log", entry=entry)],
+                                   transaction=True)
+
+    def record_interaction(self, entry, username, user):
+        if user is None:
+            return self.append_log(entry)
+        # One transaction for counters, log, user row and feed entry. The row
+        # and feed carry this replica's counts; the shared counters they may
+        # lag behind win in load_users() and in the max-merge of sync(), and
+        # replace the local copy from the EXEC replies below
+        date = entry["date"]
+        tokens = int(entry.get("prompt_tokens") or 0) + int(entry.get("completion_tokens") or 0)
+        replies = self.state.client.pipeline([
+            ("HINCRBY", self.state.key("usage", date), username, 1),
+            ("EXPIRE", self.state.key("usage", date), self.USAGE_TTL),
+            ("HINCRBY", self.state.key("total_usage"), username, 1),
+            ("HINCRBY", self.state.key("tokens", date), username, tokens),
+            ("EXPIRE", self.state.key("tokens", date), self.USAGE_TTL),
+            ("HINCRBY", self.state.key("total_tokens"), username, tokens),
+        ] + self._log_commands(entry) + [
+            ("HSET", self.state.key("users"), username, json.dumps(user)),
+            self._feed("log", entry=entry, name=username, user=user),
+        ], transaction=True)
+        used, _, total, tokens_today, _, total_tokens = replies[:6]
+        user["usage_today"], user["total_usage"] = used, total
+        user["tokens_today"], user["total_tokens"] = tokens_today, total_tokens
+
+    def recent_logs(self, limit=20):
+        raw = self.state.client.execute("LRANGE", self.state.key("logs"), -limit, -1)
+        return [json.loads(r) for r in reversed(raw)]
+
+    def count_logs(self, date):
+        return self.state.get_int(f"logs:day:{date}")
+
+    def iter_logs(self):
+        start = 0
+        while True:
+            page = self.state.client.execute("LRANGE", self.state.key("logs"), start, start + self.LOG_PAGE - 1)
+            for raw in page:
+                yield json.loads(raw)
+            if len(page) < self.LOG_PAGE:
+                return
+            start += self.LOG_PAGE
+
+    def import_data(self, data):
+        """Seed an empty school (users, settings, logs) in one transaction."""
+        commands = [("HSET", self.state.key("users"), name, json.dumps(user))
+                    for name, user in data.get("users", {}).items()]
+        if data.get("settings"):
+            pairs = [x for k, v in data["settings"].items() for x in (k, json.dumps(v))]
+            commands.append(("HSET", self.state.key("settings"), *pairs))
+        for entry in data.get("logs", []):
+            commands.extend(self._log_commands(entry))
+        self.state.client.pipeline(commands, transaction=True)
+
+    # ── Change feed ──────────────────────────────────────────
+    def changes(self, limit=500):
+        """
+        Other replicas' writes since the last call, as [(kind, data)]; None if
+        the feed was trimmed past our position and everything must be reloaded.
+        """
+        feed = self.state.key("feed")
+        out = []
+        while True:
+            first, page = self.state.client.pipeline([
+                ("XRANGE", feed, "-", "+", "COUNT", 1),
+                ("XRANGE", feed, "(" + self._cursor, "+", "COUNT", limit),
+            ])
+            if self._cursor != "0-0" and first and _stream_id(first[0][0]) > _stream_id(self._cursor):
+                last = self.state.client.execute("XREVRANGE", feed, "+", "-", "COUNT", 1)
+                self._cursor = last[0][0]
+                return None
+            for entry_id, fields in page:
+                fields = dict(zip(fields[::2], fields[1::2]))
+                self._cursor = entry_id
+                if fields.get("origin") != self.origin:
+                    out.append((fields["kind"], json.loads(fields["data"])))
+            if len(page) < limit:
+                return out
+
+
+def _stream_id(text):
+    ms, _, seq = text.partition("-")
+    return int(ms), int(seq or 0)
+
+
+# ═══════════════════════════════════════════════════════════════
+# MIGRATION + FACTORY
+# ═══════════════════════════════════════════════════════════════
+def migrate_json_to_sqlite(json_path=DATA_FILE, db_path=DB_FILE):
+    """
+    One-shot import of the legacy school_data.json into SQLite. Refuses to
+    run against a database that already has users so it is safe to re-run.
+    Returns (users, logs) counts imported.
+    """
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    store = SqliteStorage(db_path)
+    try:
+        if not store.is_empty():
+            raise RuntimeError(f"{db_path} already contains users; refusing to migrate")
+        store.import_data(data)
+        return len(data.get("users", {})), len(data.get("logs", []))
+    finally:
+        store.close()
+
+
+def open_storage(backend=None, root=None, namespace=None):
+    """
+    Build the configured backend. STORAGE_BACKEND selects "sqlite" (default)
+    or "json", or "redis" (the default when SHARED_STATE_URL is set) with
+    keys under `namespace`. A fresh SQLite database or Redis namespace is
+    seeded from school_data.json when that file exists, otherwise from
+    get_default_data(). With `root` (one school's directory, see tenants.py)
+    the default file names are used inside it instead of the DB_FILE /
+    DATA_FILE / LOG_DIR paths.
+    """
+    backend = backend or os.getenv("STORAGE_BACKEND") or ("redis" if os.getenv("SHARED_STATE_URL") else "sqlite")
+    if root is None:
+        db_path = os.getenv("DB_FILE", DB_FILE)
+        json_path = os.getenv("DATA_FILE", DATA_FILE)
+        log_dir = os.getenv("LOG_DIR", LOG_DIR)
+    else:
+        db_path, json_path, log_dir = (Path(root) / name for name in (DB_FILE, DATA_FILE, LOG_DIR))
+    if backend == "redis":
+        return _open_redis(namespace or "default", json_path)
+    if backend == "json":
+        return JsonStorage(json_path, log_dir)
+    if backend != "sqlite":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+    store = SqliteStorage(db_path)
+    if store.is_empty():
+        store.import_data(_seed_data(json_path))
+    return store
+
+
+def _seed_data(json_path):
+    """The school's school_data.json if it can be read, else get_default_data()."""
+    if Path(json_path).exists():
+        try:
+            with open(json_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return get_default_data()
+
+
+def _open_redis(namespace, json_path):
+    from shared_state import get_shared_state
+    state = get_shared_state()
+    if state is None:
+        raise ValueError("STORAGE_BACKEND=redis needs SHARED_STATE_URL")
+    store = RedisStorage(state.scoped(namespace))
+    # Only the first replica to start seeds the school, from its own directory
+    if store.is_empty() and state.client.execute("SET", state.key(namespace, "seeded"), 1, "NX"):
+        store.import_data(_seed_data(json_path))
+    return store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        src = sys.argv[2] if len(sys.argv) > 2 else DATA_FILE
+        dst = sys.argv[3] if len(sys.argv) > 3 else DB_FILE
+        n_users, n_logs = migrate_json_to_sqlite(src, dst)
+        print(f"Migrated {n_users} users and {n_logs} log entries into {dst}")
+    else:
+        print("usage: python storage.py migrate [school_data.json] [school_data.db]")
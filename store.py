@@ -0,0 +1,288 @@
+"""
+Process-wide school data store shared by every Streamlit session.
+
+Users and settings are loaded from the storage backend once and kept in
+memory. Reads return copies; writes take a per-user (or settings) lock,
+update memory and persist through the backend, so concurrent sessions
+never overwrite each other's counters. With a shared backend, sync()
+brings in what other app replicas wrote.
+"""
+import copy
+import datetime
+import threading
+from collections import defaultdict
+
+from storage import apply_interaction
+from usage import UsageAggregates
+
+
+class SchoolStore:
+    def __init__(self, backend, rollups=None):
+        self.backend = backend
+        self.rollups = rollups
+        self._users = backend.load_users()
+        self._settings = backend.load_settings()
+        self._users_lock = threading.Lock()     # guards the users dict itself
+        self._settings_lock = threading.Lock()
+        self._user_locks = defaultdict(threading.Lock)
+        self._students_by_class = defaultdict(set)   # class -> usernames
+        for username, user in self._users.items():
+            self._index_user(username, user)
+        self.usage = UsageAggregates()
+        self.usage.load(backend.aggregate_logs(), self._users, backend.recent_logs(self.usage.recent.maxlen))
+        if rollups is not None and rollups.is_empty() and self.usage.recent:
+            rollups.rebuild(backend.iter_logs(), self._users)
+
+    def _index_user(self, username, user):
+        if user.get("role") == "student":
+            self._students_by_class[str(user.get("class", ""))].add(username)
+
+    def _unindex_user(self, username, user):
+        self._students_by_class[str(user.get("class", ""))].discard(username)
+
+    def _lock_for(self, username):
+        with self._users_lock:
+            return self._user_locks[username]
+
+    # ── Reads ────────────────────────────────────────────────
+    @property
+    def settings(self):
+        with self._settings_lock:
+            return dict(self._settings)
+
+    def get_setting(self, key, default=None):
+        with self._settings_lock:
+            return self._settings.get(key, default)
+
+    def get_user(self, username):
+        with self._users_lock:
+            user = self._users.get(username)
+        if user is None:
+            return None
+        return self._copy(username, user)
+
+    def _copy(self, username, user):
+        # Writers mutate user dicts in place under the user's lock
+        with self._lock_for(username):
+            return copy.deepcopy(user)
+
+    def has_user(self, username):
+        with self._users_lock:
+            return username in self._users
+
+    def users(self, role=None):
+        """Snapshot of {username: user}, optionally filtered by role."""
+        with self._users_lock:
+            items = list(self._users.items())
+        return {u: self._copy(u, d) for u, d in items if role is None or d.get("role") == role}
+
+    def query_students(self, search="", student_class=None, sort="name", descending=False,
+                       offset=0, limit=25, today=None):
+        """
+        One page of students for the dashboard table, plus the total match
+        count. The class index narrows the candidates before the name/username
+        search; only the requested page is copied out.
+        """
+        today = today or str(datetime.date.today())
+        with self._users_lock:
+            if student_class:
+                names = list(self._students_by_class.get(str(student_class), ()))
+            else:
+                names = [u for members in self._students_by_class.values() for u in members]
+            candidates = [(u, self._users[u]) for u in names if u in self._users]
+        needle = (search or "").strip().lower()
+        if needle:
+            candidates = [(u, d) for u, d in candidates
+                          if needle in u.lower() or needle in d.get("name", "").lower()]
+
+        def used(d):
+            return d.get("usage_today", 0) if d.get("last_active_date", "") == today else 0
+
+        sort_keys = {
+            "name": lambda item: (item[1].get("name", "").lower(), item[0]),
+            "username": lambda item: item[0],
+            "class": lambda item: (int(item[1]["class"]) if str(item[1].get("class", "")).isdigit() else 99, item[0]),
+            "usage_today": lambda item: (used(item[1]), item[0]),
+            "total_usage": lambda item: (item[1].get("total_usage", 0), item[0]),
+            "last_active": lambda item: (str(item[1].get("last_active", "")), item[0]),
+        }
+        candidates.sort(key=sort_keys[sort], reverse=descending)
+        page = [(u, self._copy(u, d)) for u, d in candidates[offset:offset + limit]]
+        return page, len(candidates)
+
+    def usage_today(self, username, today=None):
+        today = today or str(datetime.date.today())
+        if hasattr(self.backend, "usage_today"):
+            # Shared backend: other replicas count for this student too
+            return self.backend.usage_today(username, today)
+        user = self.get_user(username) or {}
+        return user.get("usage_today", 0) if user.get("last_active_date", "") == today else 0
+
+    def tokens_today(self, username, today=None):
+        """Model tokens (prompt + completion) the user's answers used today."""
+        today = today or str(datetime.date.today())
+        if hasattr(self.backend, "tokens_today"):
+            return self.backend.tokens_today(username, today)
+        user = self.get_user(username) or {}
+        return user.get("tokens_today", 0) if user.get("last_active_date", "") == today else 0
+
+    def recent_logs(self, limit=20):
+        return self.usage.recent_entries(limit)
+
+    def count_logs(self, date):
+        return self.usage.questions_on(date)
+
+    def active_students(self, date):
+        return self.usage.active_on(date)
+
+    def student_count(self):
+        return self.usage.student_count
+
+    def student_questions_total(self):
+        return self.usage.student_total
+
+    # ── Writes ───────────────────────────────────────────────
+    def update_settings(self, **changes):
+        with self._settings_lock:
+            self._settings.update(changes)
+            self.backend.save_settings(self._settings)
+            return dict(self._settings)
+
+    def add_user(self, username, user):
+        """Create a user; returns False if the username is taken."""
+        with self._users_lock:
+            if username in self._users:
+                return False
+            self._users[username] = dict(user)
+            self._index_user(username, user)
+        with self._lock_for(username):
+            self.backend.save_user(username, self._users[username])
+        if user.get("role") == "student":
+            self.usage.student_added()
+        return True
+
+    def add_users(self, users):
+        """
+        Create many users in one backend transaction. Usernames taken in the
+        meantime are skipped and returned.
+        """
+        with self._users_lock:
+            taken = [u for u in users if u in self._users]
+            fresh = {u: dict(d) for u, d in users.items() if u not in self._users}
+            self._users.update(fresh)
+            for username, user in fresh.items():
+                self._index_user(username, user)
+        self.backend.save_users(fresh)
+        students = sum(1 for d in fresh.values() if d.get("role") == "student")
+        if students:
+            self.usage.student_added(students)
+        return taken
+
+    def update_user(self, username, **changes):
+        with self._lock_for(username):
+            with self._users_lock:
+                user = self._users.get(username)
+            if user is None:
+                return None
+            with self._users_lock:
+                self._unindex_user(username, user)
+                user.update(changes)
+                self._index_user(username, user)
+            self.backend.save_user(username, user)
+            return copy.deepcopy(user)
+
+    def record_interaction(self, username, query_type, subject="", detected_subject=None, usage=None):
+        """
+        Log one question and bump the user's counters atomically: the daily
+        rollover, both increments and the persisted row happen under the
+        user's lock. The dashboard aggregates are updated in the same step.
+        `usage` ({prompt_tokens, completion_tokens, latency_ms, ...}) is
+        stored on the log entry and adds to the user's token counters.
+        """
+        now = datetime.datetime.now()
+        today = str(now.date())
+        entry = {
+            "user": username,
+            "type": query_type,
+            "subject": subject,
+            "timestamp": str(now),
+            "date": today,
+            "detected_subject": detected_subject
+        }
+        if usage:
+            entry.update(usage)
+        with self._lock_for(username):
+            with self._users_lock:
+                user = self._users.get(username)
+            if user is not None:
+                entry["class"] = user.get("class", "")
+                apply_interaction(user, entry)
+            self.backend.record_interaction(entry, username, user)
+            self.usage.record(entry, user)
+        if self.rollups is not None:
+            self.rollups.record(entry)
+        return entry
+
+    # ── Other replicas ───────────────────────────────────────
+    def sync(self):
+        """
+        Apply writes made by other app replicas sharing the backend (see
+        storage.RedisStorage); a no-op for local backends. Returns the
+        number of changes applied.
+        """
+        changes = getattr(self.backend, "changes", None)
+        if changes is None:
+            return 0
+        batch = changes()
+        if batch is None:
+            self._reload()
+            return -1
+        for kind, data in batch:
+            if kind == "settings":
+                with self._settings_lock:
+                    self._settings = dict(data["settings"])
+                continue
+            user = data.get("user")
+            if user is not None:
+                self._replace_user(data["name"], user)
+            if kind == "log":
+                self.usage.record(data["entry"], user)
+                if self.rollups is not None:
+                    self.rollups.record(data["entry"])
+        return len(batch)
+
+    def _replace_user(self, username, user):
+        user = dict(user)
+        with self._lock_for(username):
+            with self._users_lock:
+                old = self._users.get(username)
+                if old is not None:
+                    self._unindex_user(username, old)
+                    # Feed order can trail the shared counters; they only grow
+                    # within a day, so never step back to an older count
+                    for total in ("total_usage", "total_tokens"):
+                        user[total] = max(user.get(total, 0), old.get(total, 0))
+                    for daily in ("usage_today", "tokens_today"):
+                        if old.get("last_active_date", "") == user.get("last_active_date", ""):
+                            user[daily] = max(user.get(daily, 0), old.get(daily, 0))
+                        elif old.get("last_active_date", "") > user.get("last_active_date", ""):
+                            user[daily] = old.get(daily, 0)
+                    if old.get("last_active_date", "") > user.get("last_active_date", ""):
+                        user["last_active_date"] = old["last_active_date"]
+                self._users[username] = user
+                self._index_user(username, user)
+        if old is None and user.get("role") == "student":
+            self.usage.student_added()
+
+    def _reload(self):
+        users = self.backend.load_users()
+        usage = UsageAggregates()
+        usage.load(self.backend.aggregate_logs(), users, self.backend.recent_logs(usage.recent.maxlen))
+        with self._users_lock:
+            self._users = users
+            self._students_by_class = defaultdict(set)
+            for username, user in users.items():
+                self._index_user(username, user)
+        with self._settings_lock:
+            self._settings = self.backend.load_settings()
+        self.usage = usage
@@ -0,0 +1,205 @@
+"""
+Optional server-side speech-to-text for browsers without SpeechRecognition.
+
+The voice component records 16 kHz mono 16-bit PCM and uploads it in short
+chunks. While a student speaks, the audio so far is transcribed for partial
+results; the final chunk gets a full transcription. Engines run on CPU in a
+small worker pool shared by all sessions:
+
+    STT_ENGINE=faster-whisper  STT_MODEL=base     (model size or path)
+    STT_ENGINE=vosk            STT_MODEL=/models/vosk-model-small-en-in-0.4
+
+Both packages are optional; with STT_ENGINE unset (the default) only the
+browser's own recognition is used.
+
+Finished utterances are transcribed before partials. A newer partial from the
+same speaker replaces one that is still waiting. Workers take up to
+`batch_size` jobs at a time, so an engine with real batch inference can
+transcribe concurrent speakers together.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+
+SAMPLE_RATE = 16000
+WHISPER_LANGS = {"en-IN": "en", "te-IN": "te", "hi-IN": "hi", "ur-PK": "ur"}
+
+
+class STTBusy(Exception):
+    pass
+
+
+# ═══════════════════════════════════════════════════════════════
+# ENGINES
+# ═══════════════════════════════════════════════════════════════
+class STTEngine:
+    name = "base"
+
+    def transcribe(self, pcm, lang, partial=False):
+        """Text for 16 kHz mono int16 little-endian PCM bytes."""
+        raise NotImplementedError
+
+    def transcribe_batch(self, items):
+        """[(pcm, lang, partial)] -> [text]; override for true batched inference."""
+        return [self.transcribe(pcm, lang, partial) for pcm, lang, partial in items]
+
+
+class FasterWhisperEngine(STTEngine):
+    name = "faster-whisper"
+
+    def __init__(self, model="base", workers=2, cpu_threads=0):
+        from faster_whisper import WhisperModel  # optional dependency
+        import numpy
+        self._np = numpy
+        self.model = WhisperModel(model, device="cpu", compute_type="int8",
+                                  cpu_threads=cpu_threads, num_workers=workers)
+
+    def transcribe(self, pcm, lang, partial=False):
+        audio = self._np.frombuffer(pcm, dtype=self._np.int16).astype(self._np.float32) / 32768.0
+        segments, _ = self.model.transcribe(
+            audio, language=WHISPER_LANGS.get(lang, lang.split("-")[0]),
+            beam_size=1 if partial else 5, vad_filter=not partial,
+            condition_on_previous_text=False)
+        return " ".join(s.text.strip() for s in segments).strip()
+
+
+class VoskEngine(STTEngine):
+    name = "vosk"
+
+    def __init__(self, model_path):
+        from vosk import Model, SetLogLevel  # optional dependency
+        SetLogLevel(-1)
+        self.model = Model(model_path)
+
+    def transcribe(self, pcm, lang, partial=False):
+        from vosk import KaldiRecognizer
+        # One recognizer per call: they are cheap and not thread-safe
+        rec = KaldiRecognizer(self.model, SAMPLE_RATE)
+        rec.AcceptWaveform(pcm)
+        return json.loads(rec.FinalResult()).get("text", "")
+
+
+def get_stt_engine():
+    """Engine selected by STT_ENGINE, or None when server-side STT is off."""
+    kind = os.getenv("STT_ENGINE", "").lower()
+    if not kind or kind == "none":
+        return None
+    if kind == "faster-whisper":
+        return FasterWhisperEngine(os.getenv("STT_MODEL", "base"),
+                                   workers=int(os.getenv("STT_WORKERS", 2)))
+    if kind == "vosk":
+        return VoskEngine(os.environ["STT_MODEL"])
+    raise ValueError(f"Unknown STT_ENGINE: {kind}")
+
+
+# ═══════════════════════════════════════════════════════════════
+# WORKER POOL
+# ═══════════════════════════════════════════════════════════════
+class _Request:
+    def __init__(self, key, pcm, lang, partial):
+        self.key = key
+        self.pcm = pcm
+        self.lang = lang
+        self.partial = partial
+        self.text = None
+        self.error = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+
+class TranscriptionService:
+    def __init__(self, engine, workers=2, batch_size=4, batch_wait=0.05, max_queue=200):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_queue = max_queue
+        self._finals = deque()
+        self._partials = {}            # speaker key -> waiting partial request
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"stt-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key, pcm, lang, partial=False):
+        """Queue a transcription and return its request without waiting; see wait()."""
+        req = _Request(key, bytes(pcm), lang, partial)
+        with self._cond:
+            if len(self._finals) + len(self._partials) >= self.max_queue:
+                raise STTBusy()
+            if partial:
+                older = self._partials.get(key)
+                if older is not None:
+                    older.cancelled = True
+                    older.done.set()
+                self._partials[key] = req
+            else:
+                older = self._partials.pop(key, None)
+                if older is not None:
+                    older.cancelled = True
+                    older.done.set()
+                self._finals.append(req)
+            self._cond.notify()
+        return req
+
+    def wait(self, req, timeout=None):
+        """
+        Text of a submitted request. Returns None for a partial that was
+        superseded by a newer one, a cancelled request, or one that did not
+        finish within `timeout` (0 just checks).
+        """
+        if not req.done.wait(timeout) or req.cancelled:
+            return None
+        if req.error is not None:
+            raise req.error
+        return req.text
+
+    def cancel(self, req):
+        with self._cond:
+            if self._partials.get(req.key) is req:
+                del self._partials[req.key]
+            req.cancelled = True
+            req.done.set()
+
+    def transcribe(self, key, pcm, lang, partial=False, timeout=None):
+        """Transcribe on the pool and wait; see wait()."""
+        return self.wait(self.submit(key, pcm, lang, partial), timeout)
+
+    def _take_batch(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            if self._finals:
+                req = self._finals.popleft()
+                if not req.cancelled:    # given up on by a timed-out caller
+                    batch.append(req)
+            elif self._partials:
+                batch.append(self._partials.pop(next(iter(self._partials))))
+            else:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._finals and not self._partials:
+                    self._cond.wait()
+            # Give concurrent speakers a moment to join the batch
+            if self.batch_size > 1:
+                time.sleep(self.batch_wait)
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                texts = self.engine.transcribe_batch([(r.pcm, r.lang, r.partial) for r in batch])
+                for req, text in zip(batch, texts):
+                    req.text = text
+            except Exception as e:
+                for req in batch:
+                    req.error = e
+            for req in batch:
+                req.done.set()
@@ -0,0 +1,117 @@
+"""
+Several schools served from one process.
+
+With TENANTS_DIR set, each school is a directory TENANTS_DIR/<id>/ holding
+its own database (or JSON data and logs) and analytics.db. The school for a
+request comes from its subdomain (greenfield.tutor.example.org, with
+TENANT_BASE_DOMAIN=tutor.example.org) or from ?school=greenfield. A school's
+store is opened on first use and then shared by all of its sessions.
+Everything else is shared by all schools: the provider and LLM queue, the
+answer cache (keyed by school), the prompt fragments, the password pool,
+the speech services and the static assets.
+
+Without TENANTS_DIR the app serves a single school from the usual
+DB_FILE / DATA_FILE paths, as before.
+
+    python tenants.py add greenfield "Greenfield High School"
+    python tenants.py list
+"""
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+
+from analytics import ANALYTICS_DB, UsageRollups
+from storage import open_storage
+from store import SchoolStore
+
+TENANT_RE = re.compile(r"^[a-z0-9][a-z0-9-]{0,39}$")
+
+
+class UnknownTenant(Exception):
+    pass
+
+
+def open_school(directory=None):
+    """SchoolStore for one school; `directory` None means the single-school paths."""
+    if directory is None:
+        return SchoolStore(open_storage(), UsageRollups(os.getenv("ANALYTICS_DB", ANALYTICS_DB)))
+    # With SHARED_STATE_URL the school's data lives under its id on the
+    # shared server; the directory keeps this replica's analytics.db
+    return SchoolStore(open_storage(root=directory, namespace=Path(directory).name),
+                       UsageRollups(Path(directory) / ANALYTICS_DB))
+
+
+def tenant_from_request(host="", params=None, base_domain=None):
+    """School id from ?school=… or the subdomain of `host`, or None."""
+    candidate = ((params or {}).get("school") or "").strip().lower()
+    if not candidate and host and base_domain:
+        host = host.split(":")[0].lower()
+        suffix = "." + base_domain.lower().strip(".")
+        if host.endswith(suffix):
+            candidate = host[:-len(suffix)]
+    return candidate if TENANT_RE.match(candidate) else None
+
+
+class TenantRegistry:
+    def __init__(self, root=None):
+        self.root = Path(root) if root else None
+        self._stores = {}
+        self._lock = threading.Lock()
+        self._opening = {}          # tenant -> lock; opening one school doesn't block others
+
+    @property
+    def multi(self):
+        return self.root is not None
+
+    def exists(self, tenant):
+        if not self.multi:
+            return tenant == ""
+        return bool(TENANT_RE.match(tenant or "")) and (self.root / tenant).is_dir()
+
+    def tenants(self):
+        if not self.multi:
+            return [""]
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir() and TENANT_RE.match(p.name))
+
+    def store(self, tenant):
+        """The school's SchoolStore, opened on first use."""
+        store = self._stores.get(tenant)
+        if store is not None:
+            return store
+        if not self.exists(tenant):
+            raise UnknownTenant(tenant)
+        with self._lock:
+            opening = self._opening.setdefault(tenant, threading.Lock())
+        with opening:
+            store = self._stores.get(tenant)
+            if store is None:
+                store = open_school(self.root / tenant if self.multi else None)
+                self._stores[tenant] = store
+        return store
+
+    def create(self, tenant, school_name):
+        if not self.multi:
+            raise ValueError("TENANTS_DIR is not set")
+        if not TENANT_RE.match(tenant):
+            raise ValueError("School id must be lowercase letters, digits and dashes")
+        (self.root / tenant).mkdir(parents=True, exist_ok=False)
+        store = self.store(tenant)
+        store.update_settings(school_name=school_name)
+        return store
+
+    def open_count(self):
+        return len(self._stores)
+
+
+if __name__ == "__main__":
+    registry = TenantRegistry(os.getenv("TENANTS_DIR", "tenants"))
+    if len(sys.argv) == 4 and sys.argv[1] == "add":
+        registry.create(sys.argv[2], sys.argv[3])
+        print(f"Created {sys.argv[2]} in {registry.root}; sign in as admin / admin123 and change the password")
+    elif len(sys.argv) == 2 and sys.argv[1] == "list":
+        for tenant in registry.tenants():
+            print(tenant)
+    else:
+        print('usage: python tenants.py add <id> "School Name" | list')
@@ -0,0 +1,268 @@
+"""
+Optional server-side text-to-speech with an on-disk audio cache.
+
+Devices often lack Telugu or Urdu voices, so answers can instead be
+synthesized on the server, one sentence per clip, by a local CPU engine:
+
+    TTS_ENGINE=espeak   eSpeak NG (covers English, Telugu, Hindi, Urdu)
+    TTS_ENGINE=piper    Piper neural voices; TTS_PIPER_VOICES is a JSON map
+                        like {"te-IN": "/voices/te_IN-venkatesh-medium.onnx"}
+
+Clips are compressed with ffmpeg when it is installed (TTS_AUDIO_FORMAT=mp3
+or ogg) and stored content-addressed by sha256 of (engine, voice, language,
+text), so a repeated explanation or a cached answer plays from disk without
+re-synthesis. The cache is bounded by size and evicts least recently used
+clips.
+"""
+import os
+import re
+import io
+import json
+import time
+import wave
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, Future
+
+AUDIO_FORMATS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3"],
+    "ogg": ["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"],
+}
+ESPEAK_LANGS = {"en-IN": "en", "te-IN": "te", "hi-IN": "hi", "ur-PK": "ur"}
+
+# Same rules as takeSentences() in voice_component/voice.js
+SENTENCE_END = re.compile(r"""[.!?।]+["')\]]*\s+|\n+""")
+MIN_SENTENCE = 12
+MAX_CHUNK = 220
+
+
+# ═══════════════════════════════════════════════════════════════
+# SENTENCES
+# ═══════════════════════════════════════════════════════════════
+def clean_speech(text):
+    # Markdown symbols would be read out literally
+    text = re.sub(r"[#*_>`|]", " ", text)
+    text = re.sub(r"\s*\n\s*", "\n", text)
+    return re.sub(r"[ \t]+", " ", text)
+
+
+def _split_long(sentence):
+    out = []
+    while len(sentence) > MAX_CHUNK:
+        cut = sentence.rfind(", ", 0, MAX_CHUNK)
+        if cut < MAX_CHUNK // 2:
+            cut = sentence.rfind(" ", 0, MAX_CHUNK)
+        if cut <= 0:
+            cut = MAX_CHUNK
+        out.append(sentence[:cut + 1].strip())
+        sentence = sentence[cut + 1:]
+    if sentence.strip():
+        out.append(sentence.strip())
+    return out
+
+
+def take_sentences(text, final=False):
+    """(complete sentences at the start of cleaned `text`, characters consumed)."""
+    out, start = [], 0
+    for m in SENTENCE_END.finditer(text):
+        sentence = text[start:m.end()].strip()
+        if len(sentence) >= MIN_SENTENCE:
+            out.extend(_split_long(sentence))
+            start = m.end()
+    if final and text[start:].strip():
+        out.extend(_split_long(text[start:]))
+        start = len(text)
+    return out, start
+
+
+# ═══════════════════════════════════════════════════════════════
+# ENGINES
+# ═══════════════════════════════════════════════════════════════
+class TTSEngine:
+    name = "base"
+
+    def voice_id(self, lang, gender):
+        """Stable name of the voice used, part of the cache key."""
+        return f"{lang}-{gender}"
+
+    def synthesize(self, text, lang, gender):
+        """WAV bytes for one sentence."""
+        raise NotImplementedError
+
+
+class EspeakEngine(TTSEngine):
+    name = "espeak"
+
+    def __init__(self, binary=None, rate=150):
+        self.binary = binary or shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.binary:
+            raise RuntimeError("TTS_ENGINE=espeak needs espeak-ng on the PATH")
+        self.rate = rate
+
+    def voice_id(self, lang, gender):
+        return f"{ESPEAK_LANGS.get(lang, 'en')}+{'f3' if gender == 'Female' else 'm3'}"
+
+    def synthesize(self, text, lang, gender):
+        return subprocess.run(
+            [self.binary, "--stdout", "-v", self.voice_id(lang, gender), "-s", str(self.rate), text],
+            check=True, capture_output=True, timeout=30).stdout
+
+
+class PiperEngine(TTSEngine):
+    name = "piper"
+
+    def __init__(self, voices):
+        from piper import PiperVoice  # optional dependency
+        self._voices = {lang: PiperVoice.load(path) for lang, path in voices.items()}
+        self._paths = voices
+
+    def voice_id(self, lang, gender):
+        # Piper models have a single speaker; gender is fixed by the model file
+        return os.path.basename(self._paths.get(lang) or next(iter(self._paths.values())))
+
+    def synthesize(self, text, lang, gender):
+        voice = self._voices.get(lang) or next(iter(self._voices.values()))
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            if hasattr(voice, "synthesize_wav"):
+                voice.synthesize_wav(text, wav)
+            else:
+                voice.synthesize(text, wav)
+        return buf.getvalue()
+
+
+def get_tts_engine():
+    """Engine selected by TTS_ENGINE, or None when answers use the device voice."""
+    kind = os.getenv("TTS_ENGINE", "").lower()
+    if not kind or kind == "none":
+        return None
+    if kind == "espeak":
+        return EspeakEngine()
+    if kind == "piper":
+        return PiperEngine(json.loads(os.environ["TTS_PIPER_VOICES"]))
+    raise ValueError(f"Unknown TTS_ENGINE: {kind}")
+
+
+def encode_audio(wav, fmt="mp3"):
+    """(extension, bytes): compressed with ffmpeg if available, else the WAV as is."""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg or fmt not in AUDIO_FORMATS:
+        return "wav", wav
+    out = subprocess.run(
+        [ffmpeg, "-loglevel", "error", "-i", "pipe:0", "-ac", "1", *AUDIO_FORMATS[fmt], "pipe:1"],
+        input=wav, check=True, capture_output=True, timeout=30).stdout
+    return fmt, out
+
+
+# ═══════════════════════════════════════════════════════════════
+# CACHE
+# ═══════════════════════════════════════════════════════════════
+class AudioCache:
+    """
+    Content-addressed clips under `directory` (ab/abcdef….mp3), evicting the
+    least recently used once the total passes `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = {}          # relative path -> (last use, size)
+        self._total = 0
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                rel = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                self._files[rel] = (st.st_mtime, st.st_size)
+                self._total += st.st_size
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def lookup(self, key):
+        """Relative path of a cached clip, or None."""
+        with self._lock:
+            for rel in (f"{key[:2]}/{key}.{ext}" for ext in ("mp3", "ogg", "wav")):
+                if rel in self._files:
+                    self._files[rel] = (time.time(), self._files[rel][1])
+                    return rel
+        return None
+
+    def put(self, key, ext, data):
+        rel = f"{key[:2]}/{key}.{ext}"
+        path = os.path.join(self.directory, key[:2], f"{key}.{ext}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            old = self._files.get(rel)
+            self._total += len(data) - (old[1] if old else 0)
+            self._files[rel] = (time.time(), len(data))
+            self._evict()
+        return rel
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        for rel, (_, size) in sorted(self._files.items(), key=lambda kv: kv[1][0]):
+            if self._total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self.directory, rel))
+            except FileNotFoundError:
+                pass
+            del self._files[rel]
+            self._total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"clips": len(self._files), "bytes": self._total}
+
+
+# ═══════════════════════════════════════════════════════════════
+# SYNTHESIZER
+# ═══════════════════════════════════════════════════════════════
+class SpeechSynthesizer:
+    """Sentence → cached clip path, synthesized on a small thread pool."""
+
+    def __init__(self, engine, cache, workers=2, audio_format="mp3"):
+        self.engine = engine
+        self.cache = cache
+        self.audio_format = audio_format
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, text, lang, gender):
+        """Future of the clip's path relative to the cache directory."""
+        key = AudioCache.key(self.engine.name, self.engine.voice_id(lang, gender), lang, text)
+        rel = self.cache.lookup(key)
+        if rel is not None:
+            done = Future()
+            done.set_result(rel)
+            return done
+        with self._lock:
+            # Two students getting the same cached answer share one synthesis
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._pool.submit(self._synthesize, key, text, lang, gender)
+                self._inflight[key] = future
+            return future
+
+    def _synthesize(self, key, text, lang, gender):
+        try:
+            ext, data = encode_audio(self.engine.synthesize(text, lang, gender), self.audio_format)
+            return self.cache.put(key, ext, data)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
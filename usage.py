@@ -0,0 +1,97 @@
+"""
+Incremental usage counters for the teacher dashboard.
+
+Counts are kept per day, per (day, class) and per (day, subject), along with
+the set of students active each day and a short list of recent entries.
+They are built once from the backend when the store loads and then updated
+on every logged interaction, so dashboard numbers never require a scan of
+the interaction history. Only the last keep_active_days days are kept;
+longer ranges come from the analytics rollups.
+"""
+import threading
+from collections import Counter, defaultdict, deque
+
+GENERAL = "General"
+
+
+class UsageAggregates:
+    def __init__(self, keep_active_days=60, recent_size=50):
+        self.keep_active_days = keep_active_days
+        self.by_day = Counter()
+        self.by_day_class = defaultdict(Counter)     # date -> class -> count
+        self.by_day_subject = defaultdict(Counter)   # date -> subject -> count
+        self.active_by_day = {}          # date -> set of student usernames
+        self.recent = deque(maxlen=recent_size)
+        self.student_total = 0           # sum of total_usage over students
+        self.student_count = 0
+        self._lock = threading.Lock()
+
+    def load(self, grouped_rows, users, recent_logs):
+        """
+        Seed from backend.aggregate_logs() rows (date, user, class, subject,
+        count), the user table and the newest-first recent log entries.
+        """
+        students = {u for u, d in users.items() if d.get("role") == "student"}
+        with self._lock:
+            self.student_count = len(students)
+            self.student_total = sum(users[u].get("total_usage", 0) for u in students)
+            for date, user, cls, subject, count in grouped_rows:
+                cls = cls or users.get(user, {}).get("class", "")
+                self._add(date, user, user in students, cls, subject, count)
+            self.recent.extend(reversed(recent_logs[:self.recent.maxlen]))
+            self._trim()
+
+    def _add(self, date, user, is_student, cls, subject, count):
+        self.by_day[date] += count
+        self.by_day_class[date][str(cls)] += count
+        self.by_day_subject[date][subject or GENERAL] += count
+        if is_student:
+            self.active_by_day.setdefault(date, set()).add(user)
+
+    def _trim(self):
+        # Per-day counters older than the window are dropped, so memory stays
+        # bounded for the life of the process
+        while len(self.active_by_day) > self.keep_active_days:
+            del self.active_by_day[min(self.active_by_day)]
+        if len(self.by_day) > self.keep_active_days:
+            for date in sorted(self.by_day)[:-self.keep_active_days]:
+                del self.by_day[date]
+                self.by_day_class.pop(date, None)
+                self.by_day_subject.pop(date, None)
+
+    def record(self, entry, user):
+        """Count one logged interaction; `user` is the user record after the update."""
+        is_student = bool(user) and user.get("role") == "student"
+        with self._lock:
+            self._add(entry["date"], entry["user"], is_student, entry.get("class", ""),
+                      entry.get("detected_subject"), 1)
+            if is_student:
+                self.student_total += 1
+            self.recent.append(entry)
+            if len(self.by_day) > self.keep_active_days or len(self.active_by_day) > self.keep_active_days:
+                self._trim()
+
+    def student_added(self, count=1):
+        with self._lock:
+            self.student_count += count
+
+    # ── Queries (all O(1) in history size) ───────────────────
+    def questions_on(self, date):
+        with self._lock:
+            return self.by_day[date]
+
+    def active_on(self, date):
+        with self._lock:
+            return len(self.active_by_day.get(date, ()))
+
+    def recent_entries(self, limit=20):
+        with self._lock:
+            return list(self.recent)[-limit:][::-1]
+
+    def classes_on(self, date):
+        with self._lock:
+            return dict(self.by_day_class.get(date, {}))
+
+    def subjects_on(self, date):
+        with self._lock:
+            return dict(self.by_day_subject.get(date, {}))
@@ -0,0 +1,602 @@
+// Voice widget: speech recognition (browser or server) in, sentence-by-sentence
+// speech out.
+//
+// Loaded once as a Streamlit custom component. Reruns only deliver new args
+// (language, voice, text to speak) through "streamlit:render" messages, so
+// the iframe, the recognizer and any speech in progress survive them.
+// Transcripts go back to Python with "streamlit:setComponentValue".
+
+// ── Streamlit component protocol ─────────────────────────────
+function toStreamlit(type, data) {
+  var msg = Object.assign({ isStreamlitMessage: true, type: type }, data || {});
+  window.parent.postMessage(msg, '*');
+}
+
+function setHeight() {
+  toStreamlit('streamlit:setFrameHeight', { height: document.body.scrollHeight });
+}
+
+function sendValue(value) {
+  toStreamlit('streamlit:setComponentValue', { value: value, dataType: 'json' });
+}
+
+// ── Variables ────────────────────────────────────────────────
+var LANG = 'en-IN', GENDER = 'Female', PITCH = 1.3, COUNTDOWN = 9;
+var R=null, IL=false, FT='', cdTimer=null;
+var mb   = document.getElementById('mb');
+var sm   = document.getElementById('sm');
+var tb   = document.getElementById('tb');
+var sb   = document.getElementById('sb');
+var cb   = document.getElementById('cb');
+var hm   = document.getElementById('hm');
+var cdW  = document.getElementById('cdWrap');
+var cdN  = document.getElementById('cdNum');
+var cdF  = document.getElementById('cdFill');
+var spkB = document.getElementById('spkBars');
+var CIRCUMFERENCE = 163; // 2 * pi * 26
+
+mb.onclick = tog;
+sb.onclick = sendNow;
+cb.onclick = cancelCountdown;
+
+function readyText() { return '✅ Ready · ' + LANG + ' · ' + GENDER + ' voice'; }
+
+var SR = window.SpeechRecognition || window.webkitSpeechRecognition;
+var SERVER_STT = false, STT_MODE = 'auto';   // from Python (STT_ENGINE / STT_MODE)
+
+// Browser recognition when available; otherwise (or with STT_MODE=server)
+// record audio and let the server transcribe it.
+function useServer() { return SERVER_STT && (STT_MODE === 'server' || !SR); }
+
+function checkSupport() {
+  var ok = SR || useServer();
+  mb.disabled = !ok; mb.style.opacity = ok ? '' : '0.5';
+  if (!ok) {
+    sm.className='st err';
+    sm.innerText='⚠️ Please use Google Chrome or Samsung Internet browser';
+  } else if (sm.className === 'st err' && sm.innerText.indexOf('Chrome or Samsung') >= 0) {
+    sm.className='st'; sm.innerText='Press button · speak your question clearly';
+  }
+}
+checkSupport();
+
+// ── Mic toggle ───────────────────────────────────────────────
+function tog() {
+  if (IL) { if (srv) { stopServerMic(); } else { stopMic(); } }
+  else if (useServer()) { startServerMic(); }
+  else { startMic(); }
+}
+
+function startMic() {
+  if (!SR) return;
+  cancelCountdown();
+  FT=''; tb.style.display='none'; tb.innerText='';
+  sb.style.display='none'; cb.style.display='none';
+
+  R = new SR();
+  R.lang=LANG; R.continuous=false;
+  R.interimResults=true; R.maxAlternatives=3;
+
+  R.onstart = function() {
+    IL=true;
+    mb.className='mbtn rec';
+    mb.innerHTML='<span class="dp"></span> Listening... (tap to stop)';
+    sm.className='st act'; sm.innerText='🎙️ Speak your question now...';
+    hm.innerText='Speak clearly · tap button to stop early';
+  };
+
+  R.onresult = function(e) {
+    var it=''; FT='';
+    for (var i=e.resultIndex; i<e.results.length; i++) {
+      var t=e.results[i][0].transcript;
+      if (e.results[i].isFinal) { FT+=t; } else { it+=t; }
+    }
+    var d = FT || it;
+    if (d) { tb.style.display='block'; tb.innerText=d; setHeight(); }
+    if (FT) {
+      sm.className='st ok';
+      sm.innerText='✅ Got it! Sending in ' + COUNTDOWN + ' seconds...';
+    } else {
+      sm.className='st act';
+      sm.innerText='🎙️ Hearing: ' + it;
+    }
+  };
+
+  R.onerror = function(e) {
+    IL=false; resetBtn();
+    var msgs = {
+      'no-speech'    : '🔇 No speech heard. Please try again.',
+      'audio-capture': '🎤 Microphone not found. Check device settings.',
+      'not-allowed'  : '🚫 Mic blocked! Click 🔒 in browser bar → Allow microphone.',
+      'network'      : '🌐 Network error. Check your internet connection.',
+      'aborted'      : '⏹ Stopped.'
+    };
+    sm.className='st err';
+    sm.innerText = msgs[e.error] || ('Error: ' + e.error);
+    hm.innerText = 'Tip: Use Chrome on Android for best results';
+  };
+
+  R.onend = function() {
+    IL=false; resetBtn();
+    if (FT && FT.trim().length > 0) {
+      startCountdown(); // ← countdown before sending
+    } else if (!tb.innerText) {
+      sm.className='st';
+      sm.innerText='Nothing heard. Please try again.';
+    }
+  };
+
+  try { R.start(); }
+  catch(ex) {
+    sm.className='st err';
+    sm.innerText='Mic error: ' + ex.message;
+    IL=false; resetBtn();
+  }
+}
+
+function stopMic() {
+  if (R) { try { R.stop(); } catch(e) {} }
+  IL=false; resetBtn();
+}
+
+function resetBtn() {
+  mb.className='mbtn'; mb.innerHTML='🎙️ Tap to Speak';
+}
+
+// ── Server-side recognition ──────────────────────────────────
+// 16 kHz mono int16 PCM is uploaded every CHUNK_MS as the component value.
+// Chunks stay queued until Python acknowledges them (args.stt.ack), since
+// Streamlit only reruns with the latest value and could skip one.
+var CHUNK_MS = 1500, SILENCE_MS = 1800, MAX_RECORD_MS = 30000, TARGET_RATE = 16000;
+var POLL_MS = 500;
+var srv = null, srvUtterance = null, srvFinalShown = null, srvPoll = null;
+
+function startServerMic() {
+  if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+    sm.className='st err'; sm.innerText='🎤 Microphone not available in this browser.';
+    return;
+  }
+  cancelCountdown();
+  FT=''; tb.style.display='none'; tb.innerText='';
+  sb.style.display='none'; cb.style.display='none';
+
+  navigator.mediaDevices.getUserMedia({ audio: { channelCount: 1, echoCancellation: true, noiseSuppression: true } })
+    .then(function(stream) {
+      var Ctx = window.AudioContext || window.webkitAudioContext;
+      var ctx = new Ctx();
+      var source = ctx.createMediaStreamSource(stream);
+      var node = ctx.createScriptProcessor(4096, 1, 1);
+      var now = Date.now();
+      srvUtterance = 'u' + now;
+      srv = { ctx: ctx, stream: stream, source: source, node: node, pending: [], unacked: [],
+              seq: 0, started: now, lastVoice: now, heard: false };
+      node.onaudioprocess = function(e) { collectAudio(e.inputBuffer.getChannelData(0), ctx.sampleRate); };
+      source.connect(node); node.connect(ctx.destination);
+      srv.timer = setInterval(function() { uploadAudio(false); }, CHUNK_MS);
+
+      IL=true;
+      mb.className='mbtn rec';
+      mb.innerHTML='<span class="dp"></span> Listening... (tap to stop)';
+      sm.className='st act'; sm.innerText='🎙️ Speak your question now...';
+      hm.innerText='Speak clearly · stops after a short pause';
+    })
+    .catch(function(err) {
+      sm.className='st err';
+      sm.innerText = err && err.name === 'NotAllowedError'
+        ? '🚫 Mic blocked! Click 🔒 in browser bar → Allow microphone.'
+        : '🎤 Microphone not found. Check device settings.';
+    });
+}
+
+function collectAudio(input, rate) {
+  if (!srv) return;
+  // Downsample by averaging to 16 kHz and convert to int16
+  var ratio = rate / TARGET_RATE, n = Math.floor(input.length / ratio);
+  var out = new Int16Array(n), energy = 0;
+  for (var i=0; i<n; i++) {
+    var a = Math.floor(i * ratio), b = Math.min(input.length, Math.floor((i + 1) * ratio)), sum = 0;
+    for (var j=a; j<b; j++) sum += input[j];
+    var v = sum / Math.max(1, b - a);
+    energy += v * v;
+    out[i] = Math.max(-1, Math.min(1, v)) * 32767;
+  }
+  srv.pending.push(out);
+  var now = Date.now();
+  if (Math.sqrt(energy / Math.max(1, n)) > 0.02) { srv.lastVoice = now; srv.heard = true; }
+  if ((srv.heard && now - srv.lastVoice > SILENCE_MS) || now - srv.started > MAX_RECORD_MS) stopServerMic();
+}
+
+function uploadAudio(final) {
+  if (!srv) return;
+  var total = 0, off = 0;
+  srv.pending.forEach(function(a) { total += a.length; });
+  if (total) {
+    var pcm = new Int16Array(total);
+    srv.pending.forEach(function(a) { pcm.set(a, off); off += a.length; });
+    srv.pending = [];
+    var bytes = new Uint8Array(pcm.buffer), bin = '';
+    for (var i=0; i<bytes.length; i+=0x8000) bin += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+    srv.unacked.push([srv.seq++, btoa(bin)]);
+  }
+  if (!total && !final) return;
+  sendValue({ kind: 'audio', utterance: srvUtterance, chunks: srv.unacked, final: final,
+              id: srvUtterance + '-' + srv.seq + (final ? 'f' : '') });
+}
+
+function stopServerMic() {
+  if (!srv) return;
+  var r = srv;
+  clearInterval(r.timer);
+  r.node.onaudioprocess = null;
+  try { r.source.disconnect(); r.node.disconnect(); } catch (e) {}
+  r.stream.getTracks().forEach(function(t) { t.stop(); });
+  r.ctx.close();
+  uploadAudio(true);
+  srv = null;
+  IL=false; resetBtn();
+  sm.className='st act'; sm.innerText='⏳ Transcribing...';
+}
+
+// Partial / final transcripts from Python for the current utterance
+function onServerTranscript(stt) {
+  if (!stt || stt.utterance !== srvUtterance) return;
+  if (srv) srv.unacked = srv.unacked.filter(function(c) { return c[0] > stt.ack; });
+  if (stt.error) {
+    sm.className='st err'; sm.innerText='⏳ ' + stt.error;
+    return;
+  }
+  if (stt.text) { tb.style.display='block'; tb.innerText=stt.text; setHeight(); }
+  if (stt.pending) {
+    // Python doesn't wait for the final transcript; ask again shortly
+    sm.className='st act'; sm.innerText='⏳ Transcribing...';
+    clearTimeout(srvPoll);
+    srvPoll = setTimeout(function() {
+      if (stt.utterance !== srvUtterance || srvFinalShown === srvUtterance) return;
+      sendValue({ kind: 'audio', utterance: srvUtterance, chunks: [], final: true,
+                  id: srvUtterance + '-poll' + Date.now() });
+    }, POLL_MS);
+  } else if (!stt.final) {
+    if (stt.text) { sm.className='st act'; sm.innerText='🎙️ Hearing: ' + stt.text; }
+  } else if (srvFinalShown !== srvUtterance) {
+    srvFinalShown = srvUtterance;
+    FT = stt.text || '';
+    if (FT.trim()) { startCountdown(); }
+    else { sm.className='st'; sm.innerText='Nothing heard. Please try again.'; }
+  }
+}
+
+// ── Countdown ────────────────────────────────────────────────
+function startCountdown() {
+  var remaining = COUNTDOWN;
+  cdW.className='countdown-wrap show';
+  sb.style.display='block';
+  cb.style.display='block';
+  cdN.innerText = remaining;
+  cdF.style.strokeDashoffset = 0;
+  sm.className='st ok';
+  sm.innerText='✅ Sending in ' + remaining + ' seconds... (or click Send Now)';
+  setHeight();
+
+  // Animate the ring
+  cdTimer = setInterval(function() {
+    remaining--;
+    cdN.innerText = remaining;
+    cdF.style.strokeDashoffset = CIRCUMFERENCE * (1 - remaining / COUNTDOWN);
+    sm.innerText='✅ Sending in ' + remaining + ' seconds... (or click Send Now)';
+
+    if (remaining <= 0) {
+      clearInterval(cdTimer); cdTimer=null;
+      sendNow();
+    }
+  }, 1000);
+}
+
+function cancelCountdown() {
+  if (cdTimer) { clearInterval(cdTimer); cdTimer=null; }
+  cdW.className='countdown-wrap';
+  sb.style.display='none';
+  cb.style.display='none';
+  sm.className='st';
+  sm.innerText='Press button · speak your question clearly';
+  hm.innerText=readyText();
+  setHeight();
+}
+
+// ── Send to Streamlit ────────────────────────────────────────
+function sendNow() {
+  if (cdTimer) { clearInterval(cdTimer); cdTimer=null; }
+  cdW.className='countdown-wrap';
+  var text = tb.innerText.trim();
+  if (!text) return;
+
+  // The id lets Python tell a new question from the value of the last rerun
+  sendValue({ kind: 'text', text: text, id: Date.now() });
+
+  sb.innerHTML='✅ Sent!'; sb.style.background='#10B981';
+  cb.style.display='none';
+  sm.className='st ok'; sm.innerText='✅ Sent! AI is thinking... response coming soon.';
+  hm.innerText='You can speak again after the answer appears';
+
+  setTimeout(function() {
+    tb.style.display='none'; tb.innerText='';
+    sb.style.display='none'; sb.innerHTML='✅ Send This Question'; sb.style.background='';
+    FT='';
+    sm.className='st'; sm.innerText='Press button · speak your question clearly';
+    hm.innerText=readyText();
+    setHeight();
+  }, 3000);
+}
+
+// ── TTS: sentence queue ──────────────────────────────────────
+// Answers are split into sentences and spoken as a queue of short
+// utterances, so speech starts with the first sentence of a streaming answer
+// and long answers are never cut off. Pause / skip / stop act on the queue.
+var AUTO = true;
+var ttsQueue = [], ttsCurrent = null, ttsPaused = false, ttsPoll = null;
+var answer = { id: null, consumed: 0, done: false };  // answer being spoken
+var MAX_CHUNK = 220;       // long utterances get cut off by some engines
+var MIN_SENTENCE = 12;     // "1." or "Q:" are merged into the next sentence
+var SENTENCE_END = /[.!?।]+["')\]]*\s+|\n+/g;
+var tc = document.getElementById('ttsCtl');
+var pb = document.getElementById('pauseBtn');
+document.getElementById('skipBtn').onclick = skipSentence;
+document.getElementById('stopBtn').onclick = stopSpeech;
+pb.onclick = togglePause;
+
+function cleanSpeech(text) {
+  // Markdown symbols would be read out literally
+  return text.replace(/[#*_>`|]/g, ' ').replace(/\s*\n\s*/g, '\n').replace(/[ \t]+/g, ' ');
+}
+
+function splitLong(sentence) {
+  var out = [];
+  while (sentence.length > MAX_CHUNK) {
+    var cut = sentence.lastIndexOf(', ', MAX_CHUNK);
+    if (cut < MAX_CHUNK / 2) cut = sentence.lastIndexOf(' ', MAX_CHUNK);
+    if (cut <= 0) cut = MAX_CHUNK;
+    out.push(sentence.slice(0, cut + 1).trim());
+    sentence = sentence.slice(cut + 1);
+  }
+  if (sentence.trim()) out.push(sentence.trim());
+  return out;
+}
+
+// Complete sentences at the start of `text`; the unfinished tail is left
+// for the next update unless the answer is final.
+function takeSentences(text, final) {
+  var out = [], start = 0, m;
+  SENTENCE_END.lastIndex = 0;
+  while ((m = SENTENCE_END.exec(text))) {
+    var end = m.index + m[0].length;
+    var sentence = text.slice(start, end).trim();
+    if (sentence.length >= MIN_SENTENCE) {
+      out = out.concat(splitLong(sentence));
+      start = end;
+    }
+  }
+  if (final && text.slice(start).trim()) {
+    out = out.concat(splitLong(text.slice(start)));
+    start = text.length;
+  }
+  return { sentences: out, consumed: start };
+}
+
+function startAnswer(id) {
+  id = String(id);
+  if (id !== answer.id) {
+    stopSpeech();
+    answer = { id: id, consumed: 0, done: false };
+  }
+  return !answer.done;
+}
+
+function enqueue(items, final) {
+  answer.done = final;
+  ttsQueue = ttsQueue.concat(items);
+  if (!ttsCurrent && !ttsPaused) speakNext();
+}
+
+// Called with the growing text of answer `id` (while streaming) and once
+// more with the final text.
+function feedAnswer(id, text, final) {
+  if (!startAnswer(id)) return;
+  var r = takeSentences(cleanSpeech(text).slice(answer.consumed), final);
+  answer.consumed += r.consumed;
+  enqueue(r.sentences, final);
+}
+
+// Server-side TTS: Python splits the answer and sends [{text, src}] for the
+// leading sentences whose audio is ready; the list only ever grows.
+function feedItems(id, items, final) {
+  if (!startAnswer(id)) return;
+  var fresh = items.slice(answer.consumed);
+  answer.consumed = items.length;
+  enqueue(fresh, final);
+}
+
+var pickedVoice = null, pickedFor = '';
+function pickVoice() {
+  if (pickedFor === LANG + GENDER) return pickedVoice;
+  var voices = window.speechSynthesis.getVoices();
+  if (!voices.length) return null;
+  var pick = null;
+  for (var i=0; i<voices.length; i++) {
+    var v = voices[i];
+    if (v.lang.indexOf(LANG.split('-')[0]) === 0) {
+      pick = v;
+      var n = v.name;
+      if (GENDER === 'Female') {
+        if (n.indexOf('Female')>=0 || n.indexOf('Heera')>=0 ||
+            n.indexOf('Raveena')>=0 || n.indexOf('Zira')>=0 ||
+            n.indexOf('Susan')>=0  || n.indexOf('female')>=0) { break; }
+      } else {
+        if (n.indexOf('Male')>=0 || n.indexOf('Hemant')>=0 ||
+            n.indexOf('David')>=0 || n.indexOf('Mark')>=0 ||
+            n.indexOf('male')>=0) { break; }
+      }
+    }
+  }
+  pickedVoice = pick; pickedFor = LANG + GENDER;
+  return pick;
+}
+if (window.speechSynthesis) {
+  window.speechSynthesis.onvoiceschanged = function() { pickedFor = ''; };
+}
+
+function speakNext() {
+  var item = ttsQueue.shift();
+  if (!item) { ttsCurrent = null; speechIdle(); return; }
+  if (item.src) { playClip(item); return; }
+  if (!window.speechSynthesis) { speakNext(); return; }
+
+  var u = new SpeechSynthesisUtterance(item.text || item);
+  u.lang   = LANG;
+  u.rate   = 0.88;
+  u.pitch  = PITCH;
+  u.volume = 1.0;
+  var voice = pickVoice();
+  if (voice) u.voice = voice;
+  // cancel() also fires these; only the current utterance advances the queue
+  u.onend = u.onerror = function() {
+    if (ttsCurrent === u) { ttsCurrent = null; speakNext(); }
+  };
+  ttsCurrent = u;
+  speechBusy();
+  window.speechSynthesis.speak(u);
+}
+
+// Server-synthesized clip (see tts.py); falls back to the device voice if
+// it can't be played
+function playClip(item) {
+  var a = new Audio(item.src);
+  a.onended = function() {
+    if (ttsCurrent === a) { ttsCurrent = null; speakNext(); }
+  };
+  a.onerror = function() {
+    if (ttsCurrent === a) { ttsCurrent = null; ttsQueue.unshift({ text: item.text }); speakNext(); }
+  };
+  ttsCurrent = a;
+  speechBusy();
+  a.play().catch(function() { if (a.onerror) a.onerror(); });
+}
+
+function isClip(x) { return x && typeof x.pause === 'function'; }
+
+function togglePause() {
+  if (!ttsCurrent) return;
+  ttsPaused = !ttsPaused;
+  if (isClip(ttsCurrent)) {
+    if (ttsPaused) { ttsCurrent.pause(); } else { ttsCurrent.play(); }
+  } else if (ttsPaused) { window.speechSynthesis.pause(); } else { window.speechSynthesis.resume(); }
+  pb.innerText = ttsPaused ? '▶ Resume' : '⏸ Pause';
+  spkB.className = ttsPaused ? 'speak-bars' : 'speak-bars show';
+  sm.innerText = ttsPaused ? '⏸ Paused' : '🔊 Speaking AI response...';
+}
+
+function haltCurrent() {
+  var cur = ttsCurrent;
+  ttsCurrent = null;
+  ttsPaused = false;
+  if (isClip(cur)) cur.pause();
+  if (window.speechSynthesis) {
+    window.speechSynthesis.resume();
+    window.speechSynthesis.cancel();
+  }
+}
+
+function skipSentence() {
+  haltCurrent();
+  speakNext();
+}
+
+function stopSpeech() {
+  ttsQueue = [];
+  haltCurrent();
+  answer.done = true;
+  speechIdle();
+}
+
+function speechBusy() {
+  spkB.className='speak-bars show';
+  tc.className='tts-ctl show';
+  pb.innerText='⏸ Pause';
+  sm.className='st spk';
+  sm.innerText='🔊 Speaking AI response...';
+  setHeight();
+}
+
+function speechIdle() {
+  spkB.className='speak-bars';
+  if (tc.className === 'tts-ctl') return;
+  tc.className='tts-ctl';
+  sm.className='st';
+  sm.innerText='Press button · speak your question clearly';
+  setHeight();
+}
+
+// While an answer streams, the chat page carries a hidden .tts-stream element
+// with the raw text so far (see wait_for_job). The iframe is same-origin, so
+// it can watch for it and start on the first complete sentence. If the parent
+// is not reachable the answer is spoken once it is complete.
+function watchStream() {
+  var doc;
+  try { doc = window.parent.document; if (!doc || !doc.body) return; }
+  catch (e) { return; }
+  var pending = false;
+  new MutationObserver(function() {
+    if (pending || !AUTO) return;
+    pending = true;
+    setTimeout(function() {
+      pending = false;
+      var nodes = doc.querySelectorAll('.tts-stream');
+      var el = nodes[nodes.length - 1];
+      if (!el) return;
+      var items = el.getAttribute('data-items');
+      if (items) { feedItems(el.getAttribute('data-tts-id'), JSON.parse(items), false); }
+      else { feedAnswer(el.getAttribute('data-tts-id'), el.getAttribute('data-text') || '', false); }
+    }, 120);
+  }).observe(doc.body, { childList: true, subtree: true, characterData: true });
+}
+watchStream();
+
+// ── Args from Python (every rerun) ───────────────────────────
+function onRender(args) {
+  var idle = hm.innerText === 'Chrome · Edge · Android Chrome' || hm.innerText === readyText();
+  LANG = args.lang || LANG;
+  GENDER = args.gender || GENDER;
+  PITCH = args.pitch || PITCH;
+  COUNTDOWN = args.countdown_seconds || COUNTDOWN;
+  AUTO = args.auto_speak !== false;
+  SERVER_STT = !!args.server_stt;
+  STT_MODE = args.stt_mode || STT_MODE;
+  checkSupport();
+  if (!cdTimer) cdN.innerText = COUNTDOWN;
+  if ((SR || useServer()) && idle) hm.innerText = readyText();
+  if (!AUTO && ttsCurrent) stopSpeech();
+  onServerTranscript(args.stt);
+
+  // The final text of a new answer: speak whatever the stream hasn't covered.
+  // The same args are re-sent on every rerun; feedAnswer ignores repeats.
+  if (AUTO && args.speak_items) {
+    feedItems(args.speak_id, args.speak_items, !args.speak_pending);
+    // Python doesn't wait for clips still being synthesized; ask again shortly
+    clearTimeout(ttsPoll);
+    if (args.speak_pending) {
+      ttsPoll = setTimeout(function() { sendValue({ kind: 'poll', id: Date.now() }); }, POLL_MS);
+    }
+  }
+  else if (AUTO && args.speak_text) { feedAnswer(args.speak_id, args.speak_text, true); }
+}
+
+window.addEventListener('message', function(e) {
+  if (!e.data) return;
+  if (e.data.type === 'streamlit:render') {
+    onRender(e.data.args || {});
+    setHeight();
+  } else if (e.data.type === 'stop_speak') {
+    // Allow parent page to trigger speech stop
+    stopSpeech();
+  }
+});
+
+toStreamlit('streamlit:componentReady', { apiVersion: 1 });